@@ -0,0 +1,208 @@
+import asyncio
+import os
+from typing import AsyncIterator, Iterable, List, Optional, Union
+
+from simulator_core import SimulatorEngine
+
+
+class _ReadProtocol(asyncio.Protocol):
+    def __init__(self, port: "AsyncVirtualCOMPort"):
+        self.port = port
+
+    def data_received(self, data: bytes):
+        self.port._process_incoming(data)
+
+    def connection_lost(self, exc):
+        self.port._on_connection_lost(exc)
+
+
+class _WriteProtocol(asyncio.BaseProtocol):
+    def __init__(self):
+        self._can_write = asyncio.Event()
+        self._can_write.set()
+
+    def pause_writing(self):
+        self._can_write.clear()
+
+    def resume_writing(self):
+        self._can_write.set()
+
+    def connection_lost(self, exc):
+        # Release any writer waiting on a transport that is gone
+        self._can_write.set()
+
+    async def drain(self):
+        await self._can_write.wait()
+
+
+class AsyncVirtualCOMPort:
+    """asyncio counterpart of VirtualCOMPort (POSIX serial devices and ptys).
+
+    Writes go into the transport's buffer and ``send_data`` only waits once
+    the buffer is above ``high_water`` bytes, so a slow port holds back its
+    own senders without stalling the event loop.  Received data is framed
+    into lines that are consumed with ``async for line in port``.
+    """
+
+    def __init__(self, port: str = None, baudrate: int = 115200,
+                 high_water: int = 64 * 1024, low_water: int = 16 * 1024):
+        self.port = port
+        self.baudrate = baudrate
+        self.high_water = high_water
+        self.low_water = low_water
+        self.running = False
+        self._read_transport = None
+        self._write_transport = None
+        self._write_protocol = None
+        self._rx_buffer = bytearray()
+        self._lines: "asyncio.Queue[Optional[str]]" = None
+
+        # Traffic counters
+        self.bytes_sent = 0
+        self.lines_sent = 0
+        self.bytes_received = 0
+        self.lines_received = 0
+        self.send_failures = 0
+
+    async def start(self, port: str = None) -> bool:
+        """Open the device and attach it to the running event loop"""
+        if port:
+            self.port = port
+        if not self.port:
+            return False
+        if os.name != "posix":
+            raise NotImplementedError("AsyncVirtualCOMPort requires a POSIX system")
+
+        try:
+            fd = os.open(self.port, os.O_RDWR | os.O_NOCTTY | os.O_NONBLOCK)
+        except OSError as e:
+            print(f"Failed to open serial port {self.port}: {e}")
+            return False
+        self._configure(fd)
+        return await self._attach(fd)
+
+    async def start_fd(self, fd: int) -> bool:
+        """Attach to an already open file descriptor (e.g. one end of a pty)"""
+        return await self._attach(os.dup(fd))
+
+    async def stop(self):
+        """Close the port after flushing buffered writes"""
+        self.running = False
+        if self._write_transport is not None:
+            self._write_transport.close()
+            self._write_transport = None
+        if self._read_transport is not None:
+            self._read_transport.close()
+            self._read_transport = None
+        if self._lines is not None:
+            self._lines.put_nowait(None)
+        # Let the transports run their close callbacks
+        await asyncio.sleep(0)
+
+    async def send_data(self, data: Union[str, bytes]) -> bool:
+        """Queue data for sending, waiting only while the write buffer is full
+        
+        Text is sent as a newline-terminated line; bytes are written verbatim.
+        """
+        if not self.running or self._write_transport is None:
+            return False
+        try:
+            if isinstance(data, str):
+                payload = data.encode('utf-8')
+                if not payload.endswith(b'\n'):
+                    payload += b'\n'
+            else:
+                payload = bytes(data)
+            # Wait before writing so concurrent senders queue up behind a full
+            # buffer instead of all piling their payloads into it
+            await self._write_protocol.drain()
+            if self._write_transport is None:
+                return False
+            self._write_transport.write(payload)
+            self.bytes_sent += len(payload)
+            self.lines_sent += 1
+            return True
+        except Exception as e:
+            self.send_failures += 1
+            print(f"Failed to send data: {e}")
+            return False
+
+    @property
+    def write_buffer_size(self) -> int:
+        return self._write_transport.get_write_buffer_size() if self._write_transport else 0
+
+    async def readline(self) -> Optional[str]:
+        """Return the next received line, or None once the port is closed"""
+        return await self._lines.get()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iter_lines()
+
+    async def _iter_lines(self):
+        while True:
+            line = await self._lines.get()
+            if line is None:
+                return
+            yield line
+
+    async def _attach(self, fd: int) -> bool:
+        loop = asyncio.get_running_loop()
+        os.set_blocking(fd, False)
+        write_fd = os.dup(fd)
+        write_file = None
+        try:
+            self._lines = asyncio.Queue()
+            self._rx_buffer = bytearray()
+            self._read_transport, _ = await loop.connect_read_pipe(
+                lambda: _ReadProtocol(self), os.fdopen(fd, 'rb', buffering=0))
+            write_file = os.fdopen(write_fd, 'wb', buffering=0)
+            self._write_transport, self._write_protocol = await loop.connect_write_pipe(
+                _WriteProtocol, write_file)
+            self._write_transport.set_write_buffer_limits(self.high_water, self.low_water)
+        except Exception as e:
+            print(f"Failed to attach serial port {self.port}: {e}")
+            # Until it is wrapped in a file, nothing else closes the duplicate
+            if write_file is None:
+                os.close(write_fd)
+            await self.stop()
+            return False
+        self.running = True
+        return True
+
+    def _configure(self, fd: int):
+        """Put a tty into raw mode at the configured baud rate"""
+        import termios
+        import tty
+        if not os.isatty(fd):
+            return
+        tty.setraw(fd)
+        speed = getattr(termios, f"B{self.baudrate}", None)
+        if speed is not None:
+            attrs = termios.tcgetattr(fd)
+            attrs[4] = attrs[5] = speed
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+    def _process_incoming(self, data: bytes):
+        self.bytes_received += len(data)
+        buffer = self._rx_buffer
+        buffer += data
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            return
+        lines = bytes(buffer[:end]).split(b'\n')
+        del buffer[:end + 1]
+        self.lines_received += len(lines)
+        for line in lines:
+            self._lines.put_nowait(line.decode('utf-8', errors='ignore').strip())
+
+    def _on_connection_lost(self, exc):
+        self.running = False
+        if self._lines is not None:
+            self._lines.put_nowait(None)
+
+
+async def emit_tag(engine: SimulatorEngine, tag_id: str,
+                   ports: Iterable[AsyncVirtualCOMPort]) -> List[bool]:
+    """Send one tag's payload to many async ports concurrently"""
+    payload = engine.encode_tag(tag_id)
+    return await asyncio.gather(*(port.send_data(payload) for port in ports))
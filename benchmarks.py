@@ -0,0 +1,480 @@
+"""Benchmarks for the simulator's hot paths.
+
+Usage:
+    python benchmarks.py [--sizes 10 1000 100000] [--output results.json]
+    python benchmarks.py --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from tag_encoders import ENCODERS, encode
+from tag_store import TagStore
+
+DEFAULT_SIZES = [10, 1000, 100000]
+PAYLOAD_SIZES = [16, 256, 4096]
+BAUD_RATES = [9600, 115200, 921600]
+
+
+def make_tags(count: int, payload_size: int = 32, seed: int = 0) -> Dict[str, dict]:
+    """Build a synthetic tag database"""
+    rng = uuid.UUID(int=seed).int
+    now = datetime(2025, 1, 1).isoformat()
+    tags = {}
+    content = "x" * payload_size
+    for i in range(count):
+        tag_id = str(uuid.UUID(int=(rng + i * 0x9E3779B97F4A7C15) % (1 << 128), version=4))
+        tags[tag_id] = {
+            "id": tag_id,
+            "created_at": now,
+            "last_modified": now,
+            "data": {"type": "virtual_nfc_tag", "version": "1.0", "content": content},
+        }
+    return tags
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def measure(name: str, params: dict, op: Callable[[], object], iterations: int,
+            setup: Optional[Callable[[], None]] = None, units_per_op: int = 1) -> dict:
+    """Time ``iterations`` calls of ``op`` and record the peak memory of one call"""
+    if setup:
+        setup()
+    samples = []
+    perf = time.perf_counter
+    start = perf()
+    for _ in range(iterations):
+        t0 = perf()
+        op()
+        samples.append(perf() - t0)
+    total = perf() - start
+
+    if setup:
+        setup()
+    tracemalloc.start()
+    op()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "name": name,
+        "params": params,
+        "iterations": iterations,
+        "seconds": total,
+        "throughput": iterations * units_per_op / total if total else 0.0,
+        "p50_us": _percentile(samples, 0.50) * 1e6,
+        "p99_us": _percentile(samples, 0.99) * 1e6,
+        "peak_kib": peak / 1024,
+    }
+
+
+def bench_store(sizes: List[int], workdir: str) -> List[dict]:
+    results = []
+    for size in sizes:
+        tags = make_tags(size)
+        path = os.path.join(workdir, f"tags_{size}.json")
+        store = TagStore(path, fsync=False)
+        store.tags.update(tags)
+        iterations = max(1, min(20, 200000 // max(size, 1)))
+        results.append(measure("store.compact", {"tags": size}, store.compact, iterations))
+        results.append(measure("store.load_tags", {"tags": size},
+                               lambda: TagStore(path, fsync=False).load_tags(), iterations))
+
+        # Single-tag update cost through the change log
+        tag_id = next(iter(tags))
+        store.compact_threshold = 1 << 30
+        results.append(measure("store.put", {"tags": size},
+                               lambda: store.put(tag_id, tags[tag_id]), 2000))
+        store.close()
+    return results
+
+
+def bench_store_writers(workdir: str, puts_per_thread: int = 100) -> List[dict]:
+    """Durable puts from several threads at once, which share fsyncs"""
+    results = []
+    tags = make_tags(puts_per_thread)
+    for threads in (1, 4, 8):
+        path = os.path.join(workdir, f"writers_{threads}.json")
+        store = TagStore(path, compact_threshold=1 << 30)
+
+        def op():
+            def write():
+                for tag_id, tag in tags.items():
+                    store.put(tag_id, tag)
+            workers = [threading.Thread(target=write) for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        results.append(measure("store.concurrent_put", {"threads": threads}, op, 5,
+                               units_per_op=threads * puts_per_thread))
+        store.close()
+    return results
+
+
+def bench_encoding() -> List[dict]:
+    results = []
+    for payload_size in PAYLOAD_SIZES:
+        tag = next(iter(make_tags(1, payload_size).values()))
+        for encoding in ENCODERS:
+            results.append(measure("encode", {"encoding": encoding, "payload": payload_size},
+                                   lambda: encode(tag, encoding), 20000))
+    return results
+
+
+def bench_serial_send() -> List[dict]:
+    """VirtualCOMPort.send_data over a pty loopback with the host side drained
+
+    A pty does not enforce the baud rate, so these figures measure the
+    software path; ``wire_limit`` is the line rate the real baud rate allows
+    (10 bits per byte on an 8N1 line).
+    """
+    try:
+        from pty_loopback import PtyPair
+        from virtual_com_port import VirtualCOMPort
+    except ImportError as e:
+        print(f"Skipping serial benchmarks: {e}")
+        return []
+
+    results = []
+    for baud in BAUD_RATES:
+        for payload_size in PAYLOAD_SIZES:
+            with PtyPair() as pair:
+                port = VirtualCOMPort(pair.device, baud)
+                if not port.start(start_reader=False):
+                    continue
+                stop = threading.Event()
+
+                def drain():
+                    import select
+                    while not stop.is_set():
+                        if select.select([pair.master_fd], [], [], 0.1)[0]:
+                            pair.read()
+
+                drainer = threading.Thread(target=drain, daemon=True)
+                drainer.start()
+                payload = "x" * payload_size
+                try:
+                    result = measure("serial.send_data", {"baud": baud, "payload": payload_size},
+                                     lambda: port.send_data(payload), 2000)
+                    result["wire_limit"] = baud / 10 / (payload_size + 1)
+                    results.append(result)
+                finally:
+                    stop.set()
+                    drainer.join()
+                    port.stop()
+    return results
+
+
+def bench_serial_coalesced(frames: int = 5000) -> List[dict]:
+    """End-to-end frame latency and throughput over a pty, per-call writes versus coalesced writes
+
+    Latency runs from the ``send_data`` call to the host side reading the
+    frame's newline, so it includes the time a frame waits for its batch.
+    ``writes`` is the number of write calls the frames took.
+    """
+    try:
+        import select
+        from pty_loopback import PtyPair
+        from virtual_com_port import VirtualCOMPort
+    except ImportError as e:
+        print(f"Skipping serial coalescing benchmarks: {e}")
+        return []
+
+    results = []
+    for payload_size in PAYLOAD_SIZES[:2]:
+        for max_latency in (None, 0.0005, 0.002):
+            with PtyPair() as pair:
+                port = VirtualCOMPort(pair.device, coalesce=max_latency is not None,
+                                      max_latency=max_latency or 0.0)
+                if not port.start(start_reader=False):
+                    continue
+                sent_at = []
+                arrived_at = []
+
+                def drain():
+                    while len(arrived_at) < frames:
+                        if select.select([pair.master_fd], [], [], 1.0)[0]:
+                            count = pair.read().count(b"\n")
+                            now = time.perf_counter()
+                            arrived_at.extend([now] * count)
+                        elif not port.running:
+                            break
+
+                drainer = threading.Thread(target=drain, daemon=True)
+                drainer.start()
+                payload = "x" * payload_size
+                perf = time.perf_counter
+                start = perf()
+                for _ in range(frames):
+                    sent_at.append(perf())
+                    port.send_data(payload)
+                port.flush()
+                drainer.join(timeout=10.0)
+                port.stop()
+
+            received = min(len(arrived_at), frames)
+            latencies = sorted(arrived_at[i] - sent_at[i] for i in range(received))
+            total = (arrived_at[received - 1] - start) if received else 0.0
+            results.append({
+                "name": "serial.coalesced" if max_latency is not None else "serial.per_call",
+                "params": {"payload": payload_size, "max_latency_ms": (max_latency or 0.0) * 1000},
+                "iterations": frames,
+                "seconds": total,
+                "throughput": received / total if total else 0.0,
+                "p50_us": _percentile(latencies, 0.50) * 1e6,
+                "p99_us": _percentile(latencies, 0.99) * 1e6,
+                "peak_kib": 0.0,
+                "writes": port.writes,
+            })
+    return results
+
+
+def bench_read_framing() -> List[dict]:
+    """Line framing in VirtualCOMPort.process_incoming for bursts of lines"""
+    try:
+        from virtual_com_port import VirtualCOMPort
+    except ImportError as e:
+        print(f"Skipping read-loop benchmarks: {e}")
+        return []
+
+    results = []
+    for lines_per_burst in (1, 100, 10000):
+        port = VirtualCOMPort()
+        port.set_callback(lambda line: None)
+        burst = b"04A1B2C3D4E5F6,some,host,command\n" * lines_per_burst
+        results.append(measure("serial.process_incoming", {"lines_per_burst": lines_per_burst},
+                               lambda: port.process_incoming(burst),
+                               max(10, 20000 // lines_per_burst), units_per_op=lines_per_burst))
+    return results
+
+
+def bench_reader_protocol(workdir: str) -> List[dict]:
+    """Host command round trips to the reader protocol over a pty loopback
+
+    The host stand-in writes a command on the pty master and waits for the
+    response line, so each sample covers the port's read thread, command
+    parsing and the response write.  The pipelined case keeps 32 tagged
+    requests in flight before reading the answers.
+    """
+    try:
+        from pty_loopback import PtyPair
+        from reader_protocol import ReaderProtocol
+        from simulator_core import SimulatorEngine
+        from virtual_com_port import VirtualCOMPort
+    except ImportError as e:
+        print(f"Skipping reader protocol benchmarks: {e}")
+        return []
+
+    store = TagStore(os.path.join(workdir, "protocol_tags.json"), fsync=False)
+    store.tags.update(make_tags(100))
+    store.compact()
+    engine = SimulatorEngine(store)
+    engine.load()
+    protocol = ReaderProtocol(engine)
+    protocol.present(next(iter(engine.tags)))
+
+    results = []
+    with PtyPair() as pair:
+        port = VirtualCOMPort(pair.device)
+        if not port.start():
+            return []
+        protocol.attach(port)
+        try:
+            for command in ("POLL", "UID", "READ 0"):
+                request = command.encode("ascii") + b"\n"
+                results.append(measure("protocol.round_trip", {"command": command},
+                                       lambda: (pair.write(request), pair.read_line(1.0)), 2000))
+
+            depth = 32
+            requests = b"".join(f"#{i} READ {i % 8}\n".encode("ascii") for i in range(depth))
+
+            def pipelined():
+                pair.write(requests)
+                for _ in range(depth):
+                    pair.read_line(1.0)
+
+            results.append(measure("protocol.pipelined", {"in_flight": depth}, pipelined, 200,
+                                   units_per_op=depth))
+        finally:
+            port.stop()
+    return results
+
+
+def bench_field(workdir: str) -> List[dict]:
+    """Inventory of a crowded RF field: anticollision, read and halt for every tag"""
+    from rf_field import RFField
+    from simulator_core import SimulatorEngine
+
+    results = []
+    for count in (100, 1000, 10000):
+        store = TagStore(os.path.join(workdir, f"field_{count}.json"), fsync=False)
+        store.tags.update(make_tags(count))
+        store.compact()
+        engine = SimulatorEngine(store)
+        engine.load()
+        field = RFField(engine)
+        field.enter_many(engine.tags)
+        results.append(measure("field.inventory", {"tags": count},
+                               lambda: field.inventory(wake=True), max(1, 10000 // count),
+                               units_per_op=count))
+        store.close()
+    return results
+
+
+def bench_fleet(workdir: str, count: int = 100000) -> List[dict]:
+    """Synthetic fleet generation with each backend, and generation straight into a lazy store"""
+    from tag_fleet import NUMPY_AVAILABLE, generate_tags
+
+    results = []
+    for use_numpy in ([True, False] if NUMPY_AVAILABLE else [False]):
+        backend = "numpy" if use_numpy else "random"
+        results.append(measure("fleet.generate", {"backend": backend, "tags": count},
+                               lambda: sum(1 for _ in generate_tags(count, seed=1, use_numpy=use_numpy)),
+                               3, units_per_op=count))
+    store = TagStore(os.path.join(workdir, "fleet.json"), lazy=True, fsync=False)
+    store.load_tags()
+    results.append(measure("fleet.put_many", {"tags": count},
+                           lambda: store.put_many((tag["id"], tag) for tag in generate_tags(count, seed=1)),
+                           3, units_per_op=count))
+    store.close()
+    return results
+
+
+def bench_tag_memory(workdir: str, count: int = 10000) -> List[dict]:
+    """Emulated tag memory in a memory-mapped image file: creating images, reopening, block access and NDEF lookup"""
+    from tag_encoders import ndef_text_record
+    from tag_memory import NTAG215, MemoryImageStore
+
+    path = os.path.join(workdir, "tags.mem")
+    uid = bytes.fromhex("04A1B2C3D4E5F6")
+    message = ndef_text_record("x" * 48)
+    tag_ids = [f"tag-{i}" for i in range(count)]
+
+    def create():
+        if os.path.exists(path):
+            os.remove(path)
+        store = MemoryImageStore(path)
+        for tag_id in tag_ids:
+            store.create(tag_id, NTAG215, uid, message)
+        store.close()
+
+    results = [measure("memory.create", {"tags": count}, create, 3, units_per_op=count)]
+    results.append(measure("memory.open", {"tags": count}, lambda: MemoryImageStore(path).close(), 5,
+                           units_per_op=count))
+    store = MemoryImageStore(path)
+    memories = [store.get(tag_id) for tag_id in tag_ids[:256]]
+    block = bytes(range(16))
+    results.append(measure("memory.read_block", {}, lambda: [m.read_block(2) for m in memories], 200,
+                           units_per_op=len(memories)))
+    results.append(measure("memory.write_block", {}, lambda: [m.write_block(20, block) for m in memories], 200,
+                           units_per_op=len(memories)))
+    results.append(measure("memory.ndef_message", {}, lambda: [m.ndef_message() for m in memories], 200,
+                           units_per_op=len(memories)))
+    # Release the views into the image before closing it
+    memories.clear()
+    store.close()
+    return results
+
+
+def bench_keyboard() -> List[dict]:
+    """Keyboard wedge typing into a recording (mock) input sink"""
+    from keyboard_wedge import KeyboardWedge, RecordingBackend
+    results = []
+    for payload_size in (7, 64):
+        backend = RecordingBackend()
+        wedge = KeyboardWedge(backend)
+        data = "A" * (payload_size * 2)
+
+        def reset():
+            backend.events.clear()
+
+        results.append(measure("keyboard.send_scan", {"uid_hex_chars": len(data)},
+                               lambda: wedge.send_scan(data), 5000, setup=reset))
+    return results
+
+
+def run(sizes: List[int]) -> dict:
+    workdir = tempfile.mkdtemp(prefix="nfc_bench_")
+    try:
+        results = []
+        for bench in (lambda: bench_store(sizes, workdir), lambda: bench_store_writers(workdir),
+                      bench_encoding, bench_serial_send, bench_serial_coalesced, bench_read_framing,
+                      lambda: bench_reader_protocol(workdir), lambda: bench_field(workdir),
+                      lambda: bench_fleet(workdir), lambda: bench_tag_memory(workdir), bench_keyboard):
+            for result in bench():
+                print(format_result(result))
+                results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "created_at": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+
+def _key(result: dict) -> str:
+    params = ",".join(f"{k}={v}" for k, v in sorted(result["params"].items()))
+    return f"{result['name']}[{params}]"
+
+
+def format_result(result: dict) -> str:
+    return (f"{_key(result):55s} {result['throughput']:>14,.0f}/s  "
+            f"p50 {result['p50_us']:>10.1f}us  p99 {result['p99_us']:>10.1f}us  "
+            f"peak {result['peak_kib']:>10.1f}KiB")
+
+
+def compare(old_path: str, new_path: str):
+    """Print the throughput change for each benchmark present in both files"""
+    with open(old_path) as f:
+        old = {_key(r): r for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {_key(r): r for r in json.load(f)["results"]}
+    for key in sorted(old.keys() & new.keys()):
+        before, after = old[key]["throughput"], new[key]["throughput"]
+        change = (after / before - 1) * 100 if before else float("inf")
+        p99_before, p99_after = old[key]["p99_us"], new[key]["p99_us"]
+        print(f"{key:55s} {before:>12,.0f} -> {after:>12,.0f}/s ({change:+6.1f}%)  "
+              f"p99 {p99_before:.1f} -> {p99_after:.1f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the NFC simulator hot paths")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="tag database sizes to benchmark (e.g. 10 1000 100000 1000000)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        help="compare two result files instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = run(args.sizes)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import collections
+import itertools
+import random
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, Optional, Sequence
+
+from simulator_core import SimulatorEngine
+
+SELECT_SEQUENCE = "sequence"
+SELECT_RANDOM = "random"
+SELECT_WEIGHTED = "weighted"
+
+JITTER_NONE = "none"
+JITTER_UNIFORM = "uniform"
+JITTER_POISSON = "poisson"
+
+# Sleep until this close to the deadline, then spin for the remainder; the
+# spin never exceeds this fraction of the wait, so dense schedules mostly sleep
+_SPIN_THRESHOLD = 0.001
+_SPIN_FRACTION = 0.1
+
+
+class BurstScheduler:
+    """Emit sustained read traffic at a target scan rate.
+
+    Tags are drawn from the store (or ``tag_ids``) in sequence, uniformly at
+    random, or weighted by ``weights``, and read through
+    ``SimulatorEngine.read_tag`` so they follow the normal emission path.
+    Scan times are fixed on an absolute schedule, so sleep overshoot on one
+    scan does not drift the overall rate.
+
+    Args:
+        engine: Simulator engine providing tags and outputs
+        rate: Target scans per second
+        outputs: Output names each scan is emitted to
+        selection: One of SELECT_SEQUENCE, SELECT_RANDOM or SELECT_WEIGHTED
+        count: Stop after this many scans (None for no limit)
+        duration: Stop after this many seconds (None for no limit)
+        jitter: JITTER_NONE, JITTER_UNIFORM (+/- jitter_amount of the interval)
+            or JITTER_POISSON (exponential gaps, i.e. a Poisson arrival process)
+        tag_ids: Restrict scans to these tags
+        weights: Relative weight per tag ID for SELECT_WEIGHTED
+        seed: Random seed for reproducible runs
+    """
+
+    def __init__(self, engine: SimulatorEngine, rate: float = 10.0, outputs: Iterable[str] = (),
+                 selection: str = SELECT_SEQUENCE, count: Optional[int] = None,
+                 duration: Optional[float] = None, jitter: str = JITTER_NONE,
+                 jitter_amount: float = 0.1, tag_ids: Optional[Sequence[str]] = None,
+                 weights: Optional[Dict[str, float]] = None, seed: Optional[int] = None,
+                 on_scan: Optional[Callable[[str], None]] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.engine = engine
+        self.rate = rate
+        self.outputs = tuple(outputs)
+        self.selection = selection
+        self.count = count
+        self.duration = duration
+        self.jitter = jitter
+        self.jitter_amount = jitter_amount
+        self.tag_ids = list(tag_ids) if tag_ids is not None else None
+        self.weights = weights
+        self.on_scan = on_scan
+        self.random = random.Random(seed)
+
+        self.scans_sent = 0
+        self.errors = 0
+        self.running = False
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._window = collections.deque()
+        self._started_at = None
+
+    def start(self):
+        """Run the burst on a background thread"""
+        if self.running:
+            return
+        # Set here rather than in run() so callers see the burst as running
+        # as soon as start() returns
+        self.running = True
+        self._thread = threading.Thread(target=self.run, name="burst-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop an active burst"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait for a background burst to finish"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    @property
+    def achieved_rate(self) -> float:
+        """Scans per second over the last second"""
+        if not self._started_at:
+            return 0.0
+        now = time.perf_counter()
+        window = self._window
+        while window and now - window[0] > 1.0:
+            window.popleft()
+        return len(window) / min(max(now - self._started_at, 1e-9), 1.0)
+
+    @property
+    def average_rate(self) -> float:
+        """Scans per second since the burst started"""
+        if not self._started_at:
+            return 0.0
+        return self.scans_sent / max(time.perf_counter() - self._started_at, 1e-9)
+
+    def run(self):
+        """Run the burst on the calling thread until the count or duration is reached"""
+        self.running = True
+        self._stop_event.clear()
+        self.scans_sent = 0
+        self.errors = 0
+        self._window.clear()
+        tags = self._tag_source()
+        start = self._started_at = time.perf_counter()
+        deadline = start + self.duration if self.duration is not None else None
+        next_time = start
+        try:
+            for n in itertools.count():
+                if self._stop_event.is_set() or (self.count is not None and n >= self.count):
+                    break
+                # Also check the clock: a burst that cannot keep up with the
+                # rate stops at the deadline instead of working off its backlog
+                if deadline is not None and (next_time >= deadline or time.perf_counter() >= deadline):
+                    break
+                self._sleep_until(next_time)
+                if self._stop_event.is_set():
+                    break
+
+                tag_id = next(tags, None)
+                if tag_id is None:
+                    break
+                try:
+                    self.engine.read_tag(tag_id, self.outputs)
+                    if self.on_scan:
+                        self.on_scan(tag_id)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Burst scan failed for {tag_id[:8]}...: {e}")
+                self.scans_sent += 1
+                self._window.append(time.perf_counter())
+                next_time += self._next_interval()
+        finally:
+            self.running = False
+
+    def _tag_source(self) -> Iterator[str]:
+        ids = self.tag_ids if self.tag_ids is not None else list(self.engine.tags)
+        if not ids:
+            return iter(())
+        if self.selection == SELECT_SEQUENCE:
+            return itertools.cycle(ids)
+        if self.selection == SELECT_RANDOM:
+            return (self.random.choice(ids) for _ in itertools.count())
+        if self.selection == SELECT_WEIGHTED:
+            weights = self.weights or {}
+            cum_weights = list(itertools.accumulate(weights.get(tag_id, 1.0) for tag_id in ids))
+            return (self.random.choices(ids, cum_weights=cum_weights)[0] for _ in itertools.count())
+        raise ValueError(f"Unknown selection mode: {self.selection}")
+
+    def _next_interval(self) -> float:
+        interval = 1.0 / self.rate
+        if self.jitter == JITTER_UNIFORM:
+            interval *= 1.0 + self.random.uniform(-self.jitter_amount, self.jitter_amount)
+        elif self.jitter == JITTER_POISSON:
+            interval = self.random.expovariate(self.rate)
+        return max(interval, 0.0)
+
+    def _sleep_until(self, target: float):
+        sleep_until(target, self._stop_event)
+
+
+def sleep_until(target: float, stop_event: threading.Event):
+    """Wait until ``target`` on the perf_counter clock, waking early if ``stop_event`` is set
+
+    The spin at the end yields the GIL on every turn, so the send pipeline
+    and serial read threads keep running.
+    """
+    remaining = target - time.perf_counter()
+    spin = min(_SPIN_THRESHOLD, remaining * _SPIN_FRACTION)
+    if remaining > spin:
+        stop_event.wait(remaining - spin)
+    while time.perf_counter() < target and not stop_event.is_set():
+        time.sleep(0)
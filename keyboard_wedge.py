@@ -0,0 +1,235 @@
+"""Keyboard-wedge output: scans typed as keystrokes, like a USB HID reader.
+
+A ``KeyboardWedge`` types ``prefix + data + suffix`` for each scan through
+one of these backends:
+
+    UinputBackend       Linux.  A virtual keyboard on /dev/uinput; each scan
+                        is one write() of all its key events (US layout).
+    PyAutoGUIBackend    Elsewhere, or without uinput access.  Types the text
+                        through pyautogui with the per-key pause turned off.
+    RecordingBackend    Records the events instead of injecting them (tests
+                        and benchmarks).
+
+``default_backend`` picks uinput when it can open it, otherwise pyautogui.
+
+Usage:
+    python keyboard_wedge.py    # scans per second with the recording and uinput backends
+"""
+import os
+import struct
+import time
+from typing import List, Optional, Tuple
+
+# Linux input event types and codes (linux/input-event-codes.h)
+EV_SYN = 0x00
+EV_KEY = 0x01
+SYN_REPORT = 0
+KEY_LEFTSHIFT = 42
+
+# uinput ioctls (linux/uinput.h)
+UI_SET_EVBIT = 0x40045564
+UI_SET_KEYBIT = 0x40045565
+UI_DEV_CREATE = 0x5501
+UI_DEV_DESTROY = 0x5502
+BUS_USB = 0x03
+
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value
+_INPUT_EVENT = struct.Struct("@llHHi")
+
+# US layout: character -> (keycode, shift)
+_UNSHIFTED = {
+    "1": 2, "2": 3, "3": 4, "4": 5, "5": 6, "6": 7, "7": 8, "8": 9, "9": 10, "0": 11,
+    "-": 12, "=": 13, "\t": 15,
+    "q": 16, "w": 17, "e": 18, "r": 19, "t": 20, "y": 21, "u": 22, "i": 23, "o": 24, "p": 25,
+    "[": 26, "]": 27, "\n": 28,
+    "a": 30, "s": 31, "d": 32, "f": 33, "g": 34, "h": 35, "j": 36, "k": 37, "l": 38,
+    ";": 39, "'": 40, "`": 41, "\\": 43,
+    "z": 44, "x": 45, "c": 46, "v": 47, "b": 48, "n": 49, "m": 50,
+    ",": 51, ".": 52, "/": 53, " ": 57,
+}
+_SHIFTED = {
+    "!": "1", "@": "2", "#": "3", "$": "4", "%": "5", "^": "6", "&": "7", "*": "8", "(": "9", ")": "0",
+    "_": "-", "+": "=", "{": "[", "}": "]", ":": ";", '"': "'", "~": "`", "|": "\\",
+    "<": ",", ">": ".", "?": "/",
+}
+KEYMAP = {char: (code, False) for char, code in _UNSHIFTED.items()}
+KEYMAP.update({char: (_UNSHIFTED[base], True) for char, base in _SHIFTED.items()})
+KEYMAP.update({char.upper(): (code, True) for char, code in _UNSHIFTED.items() if char.isalpha()})
+KEYMAP["\r"] = KEYMAP["\n"]
+
+KeyEvent = Tuple[int, int]  # (keycode, value) with value 1 = press, 0 = release
+
+
+def text_to_key_events(text: str) -> List[KeyEvent]:
+    """Translate text into press/release events on a US keyboard layout"""
+    events = []
+    for char in text:
+        try:
+            code, shift = KEYMAP[char]
+        except KeyError:
+            raise ValueError(f"Character {char!r} cannot be typed by the keyboard wedge") from None
+        if shift:
+            events.append((KEY_LEFTSHIFT, 1))
+        events.append((code, 1))
+        events.append((code, 0))
+        if shift:
+            events.append((KEY_LEFTSHIFT, 0))
+    return events
+
+
+class RecordingBackend:
+    """Keyboard backend that records events instead of injecting them (for tests)"""
+
+    def __init__(self):
+        self.events: List[KeyEvent] = []
+        self.batches = 0
+
+    def send_events(self, events: List[KeyEvent]):
+        self.events.extend(events)
+        self.batches += 1
+
+    @property
+    def text(self) -> str:
+        """Reconstruct the typed text from the recorded events"""
+        reverse = {(code, shift): char for char, (code, shift) in KEYMAP.items() if char != "\r"}
+        shift = False
+        chars = []
+        for code, value in self.events:
+            if code == KEY_LEFTSHIFT:
+                shift = bool(value)
+            elif value == 1:
+                chars.append(reverse.get((code, shift), "?"))
+        return "".join(chars)
+
+    def close(self):
+        pass
+
+
+class UinputBackend:
+    """Linux keyboard backend that injects events through a /dev/uinput device.
+
+    Every scan is written as one batch of events with a single ``write()``,
+    the way a USB HID reader delivers a report burst.
+    """
+
+    def __init__(self, name: str = "NFC Simulator Keyboard Wedge", path: str = "/dev/uinput"):
+        import fcntl
+        self.fd = os.open(path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_KEY)
+            fcntl.ioctl(self.fd, UI_SET_EVBIT, EV_SYN)
+            for code, _ in set(KEYMAP.values()):
+                fcntl.ioctl(self.fd, UI_SET_KEYBIT, code)
+            fcntl.ioctl(self.fd, UI_SET_KEYBIT, KEY_LEFTSHIFT)
+            # Legacy struct uinput_user_dev: name, input_id, ff_effects_max, abs arrays
+            setup = struct.pack("80sHHHHi", name.encode()[:79], BUS_USB, 0x1209, 0x0001, 1, 0)
+            os.write(self.fd, setup + b"\0" * (4 * 64 * 4))
+            fcntl.ioctl(self.fd, UI_DEV_CREATE)
+        except Exception:
+            os.close(self.fd)
+            raise
+        self._fcntl = fcntl
+        # Give the input subsystem time to announce the new device
+        time.sleep(0.1)
+
+    def send_events(self, events: List[KeyEvent]):
+        pack = _INPUT_EVENT.pack
+        syn = pack(0, 0, EV_SYN, SYN_REPORT, 0)
+        buffer = bytearray()
+        for code, value in events:
+            buffer += pack(0, 0, EV_KEY, code, value)
+            buffer += syn
+        os.write(self.fd, buffer)
+
+    def close(self):
+        if self.fd is not None:
+            try:
+                self._fcntl.ioctl(self.fd, UI_DEV_DESTROY)
+            finally:
+                os.close(self.fd)
+                self.fd = None
+
+
+class PyAutoGUIBackend:
+    """Fallback backend typing through pyautogui without per-character delays"""
+
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+
+    def send_text(self, text: str):
+        pyautogui = self.pyautogui
+        saved_pause = pyautogui.PAUSE
+        pyautogui.PAUSE = 0
+        try:
+            lines = text.split("\n")
+            for i, line in enumerate(lines):
+                if line:
+                    pyautogui.write(line, interval=0)
+                if i < len(lines) - 1:
+                    pyautogui.press("enter")
+        finally:
+            pyautogui.PAUSE = saved_pause
+
+    def close(self):
+        pass
+
+
+def default_backend():
+    """Best available backend: uinput on Linux, otherwise pyautogui"""
+    if os.name == "posix" and os.path.exists("/dev/uinput"):
+        try:
+            return UinputBackend()
+        except OSError as e:
+            print(f"uinput not available: {e}")
+    return PyAutoGUIBackend()
+
+
+class KeyboardWedge:
+    """Types scans like a USB HID keyboard-wedge reader: prefix + data + suffix"""
+
+    def __init__(self, backend=None, prefix: str = "", suffix: str = "\n"):
+        self.backend = backend if backend is not None else default_backend()
+        self.prefix = prefix
+        self.suffix = suffix
+        self.scans_sent = 0
+
+    def send_scan(self, data) -> bool:
+        """Type one scan"""
+        if isinstance(data, bytes):
+            data = data.hex().upper()
+        text = f"{self.prefix}{data}{self.suffix}"
+        send_text = getattr(self.backend, "send_text", None)
+        if send_text is not None:
+            send_text(text)
+        else:
+            self.backend.send_events(text_to_key_events(text))
+        self.scans_sent += 1
+        return True
+
+    def close(self):
+        self.backend.close()
+
+
+def benchmark(wedge: Optional[KeyboardWedge] = None, scans: int = 10000,
+              data: str = "04A1B2C3D4E5F6") -> float:
+    """Return the scans per second a wedge sustains for a typical 7-byte UID"""
+    wedge = wedge if wedge is not None else KeyboardWedge(RecordingBackend())
+    start = time.perf_counter()
+    for _ in range(scans):
+        wedge.send_scan(data)
+    return scans / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    print(f"recording backend: {benchmark():,.0f} scans/s")
+    if os.path.exists("/dev/uinput"):
+        try:
+            uinput_wedge = KeyboardWedge(UinputBackend())
+        except OSError as e:
+            print(f"uinput backend: unavailable ({e})")
+        else:
+            try:
+                print(f"uinput backend: {benchmark(uinput_wedge, scans=1000):,.0f} scans/s")
+            finally:
+                uinput_wedge.close()
@@ -0,0 +1,226 @@
+"""Multi-process scan load generator.
+
+Shards the tag set and a list of serial targets across a process pool.  Each
+worker process loads the tag store, opens its share of the targets and runs
+one BurstScheduler per target (one simulated reader), so payload encoding and
+serial writes for different readers run on different cores.  Worker metrics
+are merged into a single report.
+
+Usage:
+    python load_generator.py --targets /dev/ttyUSB0 /dev/ttyUSB1 --rate 500 --duration 10
+    python load_generator.py --targets null null null null --workers 4 --rate 2000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+import metrics
+from burst_scheduler import BurstScheduler, JITTER_NONE, SELECT_SEQUENCE
+from simulator_core import SimulatorEngine
+from tag_encoders import ENCODERS, ENCODING_UID_HEX, Payload
+from tag_store import TagStore, DEFAULT_TAGS_FILE
+
+# Target name for a reader whose scans are encoded and then discarded
+NULL_TARGET = "null"
+
+# (reader name, serial target, tag IDs) for each reader assigned to a worker
+ReaderSpec = Tuple[str, str, List[str]]
+
+
+def shard(items: Sequence, count: int) -> List[list]:
+    """Split items round-robin into ``count`` shards"""
+    return [list(items[i::count]) for i in range(count)]
+
+
+def run_load(targets: Sequence[str], rate: float = 100.0, duration: Optional[float] = 10.0,
+             count: Optional[int] = None, workers: Optional[int] = None,
+             tags_path: str = DEFAULT_TAGS_FILE, baudrate: int = 115200,
+             encoding: str = ENCODING_UID_HEX, selection: str = SELECT_SEQUENCE,
+             jitter: str = JITTER_NONE, seed: Optional[int] = None,
+             start_delay: float = 1.0, max_latency: Optional[float] = None) -> dict:
+    """Drive one simulated reader per target at ``rate`` scans/s each and return a merged report
+
+    Args:
+        targets: Serial ports to write scans to (NULL_TARGET to only encode)
+        rate: Scans per second per reader
+        duration: Seconds to run (None to stop after ``count`` scans)
+        count: Scans per reader (None for no limit)
+        workers: Worker processes (defaults to the CPU count, at most one per target)
+        tags_path: Tag store to load tags from
+        baudrate: Baud rate for the serial targets
+        encoding: Wire encoding for the scans
+        selection: Tag selection mode per reader (see burst_scheduler)
+        jitter: Inter-scan jitter mode (see burst_scheduler)
+        seed: Random seed; each reader derives its own from it
+        start_delay: Seconds allowed for workers to load before all readers start together
+        max_latency: Coalesce serial writes, holding a scan at most this many seconds
+            (None writes every scan on its own)
+    """
+    if not targets:
+        raise ValueError("at least one target is required")
+    if encoding not in ENCODERS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    if duration is None and count is None:
+        raise ValueError("duration or count is required")
+
+    # Load once here so any pending change log is compacted and the sidecar
+    # index is current; the workers then only read the store.
+    store = TagStore(tags_path, lazy=True)
+    tag_ids = list(store.load_tags())
+    store.close()
+    if not tag_ids:
+        raise ValueError(f"No tags in {tags_path}")
+
+    workers = max(1, min(workers or os.cpu_count() or 1, len(targets)))
+    readers = [(f"reader{i}", target, ids or tag_ids)
+               for i, (target, ids) in enumerate(zip(targets, shard(tag_ids, len(targets))))]
+    start_at = time.time() + start_delay
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_run_worker, tags_path, worker_readers, baudrate, rate, duration,
+                               count, encoding, selection, jitter, seed, start_at, max_latency)
+                   for worker_readers in shard(readers, workers)]
+        results = [future.result() for future in futures]
+
+    for result in results:
+        metrics.REGISTRY.merge(result.pop("metrics"))
+
+    started = min(result["started"] for result in results)
+    finished = max(result["finished"] for result in results)
+    elapsed = max(finished - started, 1e-9)
+    scans = sum(result["scans"] for result in results)
+    report_readers = [reader for result in results for reader in result["readers"]]
+    for reader in report_readers:
+        p99 = metrics.SEND_SECONDS.quantile(0.99, reader["target"])
+        reader["send_p99_ms"] = p99 * 1000 if p99 is not None else None
+    return {
+        "workers": len(results),
+        "readers": len(readers),
+        "target_rate": rate * len(readers),
+        "achieved_rate": scans / elapsed,
+        "elapsed": elapsed,
+        "scans": scans,
+        "errors": sum(result["errors"] for result in results),
+        "bytes_written": metrics.BYTES_WRITTEN.total(),
+        "send_failures": metrics.SEND_FAILURES.total(),
+        "failed_readers": [reader for result in results for reader in result["failed"]],
+        "per_worker": results,
+        "per_reader": report_readers,
+    }
+
+
+def _run_worker(tags_path: str, readers: List[ReaderSpec], baudrate: int, rate: float,
+                duration: Optional[float], count: Optional[int], encoding: str, selection: str,
+                jitter: str, seed: Optional[int], start_at: float,
+                max_latency: Optional[float] = None) -> dict:
+    """Run a worker's readers to completion and return its counters and metrics"""
+    metrics.enable()
+    store = TagStore(tags_path, lazy=True, fsync=False)
+    engine = SimulatorEngine(store=store, default_encoding=encoding)
+    engine.load()
+
+    ports = []
+    bursts = []
+    failed = []
+    for index, (name, target, tag_ids) in enumerate(readers):
+        if target == NULL_TARGET:
+            engine.add_output(name, _discard)
+        else:
+            from virtual_com_port import VirtualCOMPort
+            if max_latency is None:
+                port = VirtualCOMPort(target, baudrate)
+            else:
+                port = VirtualCOMPort(target, baudrate, coalesce=True, max_latency=max_latency)
+            if not port.start(start_reader=False):
+                # Reported rather than skipped, so a short run is not mistaken for a full one
+                failed.append({"name": name, "target": target})
+                continue
+            ports.append(port)
+            engine.add_output(name, port.send_data)
+        bursts.append((name, target, BurstScheduler(
+            engine, rate, [name], selection, count, duration, jitter, tag_ids=tag_ids,
+            seed=None if seed is None else seed + index)))
+
+    # Start every reader in every worker at the same moment
+    time.sleep(max(0.0, start_at - time.time()))
+    started = time.time()
+    for _, _, burst in bursts:
+        burst.start()
+    for _, _, burst in bursts:
+        burst.wait()
+    finished = time.time()
+
+    for port in ports:
+        port.stop()
+    store.close()
+    return {
+        "pid": os.getpid(),
+        "started": started,
+        "finished": finished,
+        "scans": sum(burst.scans_sent for _, _, burst in bursts),
+        "errors": sum(burst.errors for _, _, burst in bursts),
+        "failed": failed,
+        "readers": [{"name": name, "target": target, "scans": burst.scans_sent,
+                     "errors": burst.errors, "rate": burst.scans_sent / max(finished - started, 1e-9)}
+                    for name, target, burst in bursts],
+        "metrics": metrics.REGISTRY.snapshot(),
+    }
+
+
+def _discard(payload: Payload) -> bool:
+    return True
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['readers']} readers on {report['workers']} workers: "
+        f"{report['scans']:,} scans in {report['elapsed']:.2f}s",
+        f"Rate: {report['achieved_rate']:,.0f}/s achieved of {report['target_rate']:,.0f}/s target",
+        f"Errors: {report['errors']}  Send failures: {report['send_failures']:.0f}  "
+        f"Bytes written: {report['bytes_written']:,.0f}",
+    ]
+    for reader in report["failed_readers"]:
+        lines.append(f"  {reader['name']:>10} {reader['target']:20s} FAILED to open")
+    for reader in report["per_reader"]:
+        p99 = reader["send_p99_ms"]
+        lines.append(f"  {reader['name']:>10} {reader['target']:20s} {reader['rate']:>10,.0f}/s  "
+                     f"errors {reader['errors']}  send p99 " + (f"<= {p99:.2f} ms" if p99 is not None else "n/a"))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drive many simulated NFC readers across processes")
+    parser.add_argument("--targets", nargs="+", required=True,
+                        help=f"serial ports, one reader each ('{NULL_TARGET}' encodes without sending)")
+    parser.add_argument("--rate", type=float, default=100.0, help="scans per second per reader")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--count", type=int, help="scans per reader")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    parser.add_argument("--tags", default=DEFAULT_TAGS_FILE, help="tag store to read tags from")
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--encoding", default=ENCODING_UID_HEX, choices=sorted(ENCODERS))
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--coalesce-ms", type=float,
+                        help="coalesce serial writes, holding a scan at most this many milliseconds")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = run_load(args.targets, rate=args.rate, duration=args.duration, count=args.count,
+                      workers=args.workers, tags_path=args.tags, baudrate=args.baudrate,
+                      encoding=args.encoding, seed=args.seed,
+                      max_latency=None if args.coalesce_ms is None else args.coalesce_ms / 1000)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    if report["failed_readers"]:
+        sys.exit(f"{len(report['failed_readers'])} of {report['readers']} readers failed to open their target")
+
+
+if __name__ == "__main__":
+    main()
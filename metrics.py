@@ -0,0 +1,266 @@
+"""Lightweight counters, gauges and latency histograms for soak tests.
+
+Instrumentation is off by default.  Call sites guard their updates with
+``if metrics.ENABLED:`` so a disabled build only pays for one global lookup
+per hot-path call.  ``MetricsServer`` serves the registry as Prometheus text
+on localhost.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+ENABLED = False
+
+# Latency buckets in seconds, from 10 us to 10 s
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+
+def enable():
+    global ENABLED
+    ENABLED = True
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def _escape_label(value: str) -> str:
+    """A label value escaped for the text exposition format (e.g. Windows ports like \\\\.\\COM10)"""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, *label_values: str):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values: str) -> float:
+        return self._values.get(label_values, 0)
+
+    def total(self) -> float:
+        return sum(self._values.values())
+
+    def snapshot(self) -> dict:
+        return dict(self._values)
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for values, value in snapshot.items():
+                self._values[values] = self._values.get(values, 0) + value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for values, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        super().__init__(name, help_text, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, *label_values: str):
+        self._values[label_values] = value
+
+    def set_function(self, function: Callable[[], float], *label_values: str):
+        """Read the gauge from ``function`` at scrape time"""
+        self._functions[label_values] = function
+
+    def value(self, *label_values: str) -> float:
+        function = self._functions.get(label_values)
+        return function() if function else self._values.get(label_values, 0)
+
+    def snapshot(self) -> dict:
+        return {values: self.value(*values) for values in set(self._values) | set(self._functions)}
+
+    def merge(self, snapshot: dict):
+        # Gauges from several processes (e.g. queue depths) are summed
+        for values, value in snapshot.items():
+            self._values[values] = self._values.get(values, 0) + value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for values in sorted(set(self._values) | set(self._functions)):
+            lines.append(f"{self.name}{_format_labels(self.label_names, values)} {self.value(*values)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *label_values: str) -> int:
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def snapshot(self) -> dict:
+        return {values: (list(counts), total, count) for values, (counts, total, count) in self._series.items()}
+
+    def merge(self, snapshot: dict):
+        with self._lock:
+            for values, (counts, total, count) in snapshot.items():
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                series[0] = [a + b for a, b in zip(series[0], counts)]
+                series[1] += total
+                series[2] += count
+
+    def quantile(self, q: float, *label_values: str) -> Optional[float]:
+        """Upper bucket bound containing the q-th quantile"""
+        series = self._series.get(label_values)
+        if not series or not series[2]:
+            return None
+        target = q * series[2]
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), series[0]):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for values, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.label_names, values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, values)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict[str, dict]:
+        """Picklable copy of every metric's values, e.g. to send from a worker process"""
+        return {metric.name: metric.snapshot() for metric in self.metrics}
+
+    def merge(self, snapshot: Dict[str, dict]):
+        """Add the values from another registry's snapshot to these metrics"""
+        for metric in self.metrics:
+            if metric.name in snapshot:
+                metric.merge(snapshot[metric.name])
+
+
+REGISTRY = Registry()
+
+SCANS_EMITTED = Counter("nfc_scans_emitted_total", "Tag scans emitted to an output", ["output"])
+BYTES_WRITTEN = Counter("nfc_serial_bytes_written_total", "Bytes written to a serial port", ["port"])
+SEND_FAILURES = Counter("nfc_serial_send_failures_total", "Failed serial send_data calls", ["port"])
+LINES_READ = Counter("nfc_serial_lines_read_total", "Lines framed by the serial read loop", ["port"])
+QUEUE_DEPTH = Gauge("nfc_send_queue_depth", "Jobs waiting in the send pipeline")
+STORE_WRITE_SECONDS = Histogram("nfc_store_write_seconds", "Time spent persisting tag changes", ["op"])
+SEND_SECONDS = Histogram("nfc_serial_send_seconds", "Time spent in serial send_data", ["port"])
+SERIAL_BATCH_FRAMES = Histogram("nfc_serial_batch_frames", "Frames coalesced into one serial write", ["port"],
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024))
+COMMANDS_HANDLED = Counter("nfc_reader_commands_total", "Host commands answered by the reader protocol", ["command"])
+RESPONSE_SECONDS = Histogram("nfc_reader_response_seconds", "Time from a host command line to its response", ["port"])
+ANTICOLLISION_ROUNDS = Counter("nfc_anticollision_rounds_total", "Anticollision rounds that found a collision")
+TAGS_IN_FIELD = Gauge("nfc_tags_in_field", "Tags present in the simulated RF field")
+
+
+class MetricsServer:
+    """Serve the registry as Prometheus text at http://host:port/metrics"""
+
+    def __init__(self, port: int = 9464, host: str = "127.0.0.1"):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self._server:
+            return
+        # http.server pulls in ssl, email and http.client, so it is only
+        # imported once metrics are actually served
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = REGISTRY.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
@@ -1,15 +1,29 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, scrolledtext, BooleanVar, StringVar
+from tkinter import ttk, messagebox, scrolledtext, filedialog, simpledialog, BooleanVar, StringVar
 import json
 import os
-import uuid
+import queue
+from collections import OrderedDict
 import threading
 import time
-from datetime import datetime
+
+import metrics
+
+from simulator_core import SimulatorEngine, OUTPUT_KEYBOARD, OUTPUT_SERIAL
+from send_pipeline import SendPipeline
+from tag_list_view import VirtualListbox
+from tag_record import as_dict
+from tag_encoders import ENCODERS, ENCODING_JSON_PRETTY, ENCODING_UID_HEX
+from burst_scheduler import BurstScheduler, SELECT_SEQUENCE, SELECT_RANDOM, SELECT_WEIGHTED
+from scan_trace import TraceReader, TraceRecorder, TraceReplayer
+from reader_protocol import ReaderProtocol
+from rf_field import RFField
+from tag_fleet import generate_tags
+from tag_memory import MemoryImageStore
 
 # Import the virtual input module
 try:
-    from virtual_input import start_virtual_input, stop_virtual_input, send_nfc_data, virtual_input
+    from virtual_input import start_virtual_input, stop_virtual_input, virtual_input, set_keyboard_wedge
     VIRTUAL_INPUT_AVAILABLE = True
 except ImportError as e:
     print(f"Virtual input not available: {e}")
@@ -29,15 +43,65 @@ except ImportError as e:
     print(f"Serial port functionality not available: {e}")
     SERIAL_AVAILABLE = False
 
+# Simulated reader devices on pseudo-terminals (POSIX only)
+try:
+    from pty_readers import PtyReaderDevices, DEFAULT_LINK_DIR
+    PTY_READERS_AVAILABLE = True
+except ImportError as e:
+    print(f"Pty reader devices not available: {e}")
+    PTY_READERS_AVAILABLE = False
+
+# Rendered editor text kept for recently viewed tags
+EDITOR_CACHE_SIZE = 32
+# Editor text beyond this many characters is inserted in chunks from the event loop
+EDITOR_CHUNK_CHARS = 64 * 1024
+# Editor key holding the decoded view of the tag's chip memory (not written back)
+MEMORY_VIEW_KEY = "chip_memory"
+# File dialog choices for bulk import and export (see tag_bulk)
+BULK_FILE_TYPES = [
+    ("JSON Lines", "*.jsonl"),
+    ("CSV", "*.csv"),
+    ("Columnar tag files", "*.nfccol"),
+    ("All files", "*.*"),
+]
+
 class NFCSimulator:
     def __init__(self, root):
         self.root = root
         self.root.title("NFC Simulator")
         self.root.geometry("800x600")
         
-        # Initialize tag database
-        self.tags = {}
+        # Initialize tag database; tag bodies are parsed only when used, and
+        # each tag's emulated chip memory is kept in a memory-mapped file
+        self.engine = SimulatorEngine(lazy=True, memory=MemoryImageStore())
+        self.tags = self.engine.tags
+        
+        # Background send pipeline; results are handed back to the Tk thread
+        # through ui_events and drained by process_ui_events
+        self.send_pipeline = SendPipeline(self.engine)
+        self.ui_events = queue.Queue()
+        self.burst = None
+        self.metrics_server = None
+        self.trace_recorder = None
+        self.trace_replayer = None
+        self.pty_devices = None
+        # Tag editor state: rendered JSON per tag (dropped when the tag changes),
+        # the tag whose text is in the editor and any chunked insert in progress
+        self._editor_cache = OrderedDict()
+        self._editor_shown = None
+        self._editor_render = None
+        # Editor state belongs to the Tk thread; other threads post changes through ui_events
+        self._tk_thread = threading.get_ident()
+        self.engine.add_change_listener(self._on_tag_changed)
+        
+        # Answers host commands (POLL, UID, READ, WRITE) received on the serial port
+        self.reader_protocol = ReaderProtocol(
+            self.engine, on_write=lambda tag_id: self.ui_events.put(lambda: self._on_host_write(tag_id)),
+            on_memory_change=lambda tag_id: self.ui_events.put(lambda: self._drop_editor_text(tag_id)))
+        # Tags placed in the simulated reader's field, inventoried together
+        self.field = RFField(self.engine)
         self.current_tag = None
+        self.filtered_tags = None  # Tag IDs matching the search box, or None for all tags
         self.simulate_reading = False
         
         # Virtual input state
@@ -68,12 +132,14 @@ class NFCSimulator:
         # Create main frames
         self.setup_ui()
         
-        # Load existing tags if available
-        self.load_tags()
+        # Load existing tags in the background once the window is up
+        self.root.after(0, self.load_tags)
         
         # Initialize serial port tab if available
         if SERIAL_AVAILABLE:
             self.setup_serial_tab()
+        
+        self.process_ui_events()
     
     def setup_ui(self):
         # Left panel - Tag management
@@ -88,18 +154,48 @@ class NFCSimulator:
         self.right_panel.grid_rowconfigure(1, weight=1)
         
         # Left panel widgets
-        self.tag_listbox = tk.Listbox(self.left_panel, height=15, width=30)
-        self.tag_listbox.grid(row=0, column=0, sticky="nsew", pady=(0, 10))
-        self.tag_listbox.bind('<<ListboxSelect>>', self.on_tag_select)
+        search_frame = ttk.Frame(self.left_panel)
+        search_frame.grid(row=0, column=0, sticky="ew", pady=(0, 5))
+        search_frame.grid_columnconfigure(0, weight=1)
+        
+        self.search_var = StringVar()
+        search_entry = ttk.Entry(search_frame, textvariable=self.search_var)
+        search_entry.grid(row=0, column=0, sticky="ew")
+        search_entry.bind('<KeyRelease>', lambda e: self.apply_tag_filter())
         
-        # Scrollbar for tag list
-        scrollbar = ttk.Scrollbar(self.left_panel, orient="vertical", command=self.tag_listbox.yview)
-        scrollbar.grid(row=0, column=1, sticky="ns")
-        self.tag_listbox.configure(yscrollcommand=scrollbar.set)
+        self.search_mode_var = StringVar(value="ID prefix")
+        search_mode = ttk.Combobox(
+            search_frame,
+            textvariable=self.search_mode_var,
+            values=["ID prefix", "Content", "Modified since"],
+            width=13,
+            state='readonly'
+        )
+        search_mode.grid(row=0, column=1, padx=(5, 0))
+        search_mode.bind('<<ComboboxSelected>>', lambda e: self.apply_tag_filter())
+        
+        # Only the visible rows are rendered, so the list stays fast for large stores
+        self.tag_listbox = VirtualListbox(
+            self.left_panel,
+            row_count=self._list_count,
+            row_text=self._list_row_text,
+            on_select=self.on_tag_select,
+            height=15,
+            width=30
+        )
+        self.tag_listbox.grid(row=1, column=0, sticky="nsew", pady=(0, 10))
         
         # Tag controls
-        ttk.Button(self.left_panel, text="New Tag", command=self.create_new_tag).grid(row=1, column=0, sticky="ew", pady=2)
-        ttk.Button(self.left_panel, text="Delete Tag", command=self.delete_tag).grid(row=2, column=0, sticky="ew", pady=2)
+        ttk.Button(self.left_panel, text="New Tag", command=self.create_new_tag).grid(row=2, column=0, sticky="ew", pady=2)
+        ttk.Button(self.left_panel, text="Delete Tag", command=self.delete_tag).grid(row=3, column=0, sticky="ew", pady=2)
+        # Disabled while a bulk transfer runs in the background
+        self.bulk_buttons = [
+            ttk.Button(self.left_panel, text="Import Tags...", command=self.import_tags),
+            ttk.Button(self.left_panel, text="Export Tags...", command=self.export_tags),
+            ttk.Button(self.left_panel, text="Generate Tags...", command=self.generate_tags),
+        ]
+        for row, button in enumerate(self.bulk_buttons, 4):
+            button.grid(row=row, column=0, sticky="ew", pady=2)
         
         # Tag data editor
         self.tag_data_label = ttk.Label(self.right_panel, text="Tag Data (JSON):")
@@ -115,6 +211,19 @@ class NFCSimulator:
         ttk.Button(button_frame, text="Simulate Read", command=self.simulate_read).grid(row=0, column=0, padx=5, sticky='e')
         ttk.Button(button_frame, text="Simulate Write", command=self.simulate_write).grid(row=0, column=1, padx=5, sticky='e')
         
+        # Multi-tag field controls
+        field_frame = ttk.LabelFrame(self.right_panel, text="RF Field", padding=5)
+        field_frame.grid(row=3, column=0, sticky="ew", pady=(0, 10))
+        
+        ttk.Button(field_frame, text="Add to Field", command=self.add_to_field).grid(row=0, column=0, padx=5)
+        ttk.Button(field_frame, text="Add All Listed", command=self.add_listed_to_field).grid(row=0, column=1, padx=5)
+        ttk.Button(field_frame, text="Clear Field", command=self.clear_field).grid(row=0, column=2, padx=5)
+        ttk.Button(field_frame, text="Inventory", command=self.inventory_field).grid(row=0, column=3, padx=5)
+        
+        self.field_status_var = StringVar(value="Field: empty")
+        ttk.Label(field_frame, textvariable=self.field_status_var).grid(
+            row=1, column=0, columnspan=4, sticky='w', padx=5, pady=(5, 0))
+        
         # Virtual input controls
         if VIRTUAL_INPUT_AVAILABLE:
             self.virtual_input_frame = ttk.LabelFrame(self.tab_simulator, text="Virtual Input Device", padding=5)
@@ -140,6 +249,16 @@ class NFCSimulator:
             )
             self.virtual_input_status.grid(row=1, column=0, sticky='w')
             
+            # Type UIDs directly like a USB HID reader instead of pasting JSON
+            self.wedge = None
+            self.wedge_mode_var = BooleanVar(value=False)
+            ttk.Checkbutton(
+                input_left,
+                text="HID Wedge Mode (UID)",
+                variable=self.wedge_mode_var,
+                command=self.toggle_wedge_mode
+            ).grid(row=2, column=0, sticky='w')
+            
             # Right side: Buttons
             input_right = ttk.Frame(self.virtual_input_frame)
             input_right.grid(row=0, column=1, sticky='ne', padx=5)
@@ -171,12 +290,94 @@ class NFCSimulator:
             # Start with virtual input disabled
             self.virtual_input_enabled.set(False)
         
+        self.setup_burst_controls()
+        
         # Status bar
         self.status_var = tk.StringVar()
         self.status_var.set("Ready")
         status_bar = ttk.Label(self.root, textvariable=self.status_var, relief='sunken', anchor='w')
         status_bar.grid(row=1, column=0, sticky='ew')
         
+    def setup_burst_controls(self):
+        """Set up the burst read controls on the simulator tab"""
+        burst_frame = ttk.LabelFrame(self.tab_simulator, text="Burst Read", padding=5)
+        burst_frame.grid(row=1, column=0, columnspan=2, sticky='ew', padx=5, pady=5)
+        
+        ttk.Label(burst_frame, text="Rate (scans/s):").grid(row=0, column=0, sticky='w', padx=5)
+        self.burst_rate_var = StringVar(value="10")
+        ttk.Entry(burst_frame, textvariable=self.burst_rate_var, width=8).grid(row=0, column=1, sticky='w')
+        
+        ttk.Label(burst_frame, text="Count:").grid(row=0, column=2, sticky='w', padx=5)
+        self.burst_count_var = StringVar(value="100")
+        ttk.Entry(burst_frame, textvariable=self.burst_count_var, width=8).grid(row=0, column=3, sticky='w')
+        
+        ttk.Label(burst_frame, text="Order:").grid(row=0, column=4, sticky='w', padx=5)
+        self.burst_mode_var = StringVar(value=SELECT_SEQUENCE)
+        ttk.Combobox(
+            burst_frame,
+            textvariable=self.burst_mode_var,
+            values=[SELECT_SEQUENCE, SELECT_RANDOM, SELECT_WEIGHTED],
+            width=10,
+            state='readonly'
+        ).grid(row=0, column=5, sticky='w')
+        
+        self.burst_serial_var = BooleanVar(value=True)
+        ttk.Checkbutton(burst_frame, text="Serial", variable=self.burst_serial_var).grid(row=1, column=0, sticky='w', padx=5)
+        self.burst_keyboard_var = BooleanVar(value=False)
+        ttk.Checkbutton(burst_frame, text="Keyboard", variable=self.burst_keyboard_var).grid(row=1, column=1, sticky='w')
+        
+        self.btn_burst = ttk.Button(burst_frame, text="Start Burst", command=self.toggle_burst, width=15)
+        self.btn_burst.grid(row=1, column=4, columnspan=2, sticky='e', pady=2)
+        
+        self.burst_status_var = StringVar(value="Idle")
+        ttk.Label(burst_frame, textvariable=self.burst_status_var).grid(row=2, column=0, columnspan=6, sticky='w', padx=5)
+    
+    def toggle_burst(self):
+        """Start or stop a burst read"""
+        if self.burst and self.burst.running:
+            self.burst.stop()
+            return
+        
+        try:
+            rate = float(self.burst_rate_var.get())
+            count = int(self.burst_count_var.get()) if self.burst_count_var.get().strip() else None
+        except ValueError:
+            messagebox.showerror("Invalid Burst Settings", "Rate and count must be numbers.")
+            return
+        
+        outputs = []
+        if self.burst_serial_var.get() and SERIAL_AVAILABLE and self.btn_connect['text'] == "Disconnect":
+            outputs.append(OUTPUT_SERIAL)
+        if self.burst_keyboard_var.get() and VIRTUAL_INPUT_AVAILABLE and self.virtual_input_enabled.get():
+            outputs.append(OUTPUT_KEYBOARD)
+        
+        try:
+            self.burst = BurstScheduler(
+                self.engine,
+                rate=rate,
+                count=count,
+                outputs=outputs,
+                selection=self.burst_mode_var.get()
+            )
+        except ValueError as e:
+            messagebox.showerror("Invalid Burst Settings", str(e))
+            return
+        self.burst.start()
+        self.btn_burst.config(text="Stop Burst")
+        self.update_burst_status()
+    
+    def update_burst_status(self):
+        """Refresh the burst rate display while a burst runs"""
+        burst = self.burst
+        self.burst_status_var.set(
+            f"Sent {burst.scans_sent} scans - {burst.achieved_rate:.1f}/s "
+            f"(avg {burst.average_rate:.1f}/s, {burst.errors} errors)"
+        )
+        if burst.running:
+            self.root.after(250, self.update_burst_status)
+        else:
+            self.btn_burst.config(text="Start Burst")
+    
     def setup_serial_tab(self):
         """Set up the serial port configuration tab"""
         # Port selection
@@ -246,44 +447,325 @@ class NFCSimulator:
             variable=self.auto_send_var
         ).grid(row=0, column=1, padx=5)
         
+        # Wire format used for tags sent over serial
+        ttk.Label(button_frame, text="Format:").grid(row=0, column=2, padx=(10, 2))
+        self.serial_format_var = StringVar(value=ENCODING_JSON_PRETTY)
+        format_combobox = ttk.Combobox(
+            button_frame,
+            textvariable=self.serial_format_var,
+            values=list(ENCODERS),
+            width=12,
+            state='readonly'
+        )
+        format_combobox.grid(row=0, column=3, padx=5)
+        format_combobox.bind(
+            '<<ComboboxSelected>>',
+            lambda e: self.engine.set_output_encoding(OUTPUT_SERIAL, self.serial_format_var.get())
+        )
+        
+        self.setup_metrics_panel()
+        self.setup_trace_panel()
+        if PTY_READERS_AVAILABLE:
+            self.setup_pty_panel()
+        set_serial_callback(self.handle_serial_line)
+        
         # Configure tab grid weights
         self.tab_serial.grid_rowconfigure(0, weight=0)
-        self.tab_serial.grid_rowconfigure(1, weight=1)
+        self.tab_serial.grid_rowconfigure(1, weight=0)
+        self.tab_serial.grid_rowconfigure(2, weight=0)
+        self.tab_serial.grid_rowconfigure(3, weight=0)
+        self.tab_serial.grid_rowconfigure(4, weight=1)
         self.tab_serial.grid_columnconfigure(0, weight=1)
         
         # Initial refresh of ports
         self.refresh_serial_ports()
     
-    def on_tag_select(self, event):
+    def setup_metrics_panel(self):
+        """Set up the live metrics panel on the serial tab"""
+        metrics_frame = ttk.LabelFrame(self.tab_serial, text="Metrics", padding=5)
+        metrics_frame.grid(row=2, column=0, sticky='new', padx=5, pady=5)
+        
+        self.metrics_enabled_var = BooleanVar(value=metrics.ENABLED)
+        ttk.Checkbutton(
+            metrics_frame,
+            text="Collect Metrics",
+            variable=self.metrics_enabled_var,
+            command=self.toggle_metrics
+        ).grid(row=0, column=0, sticky='w', padx=5)
+        
+        self.metrics_serve_var = BooleanVar(value=False)
+        ttk.Checkbutton(
+            metrics_frame,
+            text="Serve on 127.0.0.1:9464/metrics",
+            variable=self.metrics_serve_var,
+            command=self.toggle_metrics_server
+        ).grid(row=0, column=1, sticky='w', padx=5)
+        
+        self.metrics_text_var = StringVar(value="Metrics collection is off")
+        ttk.Label(metrics_frame, textvariable=self.metrics_text_var, justify='left').grid(
+            row=1, column=0, columnspan=2, sticky='w', padx=5, pady=(5, 0))
+        self._metrics_last = None
+    
+    def toggle_metrics(self):
+        """Turn hot-path instrumentation on or off"""
+        if self.metrics_enabled_var.get():
+            metrics.enable()
+            self._metrics_last = None
+            self.update_metrics_panel()
+        else:
+            metrics.disable()
+            self.metrics_text_var.set("Metrics collection is off")
+    
+    def toggle_metrics_server(self):
+        """Start or stop the Prometheus endpoint"""
+        if self.metrics_serve_var.get():
+            try:
+                self.metrics_server = metrics.MetricsServer()
+                self.metrics_server.start()
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to start metrics server: {e}")
+                self.metrics_serve_var.set(False)
+                self.metrics_server = None
+        elif self.metrics_server:
+            self.metrics_server.stop()
+            self.metrics_server = None
+    
+    def setup_trace_panel(self):
+        """Set up scan trace recording and replay on the serial tab"""
+        trace_frame = ttk.LabelFrame(self.tab_serial, text="Scan Trace", padding=5)
+        trace_frame.grid(row=3, column=0, sticky='new', padx=5, pady=5)
+        
+        self.trace_record_var = BooleanVar(value=False)
+        ttk.Checkbutton(
+            trace_frame,
+            text="Record Trace",
+            variable=self.trace_record_var,
+            command=self.toggle_trace_recording
+        ).grid(row=0, column=0, sticky='w', padx=5)
+        
+        ttk.Label(trace_frame, text="Replay speed:").grid(row=0, column=1, padx=(10, 2))
+        self.trace_speed_var = StringVar(value="1x")
+        ttk.Combobox(
+            trace_frame,
+            textvariable=self.trace_speed_var,
+            values=["1x", "2x", "10x", "Max"],
+            width=6,
+            state='readonly'
+        ).grid(row=0, column=2, padx=5)
+        
+        self.btn_replay = ttk.Button(trace_frame, text="Replay Trace...", command=self.toggle_trace_replay)
+        self.btn_replay.grid(row=0, column=3, padx=5)
+        
+        self.trace_status_var = StringVar(value="Not recording")
+        ttk.Label(trace_frame, textvariable=self.trace_status_var).grid(
+            row=1, column=0, columnspan=4, sticky='w', padx=5, pady=(5, 0))
+    
+    def setup_pty_panel(self):
+        """Set up simulated reader devices on pseudo-terminals on the serial tab"""
+        pty_frame = ttk.LabelFrame(self.tab_serial, text="Pty Reader Devices", padding=5)
+        pty_frame.grid(row=4, column=0, sticky='new', padx=5, pady=5)
+        
+        ttk.Label(pty_frame, text="Readers:").grid(row=0, column=0, padx=(5, 2))
+        self.pty_count_var = StringVar(value="1")
+        ttk.Spinbox(pty_frame, from_=1, to=1000, textvariable=self.pty_count_var, width=6).grid(
+            row=0, column=1, padx=5)
+        
+        self.btn_pty = ttk.Button(pty_frame, text="Create Readers", command=self.toggle_pty_readers)
+        self.btn_pty.grid(row=0, column=2, padx=5)
+        
+        self.pty_status_var = StringVar(value=f"Applications open the devices in {DEFAULT_LINK_DIR}")
+        ttk.Label(pty_frame, textvariable=self.pty_status_var).grid(
+            row=1, column=0, columnspan=3, sticky='w', padx=5, pady=(5, 0))
+    
+    def toggle_pty_readers(self):
+        """Create pty reader devices answering from the tag store, or remove them"""
+        if self.pty_devices:
+            self.close_pty_readers()
+            self.btn_pty.config(text="Create Readers")
+            self.pty_status_var.set(f"Applications open the devices in {DEFAULT_LINK_DIR}")
+            return
+        try:
+            count = int(self.pty_count_var.get())
+            if count < 1:
+                raise ValueError
+        except ValueError:
+            messagebox.showerror("Error", "Number of readers must be a positive whole number")
+            return
+        devices = PtyReaderDevices()
+        self.reader_protocol.attach_manager(devices.manager)
+        try:
+            links = devices.create(count, list(self.engine.tags))
+        except OSError as e:
+            devices.manager.stop()
+            devices.close()
+            messagebox.showerror("Error", f"Failed to create reader devices: {e}")
+            return
+        # Each reader has the first tag of its share in its field
+        for name, managed in devices.manager.ports.items():
+            self.reader_protocol.present(managed.next_tag(), name)
+        self.pty_devices = devices
+        self.btn_pty.config(text="Remove Readers")
+        self.pty_status_var.set(f"{len(links)} readers: {links[0]}" + (f" to {links[-1]}" if len(links) > 1 else ""))
+    
+    def close_pty_readers(self):
+        """Close the pty reader devices and remove their links"""
+        devices, self.pty_devices = self.pty_devices, None
+        if devices is None:
+            return
+        for name in devices.links:
+            self.reader_protocol.present(None, name)
+        devices.manager.stop()
+        devices.close()
+    
+    def toggle_trace_recording(self):
+        """Start or stop recording emitted scans and received serial lines"""
+        if self.trace_record_var.get():
+            path = filedialog.asksaveasfilename(
+                defaultextension=".nfctrace",
+                filetypes=[("Scan traces", "*.nfctrace"), ("All files", "*.*")]
+            )
+            if not path:
+                self.trace_record_var.set(False)
+                return
+            try:
+                self.trace_recorder = TraceRecorder(path)
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to create trace file: {e}")
+                self.trace_record_var.set(False)
+                return
+            self.engine.recorder = self.trace_recorder
+            set_serial_callback(self.trace_recorder.line_callback(forward=self.handle_serial_line))
+            self.trace_status_var.set(f"Recording to {os.path.basename(path)}")
+        elif self.trace_recorder:
+            self.engine.recorder = None
+            set_serial_callback(self.handle_serial_line)
+            events = self.trace_recorder.events
+            self.trace_recorder.close()
+            self.trace_recorder = None
+            self.trace_status_var.set(f"Recorded {events} events")
+    
+    def toggle_trace_replay(self):
+        """Replay a recorded trace through the outputs, or stop the active replay"""
+        if self.trace_replayer and self.trace_replayer.running:
+            self.trace_replayer.stop()
+            return
+        path = filedialog.askopenfilename(filetypes=[("Scan traces", "*.nfctrace"), ("All files", "*.*")])
+        if not path:
+            return
+        try:
+            TraceReader(path).close()
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to open trace: {e}")
+            return
+        speed_text = self.trace_speed_var.get()
+        speed = 0.0 if speed_text == "Max" else float(speed_text.rstrip("x"))
+        self.trace_replayer = TraceReplayer(self.engine, path, speed)
+        self.trace_replayer.start()
+        self.btn_replay.config(text="Stop Replay")
+        self.update_trace_status()
+    
+    def update_trace_status(self):
+        """Show replay progress while a replay is running"""
+        replayer = self.trace_replayer
+        if replayer is None:
+            return
+        if replayer.running:
+            self.trace_status_var.set(f"Replaying: {replayer.events_replayed} events sent")
+            self.root.after(250, self.update_trace_status)
+            return
+        self.btn_replay.config(text="Replay Trace...")
+        self.trace_status_var.set(
+            f"Replayed {replayer.events_replayed} events, {replayer.errors} errors, "
+            f"max lag {replayer.max_lag * 1000:.2f} ms"
+        )
+    
+    def update_metrics_panel(self):
+        """Refresh the metrics summary once a second while collection is on"""
+        if not metrics.ENABLED:
+            return
+        now = time.monotonic()
+        lines_read = metrics.LINES_READ.total()
+        scans = metrics.SCANS_EMITTED.total()
+        lines_rate = scan_rate = 0.0
+        if self._metrics_last:
+            last_time, last_lines, last_scans = self._metrics_last
+            elapsed = max(now - last_time, 1e-9)
+            lines_rate = (lines_read - last_lines) / elapsed
+            scan_rate = (scans - last_scans) / elapsed
+        self._metrics_last = (now, lines_read, scans)
+        
+        store_p99 = metrics.STORE_WRITE_SECONDS.quantile(0.99, "append")
+        self.metrics_text_var.set(
+            f"Scans emitted: {scans:.0f} ({scan_rate:.1f}/s)\n"
+            f"Serial bytes written: {metrics.BYTES_WRITTEN.total():.0f}  "
+            f"send failures: {metrics.SEND_FAILURES.total():.0f}\n"
+            f"Lines read: {lines_read:.0f} ({lines_rate:.1f}/s)\n"
+            f"Send queue depth: {metrics.QUEUE_DEPTH.value():.0f}\n"
+            f"Store write p99: " + (f"<= {store_p99 * 1000:.2f} ms" if store_p99 is not None else "n/a")
+        )
+        self.root.after(1000, self.update_metrics_panel)
+    
+    def on_tag_select(self, position):
         """Handle tag selection from the list"""
-        selection = self.tag_listbox.curselection()
-        if selection:
-            self.current_tag = list(self.tags.keys())[selection[0]]
-            self.update_tag_editor()
+        self.current_tag = self._list_tag_id(position)
+        self.update_tag_editor()
+    
+    def _list_count(self):
+        """Number of rows in the tag list"""
+        if self.filtered_tags is not None:
+            return len(self.filtered_tags)
+        return len(self.engine.index)
+    
+    def _list_tag_id(self, position):
+        """Tag ID shown at a row of the tag list"""
+        if self.filtered_tags is not None:
+            return self.filtered_tags[position]
+        return self.engine.index.id_at(position)
+    
+    def _list_position(self, tag_id):
+        """Row of a tag in the tag list, or None if it is not shown"""
+        if self.filtered_tags is not None:
+            try:
+                return self.filtered_tags.index(tag_id)
+            except ValueError:
+                return None
+        if tag_id in self.engine.index:
+            return self.engine.index.position_of(tag_id)
+        return None
+    
+    def _list_row_text(self, position):
+        """Display text for a row of the tag list"""
+        tag_id = self._list_tag_id(position)
+        return f"{tag_id[:8]}... - {self.engine.index.modified_of(tag_id)[:19]}"
+    
+    def apply_tag_filter(self):
+        """Filter the tag list using the search box"""
+        query = self.search_var.get().strip()
+        mode = self.search_mode_var.get()
+        if not query:
+            self.filtered_tags = None
+        elif mode == "Content":
+            self.filtered_tags = self.engine.index.find_content(query)
+        elif mode == "Modified since":
+            self.filtered_tags = self.engine.index.find_modified(query)
+        else:
+            self.filtered_tags = self.engine.index.find_prefix(query)
+        self.update_tag_list()
     
     def create_new_tag(self):
         """Create a new virtual NFC tag"""
-        tag_id = str(uuid.uuid4())
-        tag_data = {
-            "id": tag_id,
-            "created_at": datetime.now().isoformat(),
-            "last_modified": datetime.now().isoformat(),
-            "data": {
-                "type": "virtual_nfc_tag",
-                "version": "1.0",
-                "content": "Sample NFC Tag Data"
-            }
-        }
-        self.tags[tag_id] = tag_data
+        try:
+            tag_id = self.engine.create_tag()
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save tags: {str(e)}")
+            return
         self.current_tag = tag_id
+        # Show the new tag even if it does not match the current search
+        self.search_var.set("")
+        self.filtered_tags = None
         self.update_tag_list()
         self.update_tag_editor()
-        self.save_tags()
         self.status_var.set(f"Created new tag: {tag_id[:8]}...")
-        # Select the new tag in the list
-        self.tag_listbox.selection_clear(0, tk.END)
-        self.tag_listbox.selection_set(len(self.tags) - 1)
-        self.tag_listbox.see(len(self.tags) - 1)
     
     def delete_tag(self):
         """Delete the currently selected tag"""
@@ -292,38 +774,205 @@ class NFCSimulator:
             return
             
         if messagebox.askyesno("Confirm Delete", "Are you sure you want to delete this tag?"):
-            del self.tags[self.current_tag]
-            self.current_tag = next(iter(self.tags.keys()), None) if self.tags else None
-            self.save_tags()
+            try:
+                self.engine.delete_tag(self.current_tag)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to save tags: {str(e)}")
+                return
+            deleted = self.current_tag
+            position = self.tag_listbox.selected or 0
+            if self.filtered_tags is not None and deleted in self.filtered_tags:
+                self.filtered_tags.remove(deleted)
+            # Select the row that took the deleted tag's place
+            count = self._list_count()
+            self.current_tag = self._list_tag_id(min(position, count - 1)) if count else None
             self.update_tag_list()
             self.update_tag_editor()
+            self.update_field_status()
             self.status_var.set("Tag deleted")
     
+    def import_tags(self):
+        """Bulk import tags from a JSON Lines, CSV or columnar file"""
+        path = filedialog.askopenfilename(filetypes=BULK_FILE_TYPES)
+        if not path:
+            return
+        self._run_bulk(
+            "Importing",
+            lambda progress: self.engine.import_tags(path, progress=progress),
+            lambda count: self._bulk_added(f"Imported {count:,} tags"),
+            "Failed to import tags", "Import failed")
+    
+    def export_tags(self):
+        """Bulk export all tags to a JSON Lines, CSV or columnar file"""
+        path = filedialog.asksaveasfilename(defaultextension=".jsonl", filetypes=BULK_FILE_TYPES)
+        if not path:
+            return
+        self._run_bulk(
+            "Exporting",
+            lambda progress: self.engine.export_tags(path, progress=progress),
+            lambda count: self.status_var.set(f"Exported {count:,} tags to {os.path.basename(path)}"),
+            "Failed to export tags", "Export failed")
+    
+    def generate_tags(self):
+        """Add a synthetic fleet of tags (see tag_fleet) in one store commit"""
+        count = simpledialog.askinteger("Generate Tags", "Number of tags to generate:",
+                                        parent=self.root, initialvalue=1000, minvalue=1)
+        if not count:
+            return
+        self._run_bulk(
+            "Generating",
+            lambda progress: self.engine.add_tags(generate_tags(count, progress=progress)),
+            lambda added: self._bulk_added(f"Generated {added:,} tags"),
+            "Failed to generate tags", "Generation failed")
+    
+    def _run_bulk(self, action, work, on_done, error_title, error_status):
+        """Run ``work(progress)`` on a worker thread with the bulk buttons disabled
+        
+        Progress and the result are posted back through ui_events; ``on_done``
+        gets the result on the Tk thread.
+        """
+        def progress(count, fraction):
+            self.ui_events.put(lambda: self.status_var.set(f"{action} tags... {count:,} ({fraction:.0%})"))
+        
+        def run():
+            try:
+                result = work(progress)
+            except (OSError, ValueError) as e:
+                message = f"{error_title}: {str(e)}"
+                self.ui_events.put(lambda: self._bulk_failed(message, error_status))
+                return
+            self.ui_events.put(lambda: self._bulk_finished(on_done, result))
+        
+        for button in self.bulk_buttons:
+            button.config(state='disabled')
+        self.status_var.set(f"{action} tags...")
+        threading.Thread(target=run, daemon=True).start()
+    
+    def _bulk_finished(self, on_done, result):
+        for button in self.bulk_buttons:
+            button.config(state='normal')
+        on_done(result)
+    
+    def _bulk_failed(self, message, status):
+        for button in self.bulk_buttons:
+            button.config(state='normal')
+        messagebox.showerror("Error", message)
+        self.status_var.set(status)
+    
+    def _bulk_added(self, status):
+        """Show the tag list after tags were added in bulk"""
+        if self.current_tag not in self.tags:
+            self.current_tag = next(iter(self.tags), None)
+        self.apply_tag_filter()
+        self.update_tag_editor()
+        self.status_var.set(status)
+    
     def update_tag_list(self):
         """Update the tag list display"""
-        current_selection = self.tag_listbox.curselection()
-        current_selected = current_selection[0] if current_selection else None
-        
-        self.tag_listbox.delete(0, tk.END)
-        for tag_id in self.tags:
-            tag = self.tags[tag_id]
-            display_text = f"{tag_id[:8]}... - {tag['last_modified'][:19]}"
-            self.tag_listbox.insert(tk.END, display_text)
-        
-        # Restore selection if possible
-        if current_selected is not None and current_selected < len(self.tags):
-            self.tag_listbox.selection_set(current_selected)
-        elif self.tags:
-            self.tag_listbox.selection_set(0)
-            self.current_tag = list(self.tags.keys())[0]
+        position = self._list_position(self.current_tag) if self.current_tag else None
+        if position is not None:
+            self.tag_listbox.select(position)
+        elif self._list_count():
+            self.tag_listbox.select(0)
+            self.current_tag = self._list_tag_id(0)
+            self.update_tag_editor()
+        else:
+            self.tag_listbox.select(None)
+    
+    def handle_serial_line(self, line):
+        """Answer a host command received on the serial port (called on the read thread)"""
+        self.reader_protocol.handle_line(line, send_serial_data, OUTPUT_SERIAL)
+    
+    def _on_host_write(self, tag_id):
+        """Refresh the UI after the host wrote new content to a tag"""
+        self.tag_listbox.refresh()
+        if tag_id == self.current_tag:
             self.update_tag_editor()
+        self.status_var.set(f"Host wrote to tag: {tag_id[:8]}...")
     
     def update_tag_editor(self):
         """Update the tag editor with the current tag's data"""
+        # The selected tag is the one in the simulated reader's field
+        self.reader_protocol.present(self.current_tag)
+        tag_id = self.current_tag if self.current_tag and self.current_tag in self.tags else None
+        if tag_id is not None and tag_id == self._editor_shown:
+            # Already showing this version of the tag
+            return
+        self._cancel_editor_render()
         self.tag_data_text.delete("1.0", tk.END)
-        if self.current_tag and self.current_tag in self.tags:
-            tag_data = self.tags[self.current_tag]
-            self.tag_data_text.insert(tk.END, json.dumps(tag_data, indent=2))
+        self._editor_shown = tag_id
+        if tag_id is None:
+            return
+        text = self._editor_text(tag_id)
+        self.tag_data_text.insert(tk.END, text[:EDITOR_CHUNK_CHARS])
+        if len(text) > EDITOR_CHUNK_CHARS:
+            # Insert the rest a chunk at a time so large payloads don't freeze the UI
+            self._editor_render = [None, text, EDITOR_CHUNK_CHARS]
+            self._editor_render[0] = self.root.after(1, self._render_editor_chunk)
+    
+    def _editor_text(self, tag_id):
+        """Rendered JSON for a tag, with its decoded chip memory, cached until the tag changes"""
+        text = self._editor_cache.get(tag_id)
+        if text is not None:
+            self._editor_cache.move_to_end(tag_id)
+            return text
+        tag_data = as_dict(self.tags[tag_id])
+        memory = self.engine.memory.get(tag_id) if self.engine.memory is not None else None
+        if memory is not None and MEMORY_VIEW_KEY not in tag_data:
+            # A snapshot for reference: host writes and counter changes drop
+            # the cached text, so they show up once the tag is shown again
+            tag_data = dict(tag_data, **{MEMORY_VIEW_KEY: memory.decode()})
+        text = json.dumps(tag_data, indent=2)
+        self._editor_cache[tag_id] = text
+        if len(self._editor_cache) > EDITOR_CACHE_SIZE:
+            self._editor_cache.popitem(last=False)
+        return text
+    
+    def _render_editor_chunk(self):
+        """Insert the next chunk of a large tag into the editor"""
+        render = self._editor_render
+        if render is None:
+            return
+        _, text, position = render
+        self.tag_data_text.insert(tk.END, text[position:position + EDITOR_CHUNK_CHARS])
+        render[2] = position + EDITOR_CHUNK_CHARS
+        if render[2] < len(text):
+            render[0] = self.root.after(1, self._render_editor_chunk)
+        else:
+            self._editor_render = None
+    
+    def _finish_editor_render(self):
+        """Insert whatever is left of a chunked render right away"""
+        render = self._editor_render
+        if render is not None:
+            self.root.after_cancel(render[0])
+            self.tag_data_text.insert(tk.END, render[1][render[2]:])
+            self._editor_render = None
+    
+    def _cancel_editor_render(self):
+        if self._editor_render is not None:
+            self.root.after_cancel(self._editor_render[0])
+            self._editor_render = None
+    
+    def _on_tag_changed(self, tag_id):
+        """Engine change listener: drop the tag's rendered text on the Tk thread"""
+        if threading.get_ident() == self._tk_thread:
+            self._drop_editor_text(tag_id)
+        else:
+            # Host writes and pipeline threads: the queue keeps this ahead of
+            # any UI refresh they post afterwards
+            self.ui_events.put(lambda: self._drop_editor_text(tag_id))
+    
+    def _drop_editor_text(self, tag_id):
+        """Forget the rendered text of a tag (every tag if None)"""
+        if tag_id is None:
+            # Bulk import: any tag may have changed
+            self._editor_cache.clear()
+            self._editor_shown = None
+            return
+        self._editor_cache.pop(tag_id, None)
+        if tag_id == self._editor_shown:
+            self._editor_shown = None
     
     def toggle_virtual_input(self):
         """Toggle the virtual input device on/off"""
@@ -333,13 +982,16 @@ class NFCSimulator:
                 self.virtual_input_status.config(text="Virtual Input: ON", foreground="green")
                 self.status_var.set("Virtual input device enabled - Focus on target window")
                 
-                # Show a countdown before sending data
-                for i in range(5, 0, -1):
-                    self.virtual_input_status.config(text=f"Sending in {i}... (focus target)")
-                    self.root.update()
-                    time.sleep(1)
-                    
-                self.virtual_input_status.config(text="Virtual Input: READY", foreground="blue")
+                # Give the user time to focus the target window
+                def tick(i):
+                    if self.virtual_input_enabled.get():
+                        self.virtual_input_status.config(text=f"Sending in {i}... (focus target)")
+                
+                def ready():
+                    if self.virtual_input_enabled.get():
+                        self.virtual_input_status.config(text="Virtual Input: READY", foreground="blue")
+                
+                self.countdown(5, tick, ready)
                 
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to start virtual input: {e}")
@@ -350,6 +1002,27 @@ class NFCSimulator:
             self.virtual_input_status.config(text="Virtual Input: OFF", foreground="red")
             self.status_var.set("Virtual input device disabled")
     
+    def toggle_wedge_mode(self):
+        """Switch keyboard output between clipboard JSON and direct UID keystrokes"""
+        if self.wedge_mode_var.get():
+            try:
+                from keyboard_wedge import KeyboardWedge
+                self.wedge = KeyboardWedge()
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to start keyboard wedge: {e}")
+                self.wedge_mode_var.set(False)
+                return
+            set_keyboard_wedge(self.wedge)
+            self.engine.set_output_encoding(OUTPUT_KEYBOARD, ENCODING_UID_HEX)
+            self.status_var.set("Keyboard wedge mode enabled")
+        else:
+            set_keyboard_wedge(None)
+            self.engine.set_output_encoding(OUTPUT_KEYBOARD, None)
+            if self.wedge:
+                self.wedge.close()
+                self.wedge = None
+            self.status_var.set("Keyboard wedge mode disabled")
+    
     def _update_virtual_input_controls(self, *args):
         """Update the state of virtual input controls"""
         if not VIRTUAL_INPUT_AVAILABLE:
@@ -371,49 +1044,61 @@ class NFCSimulator:
             messagebox.showinfo("Virtual Input Disabled", "Enable virtual input first.")
             return
             
-        try:
-            # Get the tag data
-            tag_data = self.tags[self.current_tag]
-            
-            # Show a countdown before sending
-            self.status_var.set("Preparing to send data in 3 seconds...")
-            self.root.update()
-            time.sleep(1)
-            
-            self.status_var.set("Preparing to send data in 2 seconds...")
-            self.root.update()
-            time.sleep(1)
-            
-            self.status_var.set("Preparing to send data in 1 second...")
-            self.root.update()
-            time.sleep(1)
-            
-            # Convert the tag data to a string representation
-            data_str = json.dumps(tag_data, indent=2)
-            
-            # Send the data through the virtual input device
-            self.status_var.set("Sending data...")
-            self.root.update()
-            
-            send_nfc_data(data_str)
-            
-            self.status_var.set(f"Sent tag data: {self.current_tag[:8]}...")
-            
-            # Flash the status to show completion
-            for _ in range(2):
-                self.virtual_input_status.config(foreground="green")
-                self.root.update()
-                time.sleep(0.2)
-                self.virtual_input_status.config(foreground="blue")
-                self.root.update()
-                time.sleep(0.2)
-            
-        except Exception as e:
+        tag_id = self.current_tag
+        self.countdown(
+            3,
+            lambda i: self.status_var.set(f"Preparing to send data in {i} second{'s' if i > 1 else ''}..."),
+            lambda: self._queue_tag_send(tag_id)
+        )
+    
+    def _queue_tag_send(self, tag_id):
+        """Hand a keyboard send off to the background pipeline"""
+        self.status_var.set("Sending data...")
+        if not self.send_pipeline.submit(tag_id, [OUTPUT_KEYBOARD], self._on_send_done):
+            self.status_var.set("Send queue full, try again later")
+    
+    def _on_send_done(self, job):
+        """Called on a pipeline worker thread when a send job finishes"""
+        self.ui_events.put(lambda: self._show_send_result(job))
+    
+    def _show_send_result(self, job):
+        """Report a finished send job on the Tk thread"""
+        if job.error:
             self.virtual_input_status.config(text="Virtual Input: ERROR", foreground="red")
-            messagebox.showerror("Error", f"Failed to send tag data: {e}")
-        finally:
+            messagebox.showerror("Error", f"Failed to send tag data: {job.error}")
             if self.virtual_input_enabled.get():
                 self.virtual_input_status.config(text="Virtual Input: READY", foreground="blue")
+            return
+        
+        self.status_var.set(f"Sent tag data: {job.tag_id[:8]}...")
+        
+        # Flash the status to show completion
+        for i, colour in enumerate(["green", "blue", "green", "blue"]):
+            self.root.after(200 * i, lambda c=colour: self.virtual_input_status.config(foreground=c))
+        if self.virtual_input_enabled.get():
+            self.root.after(800, lambda: self.virtual_input_status.config(text="Virtual Input: READY", foreground="blue"))
+    
+    def _on_serial_send_done(self, job):
+        """Called on a pipeline worker thread when an auto-send finishes"""
+        if job.error or not all(job.results.values()):
+            self.ui_events.put(lambda: self.serial_status_var.set("Auto-send failed"))
+    
+    def countdown(self, seconds, on_tick, on_done):
+        """Call on_tick(n) once a second for n = seconds..1, then on_done(), without blocking"""
+        if seconds <= 0:
+            on_done()
+            return
+        on_tick(seconds)
+        self.root.after(1000, lambda: self.countdown(seconds - 1, on_tick, on_done))
+    
+    def process_ui_events(self):
+        """Run callbacks queued by background threads on the Tk thread"""
+        try:
+            while True:
+                self.ui_events.get_nowait()()
+        except queue.Empty:
+            pass
+        self.root.after(50, self.process_ui_events)
     
     def simulate_read(self):
         """Simulate reading an NFC tag"""
@@ -436,13 +1121,58 @@ class NFCSimulator:
         if not self.current_tag and self.tags:
             self.current_tag = next(iter(self.tags.keys()))
             # Update the selection in the listbox
-            self.tag_listbox.selection_clear(0, tk.END)
-            self.tag_listbox.selection_set(0)
+            self.update_tag_list()
         
         if self.current_tag:
+            if SERIAL_AVAILABLE and self.auto_send_var.get() and self.btn_connect['text'] == "Disconnect":
+                self.send_pipeline.submit(self.current_tag, [OUTPUT_SERIAL], self._on_serial_send_done)
             self.status_var.set(f"Read tag: {self.current_tag[:8]}...")
             self.update_tag_editor()
     
+    def add_to_field(self):
+        """Place the selected tag in the RF field"""
+        if not self.current_tag:
+            messagebox.showinfo("No Tag Selected", "Select a tag to place in the field.")
+            return
+        self._enter_field([self.current_tag])
+    
+    def add_listed_to_field(self):
+        """Place every tag in the (filtered) list in the RF field"""
+        tag_ids = self.filtered_tags if self.filtered_tags is not None else list(self.tags)
+        self._enter_field(tag_ids)
+    
+    def _enter_field(self, tag_ids):
+        try:
+            added = self.field.enter_many(tag_ids)
+        except (KeyError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to place tags in the field: {str(e)}")
+            return
+        self.update_field_status()
+        self.status_var.set(f"{len(added)} tags entered the field")
+    
+    def clear_field(self):
+        """Remove every tag from the RF field"""
+        self.field.clear()
+        self.update_field_status()
+    
+    def inventory_field(self):
+        """Read every tag in the field through anticollision, in the order a reader selects them"""
+        if not len(self.field):
+            messagebox.showinfo("Empty Field", "Add tags to the field first.")
+            return
+        collisions = self.field.collisions
+        read = self.field.inventory(wake=True)
+        if SERIAL_AVAILABLE and self.auto_send_var.get() and self.btn_connect['text'] == "Disconnect":
+            for tag_id in read:
+                self.send_pipeline.submit(tag_id, [OUTPUT_SERIAL], self._on_serial_send_done)
+        self.update_field_status()
+        self.status_var.set(f"Read {len(read)} tags from the field "
+                            f"({self.field.collisions - collisions} collisions resolved)")
+    
+    def update_field_status(self):
+        count = len(self.field)
+        self.field_status_var.set(f"Field: {count} tag{'s' if count != 1 else ''}" if count else "Field: empty")
+    
     def simulate_write(self):
         """Simulate writing to an NFC tag"""
         if not self.current_tag:
@@ -450,36 +1180,43 @@ class NFCSimulator:
             return
             
         try:
+            self._finish_editor_render()
             new_data = json.loads(self.tag_data_text.get("1.0", "end-1c"))
-            self.tags[self.current_tag] = new_data
-            self.tags[self.current_tag]["last_modified"] = datetime.now().isoformat()
-            self.save_tags()
+            if isinstance(new_data, dict) and MEMORY_VIEW_KEY not in self.tags[self.current_tag]:
+                # The memory view is derived from the tag, not part of its record
+                new_data.pop(MEMORY_VIEW_KEY, None)
+            # Only the fields that differ from the stored tag are written
+            if self.engine.edit_tag(self.current_tag, new_data) is None:
+                self.status_var.set(f"No changes to write to tag: {self.current_tag[:8]}...")
+                return
+            self.tag_listbox.refresh()
+            self.update_tag_editor()
             self.status_var.set(f"Successfully wrote to tag: {self.current_tag[:8]}...")
         except json.JSONDecodeError:
             messagebox.showerror("Invalid JSON", "The tag data contains invalid JSON.")
+        except ValueError as e:
+            messagebox.showerror("Invalid Tag Data", str(e))
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to save tags: {str(e)}")
     
     def save_tags(self):
-        """Save tags to a file"""
+        """Compact all pending tag changes into the tags file"""
         try:
-            with open("nfc_tags.json", "w") as f:
-                json.dump({"tags": self.tags}, f, indent=2)
+            self.engine.store.compact()
         except Exception as e:
             messagebox.showerror("Error", f"Failed to save tags: {str(e)}")
             raise
     
     def load_tags(self):
-        """Load tags from file"""
-        try:
-            if os.path.exists("nfc_tags.json"):
-                with open("nfc_tags.json", "r") as f:
-                    data = json.load(f)
-                    self.tags = data.get("tags", {})
-                    if self.tags:
-                        self.current_tag = next(iter(self.tags.keys()))
-                        self.update_tag_editor()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load tags: {str(e)}")
-        
+        """Load tags from file on a worker thread"""
+        self._run_bulk("Loading", lambda progress: self.engine.load(), lambda tags: self._tags_loaded(),
+                       "Failed to load tags", "Load failed")
+    
+    def _tags_loaded(self):
+        if self.tags:
+            self.current_tag = next(iter(self.tags.keys()))
+            self.update_tag_editor()
+        self.status_var.set(f"Loaded {len(self.tags)} tags")
         self.update_tag_list()
         
     def refresh_serial_ports(self):
@@ -566,8 +1303,24 @@ def on_closing(root, app):
     try:
         if hasattr(app, 'virtual_input_enabled') and app.virtual_input_enabled.get():
             stop_virtual_input()
+        if getattr(app, 'wedge', None):
+            app.wedge.close()
     except Exception as e:
         print(f"Error during cleanup: {e}")
+    try:
+        if app.burst:
+            app.burst.stop()
+        app.send_pipeline.stop()
+        if app.metrics_server:
+            app.metrics_server.stop()
+        if app.trace_replayer:
+            app.trace_replayer.stop()
+        if app.trace_recorder:
+            app.trace_recorder.close()
+        app.close_pty_readers()
+        app.engine.close()
+    except Exception as e:
+        print(f"Error saving tags: {e}")
     root.destroy()
 
 def main():
@@ -0,0 +1,207 @@
+import os
+import selectors
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from virtual_com_port import VirtualCOMPort
+
+
+class ManagedPort:
+    """A VirtualCOMPort plus the tag stream assigned to it"""
+
+    def __init__(self, name: str, port: VirtualCOMPort, tags: Iterable[str] = ()):
+        self.name = name
+        self.port = port
+        self.tags: List[str] = list(tags)
+        self._tag_set = set(self.tags)
+        self._next = 0
+        self.started_at = time.monotonic()
+
+    def assign_tags(self, tags: Iterable[str]):
+        self.tags = list(tags)
+        self._tag_set = set(self.tags)
+        self._next = 0
+
+    def next_tag(self) -> Optional[str]:
+        """Return the next tag from this port's stream, cycling round"""
+        if not self.tags:
+            return None
+        tag_id = self.tags[self._next % len(self.tags)]
+        self._next += 1
+        return tag_id
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        port = self.port
+        return {
+            "port": port.port,
+            "baudrate": port.baudrate,
+            "lines_sent": port.lines_sent,
+            "bytes_sent": port.bytes_sent,
+            "lines_received": port.lines_received,
+            "bytes_received": port.bytes_received,
+            "send_failures": port.send_failures,
+            "lines_sent_per_sec": port.lines_sent / elapsed,
+            "bytes_sent_per_sec": port.bytes_sent / elapsed,
+        }
+
+
+class PortManager:
+    """Drive many VirtualCOMPort instances from a single I/O thread.
+
+    Each port is opened without its own reader; one thread waits on all of
+    them with a selector (POSIX) and feeds received bytes to the ports'
+    line framing.  Tag emissions are routed to a single port, to the ports
+    whose assigned stream contains the tag, or broadcast to all ports.
+    """
+
+    def __init__(self, poll_interval: float = 0.01):
+        self.ports: Dict[str, ManagedPort] = {}
+        self.callback: Optional[Callable[[str, str], None]] = None
+        self.poll_interval = poll_interval
+        self.running = False
+        self._lock = threading.Lock()
+        self._io_thread = None
+        self._selector = None
+        self._wake_r = self._wake_w = None
+
+    def add_port(self, name: str, port: str, baudrate: int = 115200,
+                 tags: Iterable[str] = ()) -> bool:
+        """Open a serial port and register it under ``name``"""
+        if name in self.ports:
+            self.remove_port(name)
+        com = VirtualCOMPort(port, baudrate)
+        if not com.start(start_reader=False):
+            return False
+        self.register_port(name, com, tags)
+        return True
+
+    def register_port(self, name: str, com: VirtualCOMPort, tags: Iterable[str] = ()):
+        """Register a VirtualCOMPort that was started without its own reader under ``name``"""
+        if name in self.ports:
+            self.remove_port(name)
+        com.set_callback(lambda line, name=name: self._on_line(name, line))
+        managed = ManagedPort(name, com, tags)
+        with self._lock:
+            self.ports[name] = managed
+            if self._selector is not None:
+                self._selector.register(com.fileno(), selectors.EVENT_READ, managed)
+        self._wake()
+
+    def remove_port(self, name: str):
+        """Close and unregister a port"""
+        with self._lock:
+            managed = self.ports.pop(name, None)
+            if managed and self._selector is not None:
+                try:
+                    self._selector.unregister(managed.port.fileno())
+                except (KeyError, ValueError):
+                    pass
+        if managed:
+            managed.port.stop()
+
+    def assign_tags(self, name: str, tags: Iterable[str]):
+        """Set the tag stream a port emits from"""
+        self.ports[name].assign_tags(tags)
+
+    def set_callback(self, callback: Callable[[str, str], None]):
+        """Set a callback(port_name, line) for data received on any port"""
+        self.callback = callback
+
+    def start(self):
+        """Start the shared I/O thread"""
+        if self.running:
+            return
+        self.running = True
+        if os.name == "posix":
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = os.pipe()
+            os.set_blocking(self._wake_r, False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+            with self._lock:
+                for managed in self.ports.values():
+                    self._selector.register(managed.port.fileno(), selectors.EVENT_READ, managed)
+            target = self._select_loop
+        else:
+            # Windows serial handles cannot be used with select()
+            target = self._poll_loop
+        self._io_thread = threading.Thread(target=target, name="port-manager-io", daemon=True)
+        self._io_thread.start()
+
+    def stop(self):
+        """Stop the I/O thread and close every port"""
+        self.running = False
+        self._wake()
+        if self._io_thread and self._io_thread.is_alive():
+            self._io_thread.join(timeout=1.0)
+        for name in list(self.ports):
+            self.remove_port(name)
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+            self._wake_r = self._wake_w = None
+
+    def send(self, name: str, data: Union[str, bytes]) -> bool:
+        """Send data to a single port"""
+        managed = self.ports.get(name)
+        return bool(managed) and managed.port.send_data(data)
+
+    def broadcast(self, data: Union[str, bytes]) -> Dict[str, bool]:
+        """Send data to every port"""
+        return {name: managed.port.send_data(data) for name, managed in list(self.ports.items())}
+
+    def route(self, tag_id: str, data: Union[str, bytes]) -> Dict[str, bool]:
+        """Send a tag's payload to the ports whose stream contains it, or to all ports if none do"""
+        targets = [m for m in list(self.ports.values()) if tag_id in m._tag_set]
+        if not targets:
+            return self.broadcast(data)
+        return {m.name: m.port.send_data(data) for m in targets}
+
+    def next_tag(self, name: str) -> Optional[str]:
+        """Return the next tag in a port's assigned stream"""
+        return self.ports[name].next_tag()
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-port throughput figures"""
+        return {name: managed.stats() for name, managed in list(self.ports.items())}
+
+    def _on_line(self, name: str, line: str):
+        if self.callback:
+            self.callback(name, line)
+
+    def _wake(self):
+        if self._wake_w is not None:
+            try:
+                os.write(self._wake_w, b"\0")
+            except OSError:
+                pass
+
+    def _select_loop(self):
+        while self.running:
+            for key, _ in self._selector.select(timeout=1.0):
+                if key.data is None:
+                    try:
+                        os.read(self._wake_r, 4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                self._read_port(key.data)
+
+    def _poll_loop(self):
+        while self.running:
+            busy = False
+            for managed in list(self.ports.values()):
+                busy |= self._read_port(managed) > 0
+            if not busy:
+                time.sleep(self.poll_interval)
+
+    def _read_port(self, managed: ManagedPort) -> int:
+        try:
+            return managed.port.read_available()
+        except Exception as e:
+            print(f"Error reading {managed.name}: {e}")
+            self.remove_port(managed.name)
+            return 0
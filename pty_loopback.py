@@ -0,0 +1,56 @@
+import os
+from typing import Optional
+
+
+class PtyPair:
+    """A pseudo-terminal pair usable as a stand-in for a serial cable (POSIX only).
+
+    ``device`` is the slave path a simulator port opens; the host side of the
+    "cable" reads and writes ``master_fd``.
+    """
+
+    def __init__(self, raw: bool = True):
+        import pty
+        import tty
+        self.master_fd, self.slave_fd = pty.openpty()
+        if raw:
+            # No echo and no line discipline, like a real serial line
+            tty.setraw(self.slave_fd)
+            tty.setraw(self.master_fd)
+        self.device = os.ttyname(self.slave_fd)
+
+    def write(self, data: bytes) -> int:
+        """Write bytes from the host side"""
+        return os.write(self.master_fd, data)
+
+    def read(self, size: int = 65536) -> bytes:
+        """Read bytes on the host side (blocks until data is available)"""
+        return os.read(self.master_fd, size)
+
+    def read_line(self, timeout: Optional[float] = None) -> bytes:
+        """Read one newline-terminated line on the host side"""
+        import select
+        line = bytearray()
+        while not line.endswith(b"\n"):
+            if timeout is not None:
+                ready, _, _ = select.select([self.master_fd], [], [], timeout)
+                if not ready:
+                    raise TimeoutError("No data from pty")
+            line += os.read(self.master_fd, 1)
+        return bytes(line)
+
+    def close(self):
+        """Close both ends"""
+        for fd in (self.master_fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.master_fd = self.slave_fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,262 @@
+"""Simulated reader devices on pseudo-terminals (Linux and other POSIX systems).
+
+Each device is a pty pair: the application under test opens the slave side
+through a stable symlink (``/tmp/nfc_readers/reader0``, ``reader1``, ...) as
+if it were a reader's serial port, and the simulator drives the master side
+with a VirtualCOMPort registered in a PortManager.  No hardware or null-modem
+tool is needed, and one I/O thread serves every device.
+
+The simulator keeps the slave open as well, so the master never sees a
+hangup while the application closes and reopens the device.  Data sent while
+the application has the device closed waits in the pty; once the pty is full
+sends time out, as on a serial line with nobody reading.
+
+Usage:
+    python pty_readers.py --count 100
+    python pty_readers.py --count 8 --dir /run/nfc --prefix ttyNFC --tags nfc_tags.json
+"""
+import argparse
+import errno
+import fcntl
+import os
+import pty
+import resource
+import select
+import struct
+import termios
+import time
+import tty
+from typing import Dict, Iterable, List, Optional
+
+from port_manager import PortManager
+from virtual_com_port import VirtualCOMPort, DEFAULT_MAX_LATENCY
+
+DEFAULT_LINK_DIR = "/tmp/nfc_readers"
+DEFAULT_PREFIX = "reader"
+
+# Descriptors held per device (pty master and slave)
+FDS_PER_DEVICE = 2
+# How often a blocking read checks whether it was cancelled
+_READ_SLICE = 0.1
+
+
+class PtyMaster:
+    """The master side of a raw pty pair, with the part of the serial.Serial interface VirtualCOMPort uses.
+
+    Waits use ``poll`` rather than ``select``, so hundreds of devices can
+    be open in one process.  A pty has no modem lines, so CTS always reads
+    as asserted, and there is nothing to drain, so ``flush`` returns at once.
+    """
+
+    def __init__(self, timeout: Optional[float] = 1.0, write_timeout: Optional[float] = 1.0):
+        self.timeout = timeout
+        self.write_timeout = write_timeout
+        self.fd, self.slave_fd = pty.openpty()
+        # No echo and no line discipline, like a real serial line
+        tty.setraw(self.slave_fd)
+        tty.setraw(self.fd)
+        os.set_blocking(self.fd, False)
+        self.device = os.ttyname(self.slave_fd)
+        self._cancelled = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.fd is not None
+
+    @property
+    def in_waiting(self) -> int:
+        return struct.unpack("i", fcntl.ioctl(self.fd, termios.FIONREAD, b"\0\0\0\0"))[0]
+
+    @property
+    def cts(self) -> bool:
+        return True
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def read(self, size: int = 1) -> bytes:
+        """Read up to ``size`` bytes, waiting at most ``timeout`` seconds for the first"""
+        self._cancelled = False
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        poller = select.poll()
+        poller.register(self.fd, select.POLLIN)
+        while not self._cancelled:
+            wait = _READ_SLICE if deadline is None else min(_READ_SLICE, deadline - time.monotonic())
+            if wait < 0:
+                break
+            if poller.poll(wait * 1000):
+                try:
+                    return os.read(self.fd, size)
+                except BlockingIOError:
+                    continue
+        return b""
+
+    def cancel_read(self):
+        """Make a blocked read return"""
+        self._cancelled = True
+
+    def write(self, data: bytes) -> int:
+        """Write all of ``data``, raising TimeoutError if the pty stays full for ``write_timeout`` seconds"""
+        view = memoryview(data)
+        deadline = None if self.write_timeout is None else time.monotonic() + self.write_timeout
+        poller = None
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+                continue
+            except BlockingIOError:
+                pass
+            if poller is None:
+                poller = select.poll()
+                poller.register(self.fd, select.POLLOUT)
+            wait = None if deadline is None else max(deadline - time.monotonic(), 0) * 1000
+            if not poller.poll(wait):
+                raise TimeoutError(errno.ETIMEDOUT, "Write timeout")
+        return len(data)
+
+    def flush(self):
+        """Nothing to drain: written data is already in the slave's input queue"""
+
+    def close(self):
+        """Close both ends"""
+        for fd in (self.fd, self.slave_fd):
+            if fd is not None:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+        self.fd = self.slave_fd = None
+
+
+class PtyReaderDevices:
+    """A set of pty reader devices, each a VirtualCOMPort in ``manager`` with a symlink for the application.
+
+    Devices are registered in the manager under their name, so
+    ``manager.send``, ``route`` and ``broadcast`` and
+    ``ReaderProtocol.attach_manager`` work on them like on any other port.
+    Links are ``link_dir/<name>``; an existing link of that name (e.g. left
+    over from an earlier run) is replaced, and links are removed again on
+    ``remove`` and ``close``.
+    """
+
+    def __init__(self, manager: Optional[PortManager] = None, link_dir: str = DEFAULT_LINK_DIR,
+                 prefix: str = DEFAULT_PREFIX, coalesce: bool = False,
+                 max_latency: float = DEFAULT_MAX_LATENCY):
+        self.manager = manager if manager is not None else PortManager()
+        self.link_dir = link_dir
+        self.prefix = prefix
+        self.coalesce = coalesce
+        self.max_latency = max_latency
+        self.links: Dict[str, str] = {}  # device name -> symlink path
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def add(self, name: str, tags: Iterable[str] = ()) -> str:
+        """Create a device under ``name`` and return the path the application opens"""
+        if name in self.links:
+            self.remove(name)
+        master = PtyMaster()
+        link = os.path.join(self.link_dir, name)
+        try:
+            os.makedirs(self.link_dir, exist_ok=True)
+            # Replace rather than unlink first, so the link never goes missing
+            temp = f"{link}.{os.getpid()}.tmp"
+            if os.path.lexists(temp):
+                os.unlink(temp)
+            os.symlink(master.device, temp)
+            os.replace(temp, link)
+        except OSError:
+            master.close()
+            raise
+        port = VirtualCOMPort(link, coalesce=self.coalesce, max_latency=self.max_latency)
+        port.start_with(master, start_reader=False)
+        self.manager.register_port(name, port, tags)
+        self.links[name] = link
+        self.manager.start()
+        return link
+
+    def create(self, count: int, tags: Iterable[str] = ()) -> List[str]:
+        """Create ``<prefix>0`` to ``<prefix><count - 1>``, sharing ``tags`` round-robin, and return their links"""
+        tags = list(tags)
+        _raise_fd_limit(count * FDS_PER_DEVICE)
+        return [self.add(f"{self.prefix}{i}", tags[i::count]) for i in range(count)]
+
+    def remove(self, name: str):
+        """Close a device and remove its link"""
+        link = self.links.pop(name, None)
+        if link is None:
+            return
+        managed = self.manager.ports.get(name)
+        device = managed.port.serial_connection.device if managed else None
+        self.manager.remove_port(name)
+        try:
+            # Leave the link alone if something else has taken the name since
+            if device is None or os.readlink(link) == device:
+                os.unlink(link)
+        except OSError:
+            pass
+
+    def close(self):
+        """Close every device and remove the links"""
+        for name in list(self.links):
+            self.remove(name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _raise_fd_limit(needed: int):
+    """Raise the soft open file limit towards the hard limit if ``needed`` more descriptors would not fit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = len(os.listdir("/proc/self/fd")) + needed if os.path.isdir("/proc/self/fd") else needed * 2
+    if soft != resource.RLIM_INFINITY and soft < wanted:
+        limit = wanted if hard == resource.RLIM_INFINITY else min(wanted, hard)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+
+
+def main():
+    from reader_protocol import ReaderProtocol
+    from simulator_core import SimulatorEngine
+    from tag_store import DEFAULT_TAGS_FILE, TagStore
+
+    parser = argparse.ArgumentParser(description="Serve simulated NFC readers on pseudo-terminals")
+    parser.add_argument("--count", type=int, default=1, help="reader devices to create")
+    parser.add_argument("--dir", default=DEFAULT_LINK_DIR, help="directory for the device links")
+    parser.add_argument("--prefix", default=DEFAULT_PREFIX, help="device link name prefix")
+    parser.add_argument("--tags", default=DEFAULT_TAGS_FILE, help="tag store to answer from")
+    parser.add_argument("--coalesce-ms", type=float,
+                        help="coalesce writes, holding a response at most this many milliseconds")
+    args = parser.parse_args()
+
+    engine = SimulatorEngine(store=TagStore(args.tags, lazy=True))
+    tag_ids = list(engine.load())
+    protocol = ReaderProtocol(engine)
+    devices = PtyReaderDevices(link_dir=args.dir, prefix=args.prefix,
+                               coalesce=args.coalesce_ms is not None,
+                               max_latency=(args.coalesce_ms or 0.0) / 1000)
+    protocol.attach_manager(devices.manager)
+    try:
+        links = devices.create(args.count, tag_ids)
+        # Each reader has the first tag of its share in its field
+        for name, managed in devices.manager.ports.items():
+            protocol.present(managed.next_tag(), name)
+        print(f"{len(links)} readers with {len(tag_ids)} tags:")
+        for link in links:
+            print(f"  {link} -> {os.readlink(link)}")
+        print("Press Ctrl+C to stop")
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        devices.manager.stop()
+        devices.close()
+        engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+"""Reader-side command protocol answering host polls from the tag store.
+
+Hosts send one ASCII command per line and get one line back:
+
+    POLL                  -> TAG <uid> | NOTAG
+    UID                   -> UID <uid> | ERR NOTAG
+    READ <block>          -> DATA <block> <32 hex digits> | ERR NOTAG | ERR RANGE
+    WRITE <block> <hex>   -> OK | ERR NOTAG | ERR RANGE | ERR LENGTH | ERR LOCKED
+    COUNTER               -> COUNTER <n> | ERR NOTAG | ERR UNSUPPORTED
+
+Commands are case-insensitive.  A command may start with ``#<seq>``, which is
+echoed at the start of the response so a host can keep several requests in
+flight on one port and match the answers.  Anything unparseable gets
+``ERR SYNTAX`` or ``ERR UNKNOWN``.
+
+When the engine has a memory store, tag memory is the tag's emulated chip
+memory (see ``tag_memory``) addressed in 16-byte blocks: four pages per
+block on NTAG21x, sector blocks on MIFARE Classic.  Writes to read-only or
+locked memory get ``ERR LOCKED``, and the first READ after a POLL counts
+towards the NTAG NFC counter.  Otherwise (and for tags with no layout for
+their UID) tag memory is the tag's NDEF message in an NDEF TLV, as on a
+Type 2 tag, zero-padded to ``MEMORY_SIZE`` bytes.
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import metrics
+from simulator_core import SimulatorEngine, TagNotFoundError
+from tag_encoders import ENCODING_NDEF, ENCODING_UID_HEX, Payload, parse_ndef_text
+from tag_memory import BLOCK_SIZE, MemoryAccessError, TagMemory, find_ndef, flat_layout, ndef_tlv
+from tag_record import as_dict
+
+MEMORY_SIZE = 1024
+
+_NOTAG = b"NOTAG\n"
+_OK = b"OK\n"
+_ERR_NOTAG = b"ERR NOTAG\n"
+_ERR_RANGE = b"ERR RANGE\n"
+_ERR_LENGTH = b"ERR LENGTH\n"
+_ERR_LOCKED = b"ERR LOCKED\n"
+_ERR_SYNTAX = b"ERR SYNTAX\n"
+_ERR_UNKNOWN = b"ERR UNKNOWN\n"
+_ERR_UNSUPPORTED = b"ERR UNSUPPORTED\n"
+
+
+def memory_image(message: bytes, size: int = MEMORY_SIZE) -> bytearray:
+    """Tag memory holding an NDEF message in a TLV, padded to whole blocks of at least ``size`` bytes"""
+    tlv = ndef_tlv(message)
+    size = max(size, -(-len(tlv) // BLOCK_SIZE) * BLOCK_SIZE)
+    return bytearray(tlv.ljust(size, b"\0"))
+
+
+def parse_memory_image(image: bytes) -> Optional[bytes]:
+    """The NDEF message in tag memory, or None if there is no complete NDEF TLV"""
+    span = find_ndef(image)
+    return bytes(image[span[0]:span[0] + span[1]]) if span else None
+
+
+def _block_frame(block: int, data: bytes) -> bytes:
+    return f"DATA {block} {bytes(data).hex().upper()}\n".encode("ascii")
+
+
+class _TagFrames:
+    """Ready-to-send responses for one tag"""
+
+    __slots__ = ("tag_id", "poll", "uid", "memory", "blocks")
+
+    def __init__(self, tag_id: str, uid_hex: str, memory: TagMemory):
+        self.tag_id = tag_id
+        self.poll = f"TAG {uid_hex}\n".encode("ascii")
+        self.uid = f"UID {uid_hex}\n".encode("ascii")
+        self.memory = memory
+        self.blocks: List[bytes] = [_block_frame(i, memory.read_block(i)) for i in range(memory.layout.blocks)]
+
+
+class ReaderProtocol:
+    """Answer host commands for the tags presented to one or more reader ports.
+
+    The poll, UID and memory block responses are built once per tag and
+    cached until the engine reports that the tag changed.  Answering a
+    command is then a parse, a dictionary lookup and one write, done on the
+    thread that received the line, so every port answers independently.
+
+    Each port sees the tag placed in its field with ``present``, or the
+    default tag.  A host WRITE updates the tag's memory; when the block holding
+    the end of a complete NDEF Text record is written, the tag's content is
+    written through the engine and ``on_write(tag_id)`` is called.  With a
+    memory store the memory is the engine's (``engine.tag_memory``), so it
+    keeps lock bits, counters and everything else hosts write between runs.
+    Every change to a tag's memory (a WRITE, or a READ that counts) is
+    reported to ``on_memory_change(tag_id)``, as most of them never reach
+    the engine's change listeners.
+    """
+
+    def __init__(self, engine: SimulatorEngine, on_write: Optional[Callable[[str], None]] = None,
+                 on_memory_change: Optional[Callable[[str], None]] = None):
+        self.engine = engine
+        self.on_write = on_write
+        self.on_memory_change = on_memory_change
+        self.default_tag: Optional[str] = None
+        self.field: Dict[str, Optional[str]] = {}
+        self.commands_handled = 0
+        self._frames: Dict[str, _TagFrames] = {}
+        self._write_lock = threading.Lock()
+        self._handlers = {
+            "POLL": self._poll,
+            "UID": self._uid,
+            "READ": self._read,
+            "WRITE": self._write,
+            "COUNTER": self._counter,
+        }
+        self._polled = set()  # ports whose next READ is the first since a POLL
+        engine.add_change_listener(self._on_tag_changed)
+
+    def present(self, tag_id: Optional[str], port: Optional[str] = None):
+        """Place a tag in the field of ``port``, or of every port without its own tag (None removes it)"""
+        if port is None:
+            self.default_tag = tag_id
+        else:
+            self.field[port] = tag_id
+        if tag_id:
+            # Build the responses now rather than on the first poll
+            self._frames_for(tag_id)
+
+    def attach(self, port, name: Optional[str] = None):
+        """Answer commands arriving on a VirtualCOMPort"""
+        name = name or port.port or ""
+        port.set_callback(lambda line: self.handle_line(line, port.send_data, name))
+
+    def attach_manager(self, manager):
+        """Answer commands arriving on every port of a PortManager"""
+        manager.set_callback(lambda name, line: self.handle_line(line, lambda data: manager.send(name, data), name))
+
+    def handle_line(self, line: str, send: Callable[[Payload], object], port: str = "") -> object:
+        """Answer one received line through ``send``"""
+        started = time.perf_counter() if metrics.ENABLED else 0.0
+        response = self.respond(line, port)
+        if response is None:
+            return None
+        result = send(response)
+        if metrics.ENABLED:
+            metrics.RESPONSE_SECONDS.observe(time.perf_counter() - started, port)
+        return result
+
+    def respond(self, line: str, port: str = "") -> Optional[bytes]:
+        """Response frame for one command line (None for a blank line)"""
+        parts = line.split()
+        if not parts:
+            return None
+        prefix = b""
+        if parts[0].startswith("#"):
+            prefix = parts[0].encode("ascii", "replace") + b" "
+            parts = parts[1:]
+            if not parts:
+                return prefix + _ERR_SYNTAX
+        command = parts[0].upper()
+        handler = self._handlers.get(command)
+        self.commands_handled += 1
+        if metrics.ENABLED:
+            metrics.COMMANDS_HANDLED.inc(1, command if handler else "UNKNOWN")
+        if handler is None:
+            return prefix + _ERR_UNKNOWN
+        return prefix + handler(parts[1:], port)
+
+    def _field_frames(self, port: str) -> Optional[_TagFrames]:
+        tag_id = self.field.get(port, self.default_tag)
+        return self._frames_for(tag_id) if tag_id else None
+
+    def _frames_for(self, tag_id: str) -> Optional[_TagFrames]:
+        frames = self._frames.get(tag_id)
+        if frames is None:
+            generation = self.engine.generation
+            try:
+                uid_hex = self.engine.encode_tag(tag_id, ENCODING_UID_HEX)
+                memory = self._memory_for(tag_id)
+            except TagNotFoundError:
+                return None
+            frames = self._frames[tag_id] = _TagFrames(tag_id, uid_hex, memory)
+            if self.engine.generation != generation:
+                # The tag may have changed while the frames were built
+                self._frames.pop(tag_id, None)
+        return frames
+
+    def _memory_for(self, tag_id: str) -> TagMemory:
+        if self.engine.memory is not None:
+            try:
+                return self.engine.tag_memory(tag_id)
+            except ValueError:
+                # No layout for this UID or message: fall back to flat memory
+                pass
+        image = memory_image(self.engine.encode_tag(tag_id, ENCODING_NDEF))
+        return TagMemory(flat_layout(len(image)), image)
+
+    def _on_tag_changed(self, tag_id: Optional[str]):
+        if tag_id is None:
+            self._frames.clear()
+        else:
+            self._frames.pop(tag_id, None)
+
+    def _poll(self, args: List[str], port: str) -> bytes:
+        frames = self._field_frames(port)
+        if frames is None:
+            return _NOTAG
+        self._polled.add(port)
+        return frames.poll
+
+    def _uid(self, args: List[str], port: str) -> bytes:
+        frames = self._field_frames(port)
+        return frames.uid if frames else _ERR_NOTAG
+
+    def _read(self, args: List[str], port: str) -> bytes:
+        if len(args) != 1 or not args[0].isdecimal():
+            return _ERR_SYNTAX
+        frames = self._field_frames(port)
+        if frames is None:
+            return _ERR_NOTAG
+        block = int(args[0])
+        if block >= len(frames.blocks):
+            return _ERR_RANGE
+        if port in self._polled:
+            self._polled.discard(port)
+            with self._write_lock:
+                counter = frames.memory.counter
+                changed = frames.memory.count_read() != counter
+            if changed and self.on_memory_change:
+                self.on_memory_change(frames.tag_id)
+        return frames.blocks[block]
+
+    def _write(self, args: List[str], port: str) -> bytes:
+        if len(args) != 2 or not args[0].isdecimal():
+            return _ERR_SYNTAX
+        try:
+            data = bytes.fromhex(args[1])
+        except ValueError:
+            return _ERR_SYNTAX
+        if len(data) != BLOCK_SIZE:
+            return _ERR_LENGTH
+        tag_id = self.field.get(port, self.default_tag)
+        block = int(args[0])
+        with self._write_lock:
+            frames = self._frames_for(tag_id) if tag_id else None
+            if frames is None:
+                return _ERR_NOTAG
+            if block >= len(frames.blocks):
+                return _ERR_RANGE
+            memory = frames.memory
+            try:
+                memory.write_block(block, data)
+            except MemoryAccessError:
+                return _ERR_LOCKED
+            if self.on_memory_change:
+                self.on_memory_change(tag_id)
+            # Lock and OTP bytes may not read back as written
+            frames.blocks[block] = _block_frame(block, memory.read_block(block))
+            # Hosts write a message front to back, so only commit once the
+            # block holding its last byte arrives
+            span = memory.ndef_span()
+            if span and span[1] and memory.block_of(span[0] + span[1] - 1) == block:
+                text = parse_ndef_text(bytes(memory.ndef_message()))
+                if text is not None:
+                    self._commit_text(tag_id, text)
+        return _OK
+
+    def _counter(self, args: List[str], port: str) -> bytes:
+        if args:
+            return _ERR_SYNTAX
+        frames = self._field_frames(port)
+        if frames is None:
+            return _ERR_NOTAG
+        counter = frames.memory.counter
+        if counter is None:
+            return _ERR_UNSUPPORTED
+        return f"COUNTER {counter}\n".encode("ascii")
+
+    def _commit_text(self, tag_id: str, text: str):
+        tag_data = as_dict(self.engine.get_tag(tag_id))
+        data = tag_data.get("data")
+        if isinstance(data, dict) and data.get("content") == text:
+            return
+        if isinstance(data, dict):
+            data = dict(data, content=text)
+        else:
+            data = {"type": "virtual_nfc_tag", "version": "1.0", "content": text}
+        self.engine.write_tag(tag_id, dict(tag_data, data=data))
+        if self.on_write:
+            self.on_write(tag_id)
@@ -0,0 +1,294 @@
+"""Multi-tag RF field with ISO 14443-3 Type A anticollision.
+
+Any number of tags from the store can be in the field at once.  An
+inventory works like a reader at a gate: wake the tags (REQA/WUPA), run
+bit-wise anticollision cascade level by cascade level until one UID is
+selected, read that tag through the engine, halt it (HLTA) and repeat until
+no tag answers.
+
+Anticollision bits are sent least significant bit first within each byte, so
+UIDs are indexed by a key holding their cascade level chunks (CL1, CL2, CL3)
+with each byte bit-reversed.  The tags answering a given bit prefix are then
+a contiguous range of the sorted keys, and the first collision bit is the
+highest bit in which the first and last key of that range differ, so each
+anticollision round is a pair of binary searches rather than a scan of the
+field.  Collisions are resolved by choosing 1, as common readers do.
+"""
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import metrics
+from simulator_core import SimulatorEngine, TagNotFoundError
+from tag_encoders import ENCODING_UID_HEX
+
+EVENT_ENTER = "enter"
+EVENT_LEAVE = "leave"
+EVENT_READ = "read"
+
+CASCADE_TAG = 0x88
+LEVEL_BITS = 32
+KEY_BITS = 3 * LEVEL_BITS
+
+_REVERSED = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+
+
+def cascade_levels(uid: bytes) -> List[bytes]:
+    """The 4-byte UID chunk sent at each cascade level (without BCC)"""
+    if len(uid) == 4:
+        if uid[0] == CASCADE_TAG:
+            raise ValueError("A 4-byte UID cannot start with the cascade tag 0x88")
+        return [uid]
+    if len(uid) == 7:
+        return [bytes([CASCADE_TAG]) + uid[:3], uid[3:]]
+    if len(uid) == 10:
+        return [bytes([CASCADE_TAG]) + uid[:3], bytes([CASCADE_TAG]) + uid[3:6], uid[6:]]
+    raise ValueError(f"UID must be 4, 7 or 10 bytes, not {len(uid)}")
+
+
+def bcc(chunk: bytes) -> int:
+    """Block check character sent after a cascade level chunk"""
+    return chunk[0] ^ chunk[1] ^ chunk[2] ^ chunk[3]
+
+
+def uid_key(uid: bytes) -> Tuple[int, int]:
+    """(anticollision sort key, cascade levels) for a UID"""
+    levels = cascade_levels(uid)
+    key = 0
+    for chunk in levels:
+        key = (key << LEVEL_BITS) | int.from_bytes(chunk.translate(_REVERSED), "big")
+    return key << (LEVEL_BITS * (3 - len(levels))), len(levels)
+
+
+class RFField:
+    """Tags present in one reader's RF field.
+
+    ``enter`` and ``leave`` move tags in and out of the field (a tag that
+    leaves loses power, so it is no longer halted when it comes back), and
+    listeners get ``(event, tag_id)`` for every enter, leave and read.
+    ``inventory`` reads every tag that is not halted; tags stay halted
+    afterwards, so repeated inventories only read new arrivals unless they
+    wake the field.  Tags deleted from the engine leave the field, and tags
+    whose UID changes are reindexed.
+
+    ``collisions`` counts the anticollision rounds that found a collision
+    and ``reads`` the tags read.  Safe to call from several threads.
+    """
+
+    def __init__(self, engine: SimulatorEngine):
+        self.engine = engine
+        self.collisions = 0
+        self.reads = 0
+        self._keys: List[int] = []  # sorted keys of the tags that answer REQA
+        self._tags_at: Dict[int, List[str]] = {}  # answering tags by key (UIDs may repeat)
+        self._present: Dict[str, Tuple[int, int]] = {}  # tag ID -> (key, cascade levels)
+        self._halted: Set[str] = set()
+        self._listeners: List[Callable[[str, str], None]] = []
+        self._lock = threading.RLock()
+        engine.add_change_listener(self._on_tag_changed)
+
+    def __len__(self) -> int:
+        return len(self._present)
+
+    def __contains__(self, tag_id: object) -> bool:
+        return tag_id in self._present
+
+    def tag_ids(self) -> List[str]:
+        """Tags in the field, in the order they entered"""
+        with self._lock:
+            return list(self._present)
+
+    def add_listener(self, callback: Callable[[str, str], None]):
+        """Call ``callback(event, tag_id)`` for every enter, leave and read"""
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback: Callable[[str, str], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def enter(self, tag_id: str) -> bool:
+        """Bring a tag into the field; False if it was already there"""
+        return bool(self.enter_many([tag_id]))
+
+    def enter_many(self, tag_ids: Iterable[str]) -> List[str]:
+        """Bring several tags into the field at once, returning those that were not already there
+
+        Raises TagNotFoundError for an unknown tag and ValueError for a UID
+        that is not 4, 7 or 10 bytes; no tag enters in that case.
+        """
+        with self._lock:
+            entering = {}
+            for tag_id in tag_ids:
+                if tag_id not in self._present and tag_id not in entering:
+                    entering[tag_id] = self._uid_key(tag_id)
+            if not entering:
+                return []
+            for tag_id, key in entering.items():
+                self._present[tag_id] = key
+                self._add_key(tag_id, key[0], sort=False)
+            # One sort instead of an insertion per tag
+            self._keys.sort()
+            self._update_gauge()
+        for tag_id in entering:
+            self._notify(EVENT_ENTER, tag_id)
+        return list(entering)
+
+    def leave(self, tag_id: str) -> bool:
+        """Take a tag out of the field; False if it was not there"""
+        with self._lock:
+            if tag_id not in self._present:
+                return False
+            self._remove(tag_id)
+            self._update_gauge()
+        self._notify(EVENT_LEAVE, tag_id)
+        return True
+
+    def clear(self):
+        """Take every tag out of the field"""
+        for tag_id in self.tag_ids():
+            self.leave(tag_id)
+
+    def set_tags(self, tag_ids: Iterable[str]):
+        """Make exactly ``tag_ids`` present, with enter and leave events for the difference"""
+        wanted = dict.fromkeys(tag_ids)
+        for tag_id in self.tag_ids():
+            if tag_id not in wanted:
+                self.leave(tag_id)
+        self.enter_many(wanted)
+
+    def wake(self):
+        """WUPA: return halted tags to the ready state"""
+        with self._lock:
+            for tag_id in self._halted:
+                self._add_key(tag_id, self._present[tag_id][0], sort=False)
+            self._halted.clear()
+            self._keys.sort()
+
+    def halt(self, tag_id: str):
+        """HLTA: stop a tag answering until it is woken or re-enters the field"""
+        with self._lock:
+            if tag_id in self._present and tag_id not in self._halted:
+                self._remove_key(tag_id, self._present[tag_id][0])
+                self._halted.add(tag_id)
+
+    def select(self) -> Optional[str]:
+        """Run anticollision over the answering tags and return the one selected (None if none answer)"""
+        with self._lock:
+            keys = self._keys
+            if not keys:
+                return None
+            prefix, bits = 0, 0
+            for level in range(3):
+                level_end = (level + 1) * LEVEL_BITS
+                while True:
+                    lo, hi = self._range(prefix, bits)
+                    # Tags agree up to the highest bit where the extremes differ
+                    first_collision = KEY_BITS - (keys[lo] ^ keys[hi - 1]).bit_length()
+                    if first_collision >= level_end:
+                        break
+                    self.collisions += 1
+                    if metrics.ENABLED:
+                        metrics.ANTICOLLISION_ROUNDS.inc()
+                    # Choose 1 at the collision bit: the last key in the range has it
+                    bits = first_collision + 1
+                    prefix = keys[hi - 1] >> (KEY_BITS - bits)
+                bits = level_end
+                prefix = keys[lo] >> (KEY_BITS - bits)
+                # SELECT answers with SAK "UID complete" at the tag's last level
+                selected = self._tags_at[keys[lo]][0]
+                if self._present[selected][1] == level + 1:
+                    return selected
+            return None
+
+    def inventory(self, outputs: Iterable[str] = (), wake: bool = False,
+                  limit: Optional[int] = None) -> List[str]:
+        """Select, read and halt tags until none answer, returning the tags read in order
+
+        Each tag is read with ``engine.read_tag`` and so emitted to
+        ``outputs``.  With ``wake`` halted tags are woken first (WUPA), so
+        every tag in the field is read again.
+        """
+        outputs = list(outputs)
+        if wake:
+            self.wake()
+        read = []
+        while limit is None or len(read) < limit:
+            tag_id = self.select()
+            if tag_id is None:
+                break
+            self.halt(tag_id)
+            try:
+                self.engine.read_tag(tag_id, outputs)
+            except TagNotFoundError:
+                # Deleted since it was selected
+                continue
+            self.reads += 1
+            read.append(tag_id)
+            self._notify(EVENT_READ, tag_id)
+        return read
+
+    def _uid_key(self, tag_id: str) -> Tuple[int, int]:
+        return uid_key(bytes.fromhex(self.engine.encode_tag(tag_id, ENCODING_UID_HEX)))
+
+    def _range(self, prefix: int, bits: int) -> Tuple[int, int]:
+        """Index range of the keys starting with the ``bits``-bit ``prefix``"""
+        shift = KEY_BITS - bits
+        return (bisect.bisect_left(self._keys, prefix << shift),
+                bisect.bisect_left(self._keys, (prefix + 1) << shift))
+
+    def _add_key(self, tag_id: str, key: int, sort: bool = True):
+        tags = self._tags_at.get(key)
+        if tags is None:
+            self._tags_at[key] = [tag_id]
+            if sort:
+                bisect.insort(self._keys, key)
+            else:
+                self._keys.append(key)
+        else:
+            tags.append(tag_id)
+
+    def _remove_key(self, tag_id: str, key: int):
+        tags = self._tags_at[key]
+        tags.remove(tag_id)
+        if not tags:
+            del self._tags_at[key]
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def _remove(self, tag_id: str):
+        key = self._present.pop(tag_id)[0]
+        if tag_id in self._halted:
+            self._halted.discard(tag_id)
+        else:
+            self._remove_key(tag_id, key)
+
+    def _on_tag_changed(self, tag_id: Optional[str]):
+        with self._lock:
+            changed = self.tag_ids() if tag_id is None else [tag_id] if tag_id in self._present else []
+            gone = []
+            for changed_id in changed:
+                try:
+                    key = self._uid_key(changed_id)
+                except (TagNotFoundError, ValueError):
+                    gone.append(changed_id)
+                    continue
+                if key != self._present[changed_id]:
+                    halted = changed_id in self._halted
+                    self._remove(changed_id)
+                    self._present[changed_id] = key
+                    if halted:
+                        self._halted.add(changed_id)
+                    else:
+                        self._add_key(changed_id, key[0])
+            for gone_id in gone:
+                self._remove(gone_id)
+            self._update_gauge()
+        for gone_id in gone:
+            self._notify(EVENT_LEAVE, gone_id)
+
+    def _update_gauge(self):
+        if metrics.ENABLED:
+            metrics.TAGS_IN_FIELD.set(len(self._present))
+
+    def _notify(self, event: str, tag_id: str):
+        for callback in self._listeners:
+            callback(event, tag_id)
@@ -0,0 +1,301 @@
+"""Binary trace recording and time-accurate replay of scan sessions.
+
+A trace file starts with a 16-byte header (magic, version, wall-clock start
+time) followed by one record per event:
+
+    kind (u8) | flags (u8) | time_ns (u64) | name_len (u16) | tag_len (u16) | payload_len (u32)
+    name | tag ID | payload
+
+All integers are little-endian.  ``time_ns`` is monotonic time since the
+recording started.  Emit events name the output and carry the exact payload
+sent; line events name the source and carry a line received from the host.
+Text payloads are flagged so they replay as text (sent with a trailing newline).
+
+Usage:
+    python scan_trace.py dump trace.nfctrace [--limit 50]
+    python scan_trace.py replay trace.nfctrace --port COM5 [--speed 1 | 10 | 0]
+"""
+import argparse
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Callable, Dict, Iterator, NamedTuple, Optional
+
+from burst_scheduler import sleep_until
+from simulator_core import SimulatorEngine
+from tag_encoders import Payload
+
+KIND_EMIT = 1
+KIND_LINE = 2
+
+FLAG_TEXT = 0x01
+
+_MAGIC = b"NFCTRC"
+_VERSION = 1
+_HEADER = struct.Struct("<6sHd")
+_RECORD = struct.Struct("<BBQHHI")
+
+
+class TraceEvent(NamedTuple):
+    kind: int
+    time_ns: int
+    name: str
+    tag_id: str
+    payload: Payload
+
+
+class TraceRecorder:
+    """Append emitted payloads and received serial lines to a trace file.
+
+    Attach to an engine with ``engine.recorder = recorder`` to capture every
+    payload sent through ``SimulatorEngine.emit``, and wrap the serial line
+    callback with ``line_callback`` to capture incoming lines.  Safe to call
+    from several threads.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.events = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "wb")
+        self._file.write(_HEADER.pack(_MAGIC, _VERSION, time.time()))
+        self._start = time.monotonic_ns()
+
+    def record_emit(self, tag_id: str, output: str, payload: Payload):
+        """Record a payload sent to an output"""
+        self._write(KIND_EMIT, output, tag_id, payload)
+
+    def record_line(self, line: str, source: str = "serial"):
+        """Record a line received from the host"""
+        self._write(KIND_LINE, source, "", line)
+
+    def line_callback(self, source: str = "serial",
+                      forward: Optional[Callable[[str], None]] = None) -> Callable[[str], None]:
+        """A serial line callback that records each line and passes it on to ``forward``"""
+        def callback(line: str):
+            self.record_line(line, source)
+            if forward:
+                forward(line)
+        return callback
+
+    def flush(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self) -> "TraceRecorder":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _write(self, kind: int, name: str, tag_id: str, payload: Payload):
+        flags = 0
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+            flags |= FLAG_TEXT
+        name_bytes = name.encode("utf-8")
+        tag_bytes = tag_id.encode("utf-8")
+        with self._lock:
+            if self._file is None:
+                return
+            # Timestamp under the lock so records stay in time order
+            header = _RECORD.pack(kind, flags, time.monotonic_ns() - self._start,
+                                  len(name_bytes), len(tag_bytes), len(payload))
+            self._file.write(header + name_bytes + tag_bytes + payload)
+            self.events += 1
+
+
+class TraceReader:
+    """Iterate the events of a trace file through a memory map, without loading it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._buffer = b""
+        if os.fstat(self._file.fileno()).st_size:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._buffer) < _HEADER.size:
+            self.close()
+            raise ValueError(f"Not a scan trace: {path}")
+        magic, version, self.started_at = _HEADER.unpack_from(self._buffer, 0)
+        if magic != _MAGIC or version != _VERSION:
+            self.close()
+            raise ValueError(f"Not a scan trace: {path}")
+
+    def __iter__(self) -> Iterator[TraceEvent]:
+        buffer = self._buffer
+        size = len(buffer)
+        offset = _HEADER.size
+        while offset + _RECORD.size <= size:
+            kind, flags, time_ns, name_len, tag_len, payload_len = _RECORD.unpack_from(buffer, offset)
+            start = offset + _RECORD.size
+            end = start + name_len + tag_len + payload_len
+            if end > size:
+                # Torn final record from an interrupted recording
+                break
+            name = buffer[start:start + name_len].decode("utf-8")
+            start += name_len
+            tag_id = buffer[start:start + tag_len].decode("utf-8")
+            start += tag_len
+            payload = buffer[start:end]
+            if flags & FLAG_TEXT:
+                payload = payload.decode("utf-8")
+            yield TraceEvent(kind, time_ns, name, tag_id, payload)
+            offset = end
+
+    def close(self):
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+        self._buffer = b""
+        self._file.close()
+
+    def __enter__(self) -> "TraceReader":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class TraceReplayer:
+    """Stream a recorded trace back through an engine's outputs.
+
+    Emit events are sent with ``SimulatorEngine.send_payload``, so the exact
+    recorded payloads go out, to the recorded output names unless remapped
+    by ``output_map``.  Events are scheduled against the trace timestamps on
+    an absolute clock, scaled by ``speed`` (1.0 is real time, 10.0 is ten
+    times faster, 0 is as fast as possible).  Line events are passed to
+    ``on_line(source, line)`` at their recorded time if it is given.
+    """
+
+    def __init__(self, engine: SimulatorEngine, path: str, speed: float = 1.0,
+                 output_map: Optional[Dict[str, str]] = None,
+                 on_line: Optional[Callable[[str, str], None]] = None):
+        if speed < 0:
+            raise ValueError("speed must not be negative")
+        self.engine = engine
+        self.path = path
+        self.speed = speed
+        self.output_map = output_map or {}
+        self.on_line = on_line
+
+        self.events_replayed = 0
+        self.lines_replayed = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self.running = False
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Replay on a background thread"""
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self.run, name="trace-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop an active replay"""
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1.0)
+
+    def wait(self, timeout: Optional[float] = None):
+        """Wait for a background replay to finish"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run(self):
+        """Replay the whole trace on the calling thread"""
+        self.running = True
+        self._stop_event.clear()
+        self.events_replayed = self.lines_replayed = self.errors = 0
+        self.max_lag = 0.0
+        try:
+            with TraceReader(self.path) as reader:
+                start = time.perf_counter()
+                for event in reader:
+                    if self._stop_event.is_set():
+                        break
+                    if self.speed:
+                        target = start + event.time_ns / 1e9 / self.speed
+                        sleep_until(target, self._stop_event)
+                        if self._stop_event.is_set():
+                            break
+                        self.max_lag = max(self.max_lag, time.perf_counter() - target)
+                    self._replay(event)
+        finally:
+            self.running = False
+
+    def _replay(self, event: TraceEvent):
+        if event.kind == KIND_EMIT:
+            output = self.output_map.get(event.name, event.name)
+            try:
+                self.engine.send_payload(output, event.payload, event.tag_id)
+            except Exception as e:
+                self.errors += 1
+                print(f"Replay to {output} failed: {e}")
+            self.events_replayed += 1
+        elif event.kind == KIND_LINE and self.on_line:
+            self.on_line(event.name, event.payload)
+            self.lines_replayed += 1
+
+
+def dump(path: str, limit: Optional[int] = None):
+    """Print a trace's events"""
+    with TraceReader(path) as reader:
+        print(f"Recorded at {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.started_at))}")
+        for i, event in enumerate(reader):
+            if limit is not None and i >= limit:
+                break
+            kind = "emit" if event.kind == KIND_EMIT else "line"
+            payload = event.payload if isinstance(event.payload, str) else event.payload.hex()
+            print(f"{event.time_ns / 1e6:12.3f} ms  {kind}  {event.name:10s} {event.tag_id[:8]:8s}  {payload[:60]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or replay a scan trace")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    dump_parser = subparsers.add_parser("dump", help="print the events in a trace")
+    dump_parser.add_argument("trace")
+    dump_parser.add_argument("--limit", type=int)
+    replay_parser = subparsers.add_parser("replay", help="replay a trace to a serial port")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--port", required=True, help="serial port every output is replayed to")
+    replay_parser.add_argument("--baudrate", type=int, default=115200)
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="multiple of real time (0 for as fast as possible)")
+    args = parser.parse_args()
+
+    if args.command == "dump":
+        dump(args.trace, args.limit)
+        return
+
+    from virtual_com_port import VirtualCOMPort
+    port = VirtualCOMPort(args.port, args.baudrate)
+    if not port.start(start_reader=False):
+        return
+    with TraceReader(args.trace) as reader:
+        names = {event.name for event in reader if event.kind == KIND_EMIT}
+    engine = SimulatorEngine()
+    engine.add_output(args.port, port.send_data)
+    replayer = TraceReplayer(engine, args.trace, args.speed, {name: args.port for name in names})
+    try:
+        replayer.run()
+    finally:
+        port.stop()
+    print(f"Replayed {replayer.events_replayed} events, {replayer.errors} errors, "
+          f"max lag {replayer.max_lag * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import queue
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+import metrics
+from simulator_core import SimulatorEngine
+
+
+class SendJob:
+    """A queued request to emit one tag to one or more outputs"""
+
+    __slots__ = ("tag_id", "outputs", "callback", "results", "error")
+
+    def __init__(self, tag_id: str, outputs: Iterable[str],
+                 callback: Optional[Callable[["SendJob"], None]] = None):
+        self.tag_id = tag_id
+        self.outputs = tuple(outputs)
+        self.callback = callback
+        self.results: Dict[str, object] = {}
+        self.error: Optional[Exception] = None
+
+
+class SendPipeline:
+    """Background dispatch of send jobs through a bounded queue and a worker pool.
+
+    Jobs are processed by ``workers`` threads.  Each output has its own lock,
+    so different outputs are driven in parallel while writes to a single
+    output (e.g. the keyboard) are never interleaved.  ``callback`` is invoked
+    on the worker thread once a job finishes; GUI callers should hand the
+    result back to their own thread.
+    """
+
+    def __init__(self, engine: SimulatorEngine, max_queue: int = 1000, workers: int = 4):
+        self.engine = engine
+        self.workers = workers
+        self.jobs: "queue.Queue[Optional[SendJob]]" = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._output_locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self.running = False
+        metrics.QUEUE_DEPTH.set_function(self.jobs.qsize)
+
+    def start(self):
+        """Start the worker threads"""
+        if self.running:
+            return
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"send-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 1.0):
+        """Stop the workers after the jobs already queued have been sent"""
+        if not self.running:
+            return
+        self.running = False
+        for _ in self._threads:
+            self.jobs.put(None)
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def submit(self, tag_id: str, outputs: Iterable[str],
+               callback: Optional[Callable[[SendJob], None]] = None) -> bool:
+        """Queue a send job, returning False if the queue is full"""
+        if not self.running:
+            self.start()
+        try:
+            self.jobs.put_nowait(SendJob(tag_id, outputs, callback))
+            return True
+        except queue.Full:
+            return False
+
+    @property
+    def queue_depth(self) -> int:
+        return self.jobs.qsize()
+
+    def _lock_for(self, output: str) -> threading.Lock:
+        lock = self._output_locks.get(output)
+        if lock is None:
+            with self._locks_guard:
+                lock = self._output_locks.setdefault(output, threading.Lock())
+        return lock
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            try:
+                for output in job.outputs:
+                    with self._lock_for(output):
+                        job.results.update(self.engine.emit(job.tag_id, [output]))
+            except Exception as e:
+                job.error = e
+            if job.callback:
+                try:
+                    job.callback(job)
+                except Exception as e:
+                    print(f"Error in send callback: {e}")
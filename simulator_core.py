@@ -0,0 +1,347 @@
+import json
+import threading
+import uuid
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+import metrics
+from tag_bulk import ProgressCallback, read_tags, write_tags
+from tag_store import TagStore, DEFAULT_TAGS_FILE
+from tag_index import TagIndex
+from tag_encoders import (encode, parse_ndef_text, parse_uid, tag_content_text, tag_uid, Payload, ENCODERS,
+                          ENCODING_JSON_PRETTY, ENCODING_NDEF)
+from tag_memory import Layout, MemoryAccessError, MemoryImageStore, TagMemory, layout_for
+from tag_record import as_dict, diff_tags
+
+# Output names used by the GUI and the lazily created default outputs
+OUTPUT_SERIAL = "serial"
+OUTPUT_KEYBOARD = "keyboard"
+
+
+class TagNotFoundError(KeyError):
+    """Raised when an operation refers to a tag that is not in the store"""
+
+
+class SimulatorEngine:
+    """UI-free simulator core: tag CRUD, read/write simulation and output emission.
+
+    Outputs are plain callables taking the encoded payload, each with its own
+    wire encoding (see ``tag_encoders``).  Encoded payloads are cached per tag
+    and dropped when the tag is written or deleted.  The serial and keyboard
+    outputs are only imported when first requested, so importing this module
+    never pulls in ``tkinter``, ``pyautogui`` or ``serial``.
+
+    Any thread may read, encode and emit tags without locking.  Writes
+    (create, write, edit, delete, import, load) are serialized by one lock
+    that covers the store, the index and the payload cache, and
+    ``generation`` is bumped by each of them so readers can tell whether
+    something they derived from a tag may already be stale.
+
+    With a ``memory`` store every tag can also have an emulated chip memory
+    image (see ``tag_memory``), created on first use by ``tag_memory``.
+    Writes keep images in step with their records: a new content rewrites
+    the image's NDEF message (unless the tag is locked), a new UID or a
+    content too large for the chip means a fresh image, and deleting a tag
+    drops its image.
+    """
+
+    def __init__(self, store: Optional[TagStore] = None, path: str = DEFAULT_TAGS_FILE,
+                 default_encoding: str = ENCODING_JSON_PRETTY, lazy: bool = False,
+                 memory: Optional[MemoryImageStore] = None):
+        self.store = store if store is not None else TagStore(path, lazy=lazy)
+        self.memory = memory
+        self.default_encoding = default_encoding
+        self.outputs: Dict[str, Callable[[Payload], object]] = {}
+        self.output_encodings: Dict[str, str] = {}
+        self._payload_cache: Dict[str, Dict[str, Payload]] = {}
+        self.index = TagIndex(self.store.tags)
+        # Optional scan_trace.TraceRecorder capturing every payload sent to an output
+        self.recorder = None
+        self._change_listeners: List[Callable[[Optional[str]], None]] = []
+        self._write_lock = threading.RLock()
+        self.generation = 0
+
+    @property
+    def tags(self) -> Dict[str, dict]:
+        return self.store.tags
+
+    def load(self) -> Dict[str, dict]:
+        """Load tags from the backing store"""
+        with self._write_lock:
+            tags = self.store.load_tags()
+            self.index.rebuild(tags)
+            self.generation += 1
+            self._payload_cache.clear()
+            return tags
+
+    def close(self):
+        """Flush pending changes to disk"""
+        self.store.close()
+        if self.memory is not None:
+            self.memory.close()
+
+    def add_change_listener(self, callback: Callable[[Optional[str]], None]):
+        """Call ``callback(tag_id)`` whenever a tag is created, written or deleted
+
+        After a bulk import the callback gets None, meaning any tag may have changed.
+        """
+        self._change_listeners.append(callback)
+
+    def remove_change_listener(self, callback: Callable[[Optional[str]], None]):
+        if callback in self._change_listeners:
+            self._change_listeners.remove(callback)
+
+    def get_tag(self, tag_id: str) -> dict:
+        """Return a tag's record"""
+        try:
+            return self.tags[tag_id]
+        except KeyError:
+            raise TagNotFoundError(tag_id) from None
+
+    def create_tag(self, content: str = "Sample NFC Tag Data") -> str:
+        """Create a new virtual NFC tag and return its ID"""
+        tag_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        tag_data = {
+            "id": tag_id,
+            "created_at": now,
+            "last_modified": now,
+            "data": {
+                "type": "virtual_nfc_tag",
+                "version": "1.0",
+                "content": content
+            }
+        }
+        with self._write_lock:
+            self.store.put(tag_id, tag_data)
+            self.index.add(tag_id, tag_data)
+            self._notify_changed(tag_id)
+        return tag_id
+
+    def delete_tag(self, tag_id: str):
+        """Delete a tag"""
+        with self._write_lock:
+            self.get_tag(tag_id)
+            self.store.delete(tag_id)
+            self.index.remove(tag_id)
+            self._notify_changed(tag_id)
+
+    def write_tag(self, tag_id: str, tag_data: dict) -> dict:
+        """Simulate writing to a tag, replacing its record (returns the record written)
+
+        Raises ValueError if the record's ``uid`` is not a hex string.
+        """
+        # Copy rather than stamp the caller's dict, which may be the stored
+        # record other threads are reading
+        tag_data = dict(as_dict(tag_data), last_modified=datetime.now().isoformat())
+        _check_uid(tag_data)
+        with self._write_lock:
+            self.get_tag(tag_id)
+            self.store.put(tag_id, tag_data)
+            self.index.update(tag_id, tag_data)
+            self._notify_changed(tag_id)
+        return tag_data
+
+    def edit_tag(self, tag_id: str, tag_data: dict) -> Optional[dict]:
+        """Write only the fields of ``tag_data`` that differ from the stored record
+
+        Returns the updated record, or None if nothing changed.  Raises
+        ValueError if ``tag_data`` is not an object, changes the tag ID or
+        has a ``uid`` that is not a hex string.
+        """
+        if not isinstance(tag_data, dict):
+            raise ValueError("Tag data must be a JSON object")
+        if tag_data.get("id", tag_id) != tag_id:
+            raise ValueError("The tag ID cannot be changed")
+        _check_uid(tag_data)
+        with self._write_lock:
+            changed, removed = diff_tags(as_dict(self.get_tag(tag_id)), tag_data)
+            # last_modified is always set by the write itself
+            changed = [(path, value) for path, value in changed if path != ("last_modified",)]
+            removed = [path for path in removed if path != ("last_modified",)]
+            if not changed and not removed:
+                return None
+            changed.append((("last_modified",), datetime.now().isoformat()))
+            tag = self.store.patch(tag_id, changed, removed)
+            self.index.update(tag_id, tag)
+            self._notify_changed(tag_id)
+        return tag
+
+    def import_tags(self, path: str, fmt: Optional[str] = None,
+                    progress: Optional[ProgressCallback] = None) -> int:
+        """Add or replace tags from a bulk file (see ``tag_bulk``) in one store commit
+
+        Returns the number of tags imported.  A malformed file raises
+        ValueError and leaves the store unchanged.
+        """
+        return self.add_tags(read_tags(path, fmt, progress))
+
+    def add_tags(self, tags: Iterable[dict]) -> int:
+        """Add or replace many tag records (each with an ``id``) in one store commit
+
+        Returns the number of tags stored.  If ``tags`` raises part way
+        through, the store is left unchanged.
+        """
+        with self._write_lock:
+            count = self.store.put_many((tag["id"], tag) for tag in tags)
+            self.index.rebuild(self.tags)
+            self._notify_changed(None)
+        return count
+
+    def export_tags(self, path: str, fmt: Optional[str] = None,
+                    progress: Optional[ProgressCallback] = None) -> int:
+        """Write every tag to a bulk file (see ``tag_bulk``), returning how many were written"""
+        return write_tags(path, self._exported_tags(), fmt, progress, len(self.tags))
+
+    def read_tag(self, tag_id: str, outputs: Iterable[str] = ()) -> dict:
+        """Simulate reading a tag, emitting it to the given outputs"""
+        tag_data = self.get_tag(tag_id)
+        if outputs:
+            self.emit(tag_id, outputs)
+        return tag_data
+
+    def tag_memory(self, tag_id: str, layout: Optional[Layout] = None) -> TagMemory:
+        """The tag's emulated memory, created from its UID and NDEF message on first use
+
+        New images get ``layout``, or the smallest layout holding the
+        message (``tag_memory.layout_for``).  Raises ValueError without a
+        memory store or if no layout suits the tag.
+        """
+        if self.memory is None:
+            raise ValueError("The engine has no memory store")
+        memory = self.memory.get(tag_id)
+        if memory is not None:
+            return memory
+        with self._write_lock:
+            memory = self.memory.get(tag_id)
+            if memory is None:
+                tag = self.get_tag(tag_id)
+                uid = tag_uid(tag)
+                message = encode(tag, ENCODING_NDEF)
+                memory = self.memory.create(tag_id, layout or layout_for(uid, message), uid, message)
+        return memory
+
+    def encode_tag(self, tag_id: str, encoding: Optional[str] = None) -> Payload:
+        """Return the (cached) payload sent to outputs for a tag"""
+        encoding = encoding or self.default_encoding
+        cached = self._payload_cache.get(tag_id)
+        if cached is not None:
+            payload = cached.get(encoding)
+            if payload is not None:
+                return payload
+        generation = self.generation
+        payload = encode(self.get_tag(tag_id), encoding)
+        self._payload_cache.setdefault(tag_id, {})[encoding] = payload
+        if self.generation != generation:
+            # A write raced with the encoding, so the cached payload may be
+            # stale; writers bump the generation before dropping cache entries
+            self._payload_cache.pop(tag_id, None)
+        return payload
+
+    def add_output(self, name: str, send: Callable[[Payload], object], encoding: Optional[str] = None):
+        """Register an output callable under a name, optionally with its own encoding"""
+        self.outputs[name] = send
+        if encoding:
+            self.output_encodings[name] = encoding
+
+    def remove_output(self, name: str):
+        """Unregister an output"""
+        self.outputs.pop(name, None)
+        self.output_encodings.pop(name, None)
+
+    def set_output_encoding(self, name: str, encoding: Optional[str]):
+        """Choose the wire encoding for an output (None for the default)"""
+        if encoding:
+            if encoding not in ENCODERS:
+                raise ValueError(f"Unknown encoding: {encoding}")
+            self.output_encodings[name] = encoding
+        else:
+            self.output_encodings.pop(name, None)
+
+    def emit(self, tag_id: str, outputs: Iterable[str]) -> Dict[str, object]:
+        """Send a tag's payload to each named output and return their results"""
+        results = {}
+        for name in outputs:
+            payload = self.encode_tag(tag_id, self.output_encodings.get(name))
+            results[name] = self.send_payload(name, payload, tag_id)
+        return results
+
+    def send_payload(self, name: str, payload: Payload, tag_id: str = "") -> object:
+        """Send an already encoded payload to a named output (used by emit and trace replay)"""
+        if self.recorder is not None:
+            self.recorder.record_emit(tag_id, name, payload)
+        result = self._get_output(name)(payload)
+        if metrics.ENABLED:
+            metrics.SCANS_EMITTED.inc(1, name)
+        return result
+
+    def _exported_tags(self) -> Iterable[dict]:
+        # Lazy stores hand over the raw body, which skips building a cached record
+        raw = getattr(self.tags, "raw", None)
+        for tag_id in list(self.tags):
+            try:
+                tag = json.loads(raw(tag_id)) if raw else self.tags[tag_id]
+            except KeyError:
+                # Deleted while exporting
+                continue
+            yield tag if "id" in tag else dict(as_dict(tag), id=tag_id)
+
+    def _notify_changed(self, tag_id: Optional[str]):
+        """Invalidate what was derived from a tag (every tag if None) and tell the listeners"""
+        self.generation += 1
+        if tag_id is None:
+            self._payload_cache.clear()
+        else:
+            self._payload_cache.pop(tag_id, None)
+        if self.memory is not None:
+            self._sync_memory(tag_id)
+        for callback in self._change_listeners:
+            callback(tag_id)
+
+    def _sync_memory(self, tag_id: Optional[str]):
+        """Bring memory images in step with their records (every image if None)"""
+        tag_ids = self.memory.tag_ids() if tag_id is None else [tag_id] if tag_id in self.memory else []
+        for changed_id in tag_ids:
+            tag = self.tags.get(changed_id)
+            memory = self.memory.get(changed_id)
+            if tag is None or memory.uid != tag_uid(tag):
+                # Deleted, or a different chip: a new image is made on next use
+                self.memory.delete(changed_id)
+                continue
+            # Compare text rather than bytes, so a message a host wrote in its
+            # own way (another language code, say) is left as written
+            current = memory.ndef_message()
+            if current is not None and parse_ndef_text(bytes(current)) == tag_content_text(tag):
+                continue
+            try:
+                memory.set_ndef(encode(tag, ENCODING_NDEF))
+            except MemoryAccessError as e:
+                print(f"Memory of tag {changed_id} not updated: {e}")
+            except ValueError:
+                # Outgrew the chip: the next image gets a layout it fits in
+                self.memory.delete(changed_id)
+
+    def _get_output(self, name: str) -> Callable[[Payload], object]:
+        send = self.outputs.get(name)
+        if send is None:
+            send = _default_output(name)
+            self.outputs[name] = send
+        return send
+
+
+def _check_uid(tag_data: dict):
+    """Reject a ``uid`` that would make every encoding of the tag fail"""
+    uid = tag_data.get("uid")
+    if uid:
+        parse_uid(uid)
+
+
+def _default_output(name: str) -> Callable[[Payload], object]:
+    """Import the built-in output backends on first use"""
+    if name == OUTPUT_SERIAL:
+        from virtual_com_port import send_serial_data
+        return send_serial_data
+    if name == OUTPUT_KEYBOARD:
+        from virtual_input import send_nfc_data
+        return send_nfc_data
+    raise KeyError(f"Unknown output: {name}")
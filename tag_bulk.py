@@ -0,0 +1,392 @@
+"""Streaming bulk import and export of tag sets.
+
+Three file formats are supported, chosen by extension or by name:
+
+    jsonl   One JSON object per line (.jsonl, .ndjson)
+    csv     A header row naming the columns, then one tag per row (.csv)
+    nfccol  Binary columnar: the columns of up to ROW_GROUP_SIZE tags are
+            stored together in row groups (.nfccol)
+
+Exported JSON Lines hold complete tag records.  CSV and columnar files hold
+the columns in ``COLUMNS``; ``extra`` is a JSON object with any other fields
+of the record.  Rows with an ``extra`` column, as exported ones have, are
+read back without defaults, so a round trip keeps the whole record; rows
+without one get the default ``type`` and ``version``.  On import every
+column is optional, an ``ndef`` column (hex NDEF message holding a Text
+record) may stand in for ``content``, and a JSON Lines object without a
+``data`` field is read as a row with those columns.  Tags without an ID get
+a new one and missing timestamps are set to the import time.
+
+Files are read and written one tag (or one row group) at a time, so memory
+use does not grow with the file.
+
+Usage:
+    python tag_bulk.py import inventory.csv [--tags nfc_tags.json]
+    python tag_bulk.py export fleet.nfccol [--tags nfc_tags.json]
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import struct
+import sys
+import uuid
+from array import array
+from datetime import datetime
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
+
+from tag_encoders import parse_ndef_text, parse_uid
+from tag_record import as_dict
+from tag_store import TagStore, DEFAULT_TAGS_FILE
+
+FORMAT_JSONL = "jsonl"
+FORMAT_CSV = "csv"
+FORMAT_COLUMNAR = "nfccol"
+
+COLUMNS = ("id", "uid", "created_at", "last_modified", "type", "version", "content", "extra")
+
+# Tags per row group in columnar files
+ROW_GROUP_SIZE = 4096
+
+# Tags between progress callbacks
+PROGRESS_EVERY = 1000
+
+# progress(tags so far, fraction complete)
+ProgressCallback = Callable[[int, float], None]
+
+_EXTENSIONS = {
+    ".jsonl": FORMAT_JSONL,
+    ".ndjson": FORMAT_JSONL,
+    ".csv": FORMAT_CSV,
+    ".nfccol": FORMAT_COLUMNAR,
+}
+
+_MAGIC = b"NFCCOL"
+_VERSION = 1
+_HEADER = struct.Struct("<6sHH")
+_U16 = struct.Struct("<H")
+_U32 = struct.Struct("<I")
+# Column offsets are stored little-endian
+_SWAP_OFFSETS = sys.byteorder != "little"
+
+_RECORD_KEYS = ("id", "uid", "created_at", "last_modified", "data")
+_DATA_KEYS = ("type", "version", "content")
+
+
+def format_for(path: str, fmt: Optional[str] = None) -> str:
+    """The bulk format named by ``fmt`` or by the file extension"""
+    if fmt is None:
+        fmt = _EXTENSIONS.get(os.path.splitext(path)[1].lower())
+        if fmt is None:
+            raise ValueError(f"Unknown bulk format for {path} (use .jsonl, .csv or .nfccol)")
+    elif fmt not in _READERS:
+        raise ValueError(f"Unknown bulk format: {fmt}")
+    return fmt
+
+
+def read_tags(path: str, fmt: Optional[str] = None,
+              progress: Optional[ProgressCallback] = None) -> Iterator[dict]:
+    """Stream the tag records in a bulk file"""
+    reader = _READERS[format_for(path, fmt)]
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        records = reader(f)
+        if progress:
+            records = _with_progress(records, progress, lambda count: f.tell() / size if size else 1.0)
+        yield from records
+
+
+def write_tags(path: str, tags: Iterable[dict], fmt: Optional[str] = None,
+               progress: Optional[ProgressCallback] = None, total: Optional[int] = None) -> int:
+    """Stream tag records to a bulk file, returning how many were written
+
+    ``total`` is the expected number of tags, used for progress reporting.
+    The file is written under a temporary name and renamed when complete.
+    """
+    writer = _WRITERS[format_for(path, fmt)]
+    if progress:
+        tags = _with_progress(tags, progress, lambda count: count / total if total else 0.0)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            count = writer(f, tags)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return count
+
+
+def record_to_row(tag: dict) -> List[str]:
+    """A tag record as CSV/columnar column values"""
+    record = as_dict(tag)
+    extra = {key: value for key, value in record.items() if key not in _RECORD_KEYS}
+    data = record.get("data")
+    fields = {}
+    if isinstance(data, dict):
+        extra_data = {}
+        for key, value in data.items():
+            # An empty column reads back as missing, so empty strings go in extra
+            if key in _DATA_KEYS and isinstance(value, str) and value:
+                fields[key] = value
+            else:
+                extra_data[key] = value
+        if extra_data:
+            extra["data"] = extra_data
+    elif data is not None:
+        extra["data"] = data
+    return [
+        _text(record.get("id")),
+        _text(record.get("uid")),
+        _text(record.get("created_at")),
+        _text(record.get("last_modified")),
+        fields.get("type", ""),
+        fields.get("version", ""),
+        fields.get("content", ""),
+        json.dumps(extra, separators=(",", ":")) if extra else "",
+    ]
+
+
+def row_to_record(row: Dict[str, Any]) -> dict:
+    """A tag record from named column values
+
+    Missing or empty columns take defaults, except that rows with an ``extra``
+    column (exported ones) get no default ``type``, ``version`` or ``content``.
+    """
+    now = datetime.now().isoformat()
+    content = row.get("content") or ""
+    ndef = row.get("ndef")
+    if ndef and not content:
+        try:
+            content = parse_ndef_text(bytes.fromhex(ndef))
+        except ValueError:
+            content = None
+        if content is None:
+            raise ValueError("ndef is not an NDEF Text record")
+    if "extra" in row:
+        data = {key: row[key] for key in _DATA_KEYS if row.get(key)}
+        if content:
+            data["content"] = content
+    else:
+        data = {
+            "type": row.get("type") or "virtual_nfc_tag",
+            "version": row.get("version") or "1.0",
+            "content": content,
+        }
+    record = {
+        "id": row.get("id") or str(uuid.uuid4()),
+        "created_at": row.get("created_at") or now,
+        "last_modified": row.get("last_modified") or now,
+        "data": data,
+    }
+    if row.get("uid"):
+        record["uid"] = row["uid"]
+    extra = row.get("extra")
+    if extra:
+        extra = json.loads(extra) if isinstance(extra, str) else extra
+        if not isinstance(extra, dict):
+            raise ValueError("extra must be a JSON object")
+        extra_data = extra.pop("data", None)
+        if isinstance(extra_data, dict):
+            record["data"].update(extra_data)
+        elif extra_data is not None:
+            record["data"] = extra_data
+        record.update(extra)
+    return _checked(record)
+
+
+def _checked(record: dict) -> dict:
+    if not isinstance(record.get("id"), str) or not record["id"]:
+        raise ValueError("tag ID must be a non-empty string")
+    uid = record.get("uid")
+    if uid:
+        # Fail on import rather than on the first scan
+        parse_uid(uid)
+    return record
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _with_progress(records: Iterable[dict], progress: ProgressCallback,
+                   fraction: Callable[[int], float]) -> Iterator[dict]:
+    count = 0
+    for record in records:
+        yield record
+        count += 1
+        if count % PROGRESS_EVERY == 0:
+            progress(count, fraction(count))
+    progress(count, 1.0)
+
+
+def _read_jsonl(f: BinaryIO) -> Iterator[dict]:
+    for line_no, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            entry = json.loads(line)
+            if not isinstance(entry, dict):
+                raise ValueError("expected a JSON object")
+            if "data" in entry:
+                entry.setdefault("id", str(uuid.uuid4()))
+                yield _checked(entry)
+            else:
+                yield row_to_record(entry)
+        except ValueError as e:
+            raise ValueError(f"line {line_no}: {e}") from None
+
+
+def _write_jsonl(f: BinaryIO, tags: Iterable[dict]) -> int:
+    count = 0
+    for tag in tags:
+        f.write(json.dumps(as_dict(tag), separators=(",", ":")).encode("utf-8") + b"\n")
+        count += 1
+    return count
+
+
+def _read_csv(f: BinaryIO) -> Iterator[dict]:
+    # utf-8-sig skips the byte order mark spreadsheet exports start with
+    text = io.TextIOWrapper(f, encoding="utf-8-sig", newline="")
+    try:
+        reader = csv.DictReader(text)
+        for row in reader:
+            try:
+                yield row_to_record(row)
+            except ValueError as e:
+                raise ValueError(f"line {reader.line_num}: {e}") from None
+    finally:
+        # Leave the binary file open for the caller
+        text.detach()
+
+
+def _write_csv(f: BinaryIO, tags: Iterable[dict]) -> int:
+    text = io.TextIOWrapper(f, encoding="utf-8", newline="")
+    try:
+        writer = csv.writer(text)
+        writer.writerow(COLUMNS)
+        count = 0
+        for tag in tags:
+            writer.writerow(record_to_row(tag))
+            count += 1
+        text.flush()
+    finally:
+        text.detach()
+    return count
+
+
+def _read_columnar(f: BinaryIO) -> Iterator[dict]:
+    header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        raise ValueError("not a columnar tag file")
+    magic, version, column_count = _HEADER.unpack(header)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError("not a columnar tag file")
+    names = []
+    for _ in range(column_count):
+        (length,) = _U16.unpack(_read_exact(f, _U16.size))
+        names.append(_read_exact(f, length).decode("utf-8"))
+
+    while True:
+        (rows,) = _U32.unpack(_read_exact(f, _U32.size))
+        if rows == 0:
+            return
+        columns = [_read_column(f, rows) for _ in names]
+        for values in zip(*columns):
+            yield row_to_record(dict(zip(names, values)))
+
+
+def _read_column(f: BinaryIO, rows: int) -> List[str]:
+    (size,) = _U32.unpack(_read_exact(f, _U32.size))
+    offsets = array("I")
+    offsets.frombytes(_read_exact(f, (rows + 1) * offsets.itemsize))
+    if _SWAP_OFFSETS:
+        offsets.byteswap()
+    data = _read_exact(f, size)
+    return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(rows)]
+
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("columnar tag file is truncated")
+    return data
+
+
+def _write_columnar(f: BinaryIO, tags: Iterable[dict]) -> int:
+    f.write(_HEADER.pack(_MAGIC, _VERSION, len(COLUMNS)))
+    for name in COLUMNS:
+        encoded = name.encode("utf-8")
+        f.write(_U16.pack(len(encoded)) + encoded)
+
+    count = 0
+    group = []
+    for tag in tags:
+        group.append(record_to_row(tag))
+        count += 1
+        if len(group) == ROW_GROUP_SIZE:
+            _write_row_group(f, group)
+            group = []
+    if group:
+        _write_row_group(f, group)
+    f.write(_U32.pack(0))
+    return count
+
+
+def _write_row_group(f: BinaryIO, rows: List[List[str]]):
+    f.write(_U32.pack(len(rows)))
+    for values in zip(*rows):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("I", [0])
+        end = 0
+        for value in encoded:
+            end += len(value)
+            offsets.append(end)
+        if _SWAP_OFFSETS:
+            offsets.byteswap()
+        f.write(_U32.pack(end))
+        f.write(offsets.tobytes())
+        f.write(b"".join(encoded))
+
+
+_READERS = {
+    FORMAT_JSONL: _read_jsonl,
+    FORMAT_CSV: _read_csv,
+    FORMAT_COLUMNAR: _read_columnar,
+}
+
+_WRITERS = {
+    FORMAT_JSONL: _write_jsonl,
+    FORMAT_CSV: _write_csv,
+    FORMAT_COLUMNAR: _write_columnar,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk import or export tags")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file", help="bulk file (.jsonl, .csv or .nfccol)")
+    parser.add_argument("--format", choices=sorted(_READERS), help="override the format implied by the extension")
+    parser.add_argument("--tags", default=DEFAULT_TAGS_FILE, help="tag store to import into or export from")
+    args = parser.parse_args()
+
+    def report(count: int, fraction: float):
+        print(f"\r{count:,} tags ({fraction:.0%})", end="", flush=True)
+
+    store = TagStore(args.tags, lazy=True)
+    store.load_tags()
+    try:
+        if args.command == "import":
+            count = store.put_many((tag["id"], tag) for tag in read_tags(args.file, args.format, report))
+            print(f"\nImported {count:,} tags into {args.tags}")
+        else:
+            tags = (store.tags[tag_id] for tag_id in store.tags)
+            count = write_tags(args.file, tags, args.format, report, len(store.tags))
+            print(f"\nExported {count:,} tags to {args.file}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
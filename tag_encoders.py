@@ -0,0 +1,142 @@
+import json
+import struct
+import uuid
+from typing import Callable, Dict, Optional, Union
+
+from tag_record import TagRecord, as_dict
+
+Payload = Union[str, bytes]
+
+ENCODING_JSON_PRETTY = "json_pretty"
+ENCODING_JSON = "json"
+ENCODING_UID_HEX = "uid_hex"
+ENCODING_NDEF = "ndef"
+ENCODING_FRAME = "frame"
+
+# ISO/IEC 7816-6 manufacturer code used for UIDs derived from tag IDs (NXP)
+DEFAULT_MANUFACTURER = 0x04
+
+# Frame type byte for length-prefixed frames
+FRAME_TYPE_READ = 0x01
+# Largest frame body the 2-byte length prefix can describe
+MAX_FRAME_BODY = 0xFFFF
+
+
+def parse_uid(uid: str) -> bytes:
+    """UID bytes from a hex string (colons allowed), raising ValueError if it is not one"""
+    try:
+        return bytes.fromhex(uid.replace(":", ""))
+    except (AttributeError, ValueError):
+        raise ValueError(f"uid {uid!r} is not a hex string") from None
+
+
+def tag_uid(tag_data: dict) -> bytes:
+    """Return a tag's UID bytes.
+
+    Uses the tag's ``uid`` field (hex) when present; otherwise derives a stable
+    7-byte UID from the tag ID, as used by NTAG/Ultralight tags.
+    """
+    uid = tag_data.get("uid")
+    if uid:
+        return parse_uid(uid)
+    if isinstance(tag_data, TagRecord) and tag_data.uid_bytes:
+        return bytes([DEFAULT_MANUFACTURER]) + tag_data.uid_bytes[:6]
+    try:
+        raw = uuid.UUID(tag_data["id"]).bytes
+    except (KeyError, ValueError):
+        raw = str(tag_data.get("id", "")).encode("utf-8").ljust(6, b"\0")
+    return bytes([DEFAULT_MANUFACTURER]) + raw[:6]
+
+
+def ndef_text_record(text: str, lang: str = "en") -> bytes:
+    """Encode a single NDEF Text record (well-known type 'T') as a complete message"""
+    lang_bytes = lang.encode("ascii")
+    payload = bytes([len(lang_bytes)]) + lang_bytes + text.encode("utf-8")
+    # MB | ME | TNF=well-known, plus SR when the payload fits in one length byte
+    if len(payload) < 256:
+        header = struct.pack(">BBB", 0xD1, 1, len(payload))
+    else:
+        header = struct.pack(">BBI", 0xC1, 1, len(payload))
+    return header + b"T" + payload
+
+
+def parse_ndef_text(message: bytes) -> Optional[str]:
+    """Text carried by an NDEF message whose first record is a Text record, or None"""
+    try:
+        header, type_length = message[0], message[1]
+        if header & 0x07 != 0x01:
+            return None
+        if header & 0x10:
+            payload_length, offset = message[2], 3
+        else:
+            payload_length, offset = struct.unpack_from(">I", message, 2)[0], 6
+        id_length = 0
+        if header & 0x08:
+            id_length = message[offset]
+            offset += 1
+        record_type = message[offset:offset + type_length]
+        offset += type_length + id_length
+        payload = message[offset:offset + payload_length]
+        if record_type != b"T" or len(payload) != payload_length or not payload:
+            return None
+        status = payload[0]
+        return payload[1 + (status & 0x3F):].decode("utf-16" if status & 0x80 else "utf-8")
+    except (IndexError, struct.error, UnicodeDecodeError):
+        return None
+
+
+def tag_content_text(tag_data: dict) -> str:
+    """The text carried by a tag's NDEF record"""
+    data = tag_data.get("data", {})
+    content = data.get("content") if isinstance(data, dict) else data
+    if isinstance(content, str):
+        return content
+    return json.dumps(content, separators=(",", ":"))
+
+
+def encode_json_pretty(tag_data: dict) -> str:
+    return json.dumps(as_dict(tag_data), indent=2)
+
+
+def encode_json(tag_data: dict) -> str:
+    return json.dumps(as_dict(tag_data), separators=(",", ":"))
+
+
+def encode_uid_hex(tag_data: dict) -> str:
+    return tag_uid(tag_data).hex().upper()
+
+
+def encode_ndef(tag_data: dict) -> bytes:
+    return ndef_text_record(tag_content_text(tag_data))
+
+
+def encode_frame(tag_data: dict) -> bytes:
+    """Length-prefixed binary frame: len(2, BE) | type | uid_len | uid | ndef"""
+    uid = tag_uid(tag_data)
+    body = bytes([FRAME_TYPE_READ, len(uid)]) + uid + encode_ndef(tag_data)
+    if len(body) > MAX_FRAME_BODY:
+        raise ValueError(f"Tag is too large for a frame: {len(body)} bytes, at most {MAX_FRAME_BODY}")
+    return struct.pack(">H", len(body)) + body
+
+
+ENCODERS: Dict[str, Callable[[dict], Payload]] = {
+    ENCODING_JSON_PRETTY: encode_json_pretty,
+    ENCODING_JSON: encode_json,
+    ENCODING_UID_HEX: encode_uid_hex,
+    ENCODING_NDEF: encode_ndef,
+    ENCODING_FRAME: encode_frame,
+}
+
+
+def register_encoder(name: str, encoder: Callable[[dict], Payload]):
+    """Register a custom encoder; str results are sent as text lines, bytes verbatim"""
+    ENCODERS[name] = encoder
+
+
+def encode(tag_data: dict, encoding: str = ENCODING_JSON_PRETTY) -> Payload:
+    """Encode a tag record in the named wire format"""
+    try:
+        encoder = ENCODERS[encoding]
+    except KeyError:
+        raise ValueError(f"Unknown encoding: {encoding}") from None
+    return encoder(tag_data)
@@ -0,0 +1,350 @@
+"""Synthetic tag fleets generated in bulk.
+
+``generate_tags`` builds realistic tag sets for load and soak testing:
+
+    UIDs        4, 7 or 10 bytes in configurable shares.  7- and 10-byte UIDs
+                start with an ISO/IEC 7816-6 manufacturer code drawn from
+                ``MANUFACTURERS``; 4-byte UIDs are random non-unique IDs, as
+                on MIFARE Classic, so large fleets contain a few duplicates.
+    Content     Text whose length in bytes follows a distribution such as
+                ``("lognormal", 48, 0.8)`` (see ``parse_distribution``).
+    Timestamps  Created uniformly over the ``span_days`` before ``end``, and
+                last modified uniformly between creation and ``end``.  ``end``
+                defaults to now, or to ``SEEDED_END`` when a seed is given.
+
+Random values are drawn for ``CHUNK_SIZE`` tags at a time with NumPy when it
+is installed, otherwise with the ``random`` module, so only building each
+record is done per tag.  The same seed, count and options give the same
+fleet with the same backend (the two backends draw different streams).
+Values are drawn a chunk at a time, each draw for every tag of the chunk, so
+the first N tags of a larger fleet are not the N tags of an N-tag fleet.
+
+Usage:
+    python tag_fleet.py 1000000 [--tags nfc_tags.json] [--seed 1] [--end 2025-01-01]
+    python tag_fleet.py 50000 --uid-sizes 7:0.6,4:0.4 --payload uniform:16,256
+"""
+import argparse
+import math
+import random
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+from tag_bulk import ProgressCallback
+from tag_store import TagStore, DEFAULT_TAGS_FILE
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+TAG_TYPE = "virtual_nfc_tag"
+TAG_VERSION = "1.0"
+
+# ISO/IEC 7816-6 manufacturer codes and their share of 7- and 10-byte UIDs
+MANUFACTURERS: Dict[int, float] = {
+    0x04: 0.70,  # NXP Semiconductors
+    0x02: 0.10,  # STMicroelectronics
+    0x05: 0.08,  # Infineon Technologies
+    0x07: 0.05,  # Texas Instruments
+    0x1D: 0.04,  # Shanghai Fudan Microelectronics
+    0x16: 0.03,  # EM Microelectronic-Marin
+}
+
+# Share of single, double and triple size UIDs
+DEFAULT_UID_SIZES: Dict[int, float] = {7: 0.85, 4: 0.12, 10: 0.03}
+
+DIST_FIXED = "fixed"
+DIST_UNIFORM = "uniform"
+DIST_NORMAL = "normal"
+DIST_LOGNORMAL = "lognormal"
+DISTRIBUTIONS = (DIST_FIXED, DIST_UNIFORM, DIST_NORMAL, DIST_LOGNORMAL)
+
+# (name, parameters...): fixed size, uniform low/high, normal mean/stddev, lognormal median/sigma
+Distribution = Tuple
+DEFAULT_PAYLOAD: Distribution = (DIST_LOGNORMAL, 48, 0.8)
+
+# Content is capped at the user memory of the largest NTAG (NTAG216)
+MAX_PAYLOAD = 888
+DEFAULT_SPAN_DAYS = 365.0
+
+# Tags whose random values are drawn together
+CHUNK_SIZE = 65536
+
+CASCADE_TAG = 0x88
+UID_SIZES = (4, 7, 10)
+_UID_STRIDE = 10
+
+_ALPHABET = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789 "
+# Maps random bytes onto the alphabet (the slight modulo bias does not matter here)
+_TEXT_TABLE = bytes(_ALPHABET[i % len(_ALPHABET)] for i in range(256))
+_EPOCH = datetime(1970, 1, 1)
+# End of the timestamp span for seeded fleets, so they do not depend on the clock
+SEEDED_END = datetime(2025, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def parse_distribution(spec: str) -> Distribution:
+    """Parse ``name:param,param`` (e.g. ``lognormal:48,0.8`` or ``fixed:32``) into a distribution"""
+    name, _, params = spec.partition(":")
+    try:
+        values = tuple(float(value) for value in params.split(",")) if params else ()
+    except ValueError:
+        raise ValueError(f"Bad distribution parameters: {spec!r}") from None
+    distribution = (name,) + values
+    _check_distribution(distribution)
+    return distribution
+
+
+def parse_shares(spec: str) -> Dict[int, float]:
+    """Parse ``size:share,...`` (e.g. ``7:0.85,4:0.15``) into UID size shares"""
+    shares = {}
+    for part in spec.split(","):
+        size, _, share = part.partition(":")
+        try:
+            shares[int(size)] = float(share) if share else 1.0
+        except ValueError:
+            raise ValueError(f"Bad UID size share: {part!r}") from None
+    return shares
+
+
+def generate_tags(count: int, seed: Optional[int] = None,
+                  uid_sizes: Dict[int, float] = DEFAULT_UID_SIZES,
+                  payload: Distribution = DEFAULT_PAYLOAD,
+                  end: Optional[datetime] = None, span_days: float = DEFAULT_SPAN_DAYS,
+                  manufacturers: Dict[int, float] = MANUFACTURERS,
+                  use_numpy: Optional[bool] = None,
+                  progress: Optional[ProgressCallback] = None) -> Iterator[dict]:
+    """Yield ``count`` synthetic tag records
+
+    ``use_numpy`` picks the backend (None uses NumPy when it is installed).
+    Without ``end`` timestamps end now, or at ``SEEDED_END`` when ``seed``
+    is given, so a seeded fleet is the same on every run.
+    Raises ValueError for unknown UID sizes, shares that do not sum to a
+    positive number or a malformed payload distribution.
+    """
+    sizes, size_weights = _weights(uid_sizes, "UID size")
+    for size in sizes:
+        if size not in UID_SIZES:
+            raise ValueError(f"UID size must be 4, 7 or 10 bytes, not {size}")
+    codes, code_weights = _weights(manufacturers, "manufacturer")
+    _check_distribution(payload)
+    if use_numpy is None:
+        use_numpy = NUMPY_AVAILABLE
+    elif use_numpy and not NUMPY_AVAILABLE:
+        raise ValueError("NumPy is not installed")
+    if end is None:
+        end = SEEDED_END if seed is not None else datetime.now()
+    end_us = (end - _EPOCH) // _MICROSECOND
+    start_us = end_us - int(span_days * 86400e6)
+
+    draw = _NumpyDraws(seed) if use_numpy else _RandomDraws(seed)
+    done = 0
+    while done < count:
+        n = min(CHUNK_SIZE, count - done)
+        ids = draw.ids(n)
+        uids = draw.uids(n, sizes, size_weights, codes, code_weights)
+        lengths = draw.lengths(payload, n)
+        text = draw.bytes(sum(lengths)).translate(_TEXT_TABLE).decode("ascii")
+        created, modified = draw.times(start_us, end_us, n)
+        offset = 0
+        for i in range(n):
+            length = lengths[i]
+            yield {
+                "id": ids[i],
+                "uid": uids[i],
+                "created_at": created[i],
+                "last_modified": modified[i],
+                "data": {"type": TAG_TYPE, "version": TAG_VERSION,
+                         "content": text[offset:offset + length]},
+            }
+            offset += length
+        done += n
+        if progress:
+            progress(done, done / count)
+
+
+def _weights(shares: Dict[int, float], what: str) -> Tuple[List[int], List[float]]:
+    keys = list(shares)
+    total = sum(shares.values())
+    if not keys or total <= 0 or any(share < 0 for share in shares.values()):
+        raise ValueError(f"{what} shares must be non-negative with a positive sum")
+    return keys, [shares[key] / total for key in keys]
+
+
+def _check_distribution(distribution: Distribution):
+    arity = {DIST_FIXED: 1, DIST_UNIFORM: 2, DIST_NORMAL: 2, DIST_LOGNORMAL: 2}
+    name = distribution[0] if distribution else None
+    if name not in arity:
+        raise ValueError(f"Unknown distribution {name!r}; use one of {', '.join(DISTRIBUTIONS)}")
+    if len(distribution) != arity[name] + 1:
+        raise ValueError(f"The {name} distribution takes {arity[name]} parameter(s)")
+
+
+def _uid_hex(raw: bytes, sizes: Sequence[int], codes: Sequence[int]) -> List[str]:
+    """Hex UIDs from ``_UID_STRIDE`` random bytes per tag"""
+    raw = bytearray(raw)
+    for i, size in enumerate(sizes):
+        base = i * _UID_STRIDE
+        if size == 4:
+            # A single size UID cannot start with the cascade tag
+            if raw[base] == CASCADE_TAG:
+                raw[base] = 0x08
+        else:
+            raw[base] = codes[i]
+            # Nor can the chunk sent at the last cascade level
+            last = base + size - 4
+            if raw[last] == CASCADE_TAG:
+                raw[last] = 0x08
+    digits = raw.hex().upper()
+    return [digits[2 * i * _UID_STRIDE:2 * (i * _UID_STRIDE + size)] for i, size in enumerate(sizes)]
+
+
+def _clip(length: float) -> int:
+    return min(max(int(round(length)), 0), MAX_PAYLOAD)
+
+
+class _RandomDraws:
+    """Random values from the ``random`` module"""
+
+    def __init__(self, seed: Optional[int]):
+        self.rng = random.Random(seed)
+
+    def bytes(self, n: int) -> bytes:
+        # Random.randbytes needs Python 3.9
+        return self.rng.getrandbits(8 * n).to_bytes(n, "little") if n else b""
+
+    def ids(self, n: int) -> List[str]:
+        getrandbits = self.rng.getrandbits
+        return [str(uuid.UUID(int=getrandbits(128), version=4)) for _ in range(n)]
+
+    def uids(self, n: int, sizes: List[int], size_weights: List[float],
+             codes: List[int], code_weights: List[float]) -> List[str]:
+        return _uid_hex(self.bytes(n * _UID_STRIDE), self.rng.choices(sizes, size_weights, k=n),
+                        self.rng.choices(codes, code_weights, k=n))
+
+    def lengths(self, distribution: Distribution, n: int) -> List[int]:
+        name, params, rng = distribution[0], distribution[1:], self.rng
+        if name == DIST_FIXED:
+            return [_clip(params[0])] * n
+        if name == DIST_UNIFORM:
+            low, high = _clip(params[0]), _clip(params[1])
+            return [rng.randint(low, high) for _ in range(n)]
+        if name == DIST_NORMAL:
+            return [_clip(rng.gauss(params[0], params[1])) for _ in range(n)]
+        mu = _log(params[0])
+        return [_clip(rng.lognormvariate(mu, params[1])) for _ in range(n)]
+
+    def times(self, start_us: int, end_us: int, n: int) -> Tuple[List[str], List[str]]:
+        randrange, random_ = self.rng.randrange, self.rng.random
+        created, modified = [], []
+        for _ in range(n):
+            at = randrange(start_us, end_us + 1)
+            created.append((_EPOCH + at * _MICROSECOND).isoformat())
+            modified.append((_EPOCH + (at + int(random_() * (end_us - at))) * _MICROSECOND).isoformat())
+        return created, modified
+
+
+class _NumpyDraws:
+    """Random values drawn as whole arrays with NumPy"""
+
+    def __init__(self, seed: Optional[int]):
+        self.rng = np.random.default_rng(seed)
+
+    def bytes(self, n: int) -> bytes:
+        return self.rng.bytes(n)
+
+    def ids(self, n: int) -> List[str]:
+        raw = np.frombuffer(self.rng.bytes(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+        # Version 4, RFC 4122 variant
+        raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+        raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+        digits = np.insert(_hex_digits(raw, b"0123456789abcdef"), [8, 12, 16, 20], ord("-"), axis=1)
+        text = digits.tobytes().decode("ascii")
+        return [text[i:i + 36] for i in range(0, 36 * n, 36)]
+
+    def uids(self, n: int, sizes: List[int], size_weights: List[float],
+             codes: List[int], code_weights: List[float]) -> List[str]:
+        # Same rules as _uid_hex, applied to every row at once
+        raw = np.frombuffer(self.rng.bytes(n * _UID_STRIDE), dtype=np.uint8).reshape(n, _UID_STRIDE).copy()
+        size = self.rng.choice(sizes, size=n, p=size_weights)
+        code = self.rng.choice(codes, size=n, p=code_weights)
+        multi = size != 4
+        raw[multi, 0] = code[multi]
+        rows, last = np.arange(n), size - 4
+        cascade = raw[rows, last] == CASCADE_TAG
+        raw[rows[cascade], last[cascade]] = 0x08
+        text = _hex_digits(raw, b"0123456789ABCDEF").tobytes().decode("ascii")
+        stride = 2 * _UID_STRIDE
+        return [text[i:i + 2 * length] for i, length in zip(range(0, stride * n, stride), size.tolist())]
+
+    def lengths(self, distribution: Distribution, n: int) -> List[int]:
+        name, params, rng = distribution[0], distribution[1:], self.rng
+        if name == DIST_FIXED:
+            return [_clip(params[0])] * n
+        if name == DIST_UNIFORM:
+            sizes = rng.integers(_clip(params[0]), _clip(params[1]), size=n, endpoint=True)
+        elif name == DIST_NORMAL:
+            sizes = rng.normal(params[0], params[1], size=n)
+        else:
+            sizes = rng.lognormal(_log(params[0]), params[1], size=n)
+        return np.clip(np.rint(sizes), 0, MAX_PAYLOAD).astype(np.int64).tolist()
+
+    def times(self, start_us: int, end_us: int, n: int) -> Tuple[List[str], List[str]]:
+        created = self.rng.integers(start_us, end_us, size=n, endpoint=True)
+        modified = created + (self.rng.random(n) * (end_us - created)).astype(np.int64)
+        return (np.datetime_as_string(created.astype("datetime64[us]"), unit="us").tolist(),
+                np.datetime_as_string(modified.astype("datetime64[us]"), unit="us").tolist())
+
+
+def _hex_digits(raw, digits: bytes):
+    """ASCII hex digits of a uint8 array, two columns per byte"""
+    table = np.frombuffer(digits, dtype=np.uint8)
+    out = np.empty((raw.shape[0], 2 * raw.shape[1]), dtype=np.uint8)
+    out[:, 0::2] = table[raw >> 4]
+    out[:, 1::2] = table[raw & 0x0F]
+    return out
+
+
+def _log(median: float) -> float:
+    if median <= 0:
+        raise ValueError("The lognormal median must be positive")
+    return math.log(median)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic tag fleet into a tag store")
+    parser.add_argument("count", type=int, help="number of tags to generate")
+    parser.add_argument("--tags", default=DEFAULT_TAGS_FILE, help="tag store to add the tags to")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--uid-sizes", type=parse_shares, default=DEFAULT_UID_SIZES,
+                        help="UID size shares, e.g. 7:0.85,4:0.12,10:0.03")
+    parser.add_argument("--payload", type=parse_distribution, default=DEFAULT_PAYLOAD,
+                        help=f"content length distribution ({', '.join(DISTRIBUTIONS)}), e.g. lognormal:48,0.8")
+    parser.add_argument("--days", type=float, default=DEFAULT_SPAN_DAYS, help="days the creation times span")
+    parser.add_argument("--end", type=datetime.fromisoformat,
+                        help="ISO date or time the timestamps end at (default: now, or "
+                             f"{SEEDED_END.date()} with --seed)")
+    parser.add_argument("--no-numpy", action="store_true", help="use the random module even if NumPy is installed")
+    args = parser.parse_args()
+
+    def report(count: int, fraction: float):
+        print(f"\r{count:,} tags ({fraction:.0%})", end="", flush=True)
+
+    store = TagStore(args.tags, lazy=True)
+    store.load_tags()
+    started = time.perf_counter()
+    try:
+        tags = generate_tags(args.count, args.seed, args.uid_sizes, args.payload, args.end, args.days,
+                             use_numpy=False if args.no_numpy else None, progress=report)
+        count = store.put_many((tag["id"], tag) for tag in tags)
+        print(f"\nGenerated {count:,} tags into {args.tags} in {time.perf_counter() - started:.1f}s")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
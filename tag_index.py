@@ -0,0 +1,294 @@
+import bisect
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class _Fenwick:
+    """Binary indexed tree over 0/1 slot occupancy"""
+
+    def __init__(self, size: int = 0):
+        self.size = 0
+        self.tree = [0]
+        self.grow(size)
+
+    @classmethod
+    def full(cls, size: int) -> "_Fenwick":
+        """Tree with the first ``size`` slots occupied, built in linear time"""
+        tree = cls()
+        tree.size = size
+        tree.tree = [0] * (size + 1)
+        for i in range(1, size + 1):
+            tree.tree[i] += 1
+            parent = i + (i & -i)
+            if parent <= size:
+                tree.tree[parent] += tree.tree[i]
+        return tree
+
+    def grow(self, size: int):
+        while self.size < size:
+            self.size += 1
+            # A new slot i covers the range (i - lowbit(i), i]; it starts
+            # empty, so its node only holds the sum of the slots it spans
+            i = self.size
+            low = i & -i
+            self.tree.append(self.prefix(i - 1) - self.prefix(i - low))
+
+    def add(self, slot: int, delta: int):
+        i = slot + 1
+        while i <= self.size:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, count: int) -> int:
+        """Number of occupied slots among the first ``count``"""
+        total = 0
+        i = count
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, rank: int) -> int:
+        """Slot holding the ``rank``-th (0-based) occupied entry"""
+        pos = 0
+        remaining = rank + 1
+        step = 1 << self.size.bit_length()
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < remaining:
+                pos = nxt
+                remaining -= self.tree[nxt]
+            step >>= 1
+        return pos
+
+
+class TagIndex:
+    """Ordered and searchable index over the tag store.
+
+    Tags keep their store (insertion) order.  Each tag owns a slot in an
+    append-only array; deleted slots are left empty and a Fenwick tree over
+    slot occupancy maps list positions to tag IDs and back in O(log n).
+    Secondary indexes support ID prefix, content token and modification
+    time searches without scanning every tag.  They are built on the first
+    search (or change) that needs them, so a rebuild only maps positions.
+    """
+
+    def __init__(self, tags: Optional[Dict[str, dict]] = None):
+        self.rebuild(tags or {})
+
+    def rebuild(self, tags: Dict[str, dict]):
+        """Rebuild all indexes from a tag dict"""
+        self._slots: List[Optional[str]] = list(tags)
+        self._slot_of: Dict[str, int] = {tag_id: i for i, tag_id in enumerate(self._slots)}
+        self._tree = _Fenwick.full(len(self._slots))
+        self._count = len(self._slots)
+
+        self._sorted_ids: Optional[List[str]] = None
+        # Until the modification time index is built, times are read from ``tags``
+        self._mtime_source: Optional[Dict[str, dict]] = tags
+        self._by_mtime: Optional[List[Tuple[str, str]]] = None
+        self._mtime_of: Optional[Dict[str, str]] = None
+        # Mappings that parse records on demand (LazyTags) have their content
+        # indexed on the first search
+        modified_of = getattr(tags, "modified_of", None)
+        self._tokens: Dict[str, Set[str]] = {}
+        self._tokens_of: Dict[str, Set[str]] = {}
+        self._sorted_tokens: Optional[List[str]] = None
+        self._unindexed: Optional[Dict[str, dict]] = None
+        if modified_of is None:
+            for tag_id, tag in tags.items():
+                self._index_tokens(tag_id, tag)
+        else:
+            self._unindexed = tags
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, tag_id: str) -> bool:
+        return tag_id in self._slot_of
+
+    def id_at(self, position: int) -> str:
+        """Tag ID at a list position"""
+        if not 0 <= position < self._count:
+            raise IndexError(position)
+        return self._slots[self._tree.find(position)]
+
+    def position_of(self, tag_id: str) -> int:
+        """List position of a tag ID"""
+        return self._tree.prefix(self._slot_of[tag_id])
+
+    def ids(self, start: int = 0, stop: Optional[int] = None) -> List[str]:
+        """Tag IDs for positions [start, stop)"""
+        stop = self._count if stop is None else min(stop, self._count)
+        if start >= stop:
+            return []
+        result = []
+        slot = self._tree.find(start)
+        while len(result) < stop - start:
+            tag_id = self._slots[slot]
+            if tag_id is not None:
+                result.append(tag_id)
+            slot += 1
+        return result
+
+    def add(self, tag_id: str, tag: dict):
+        """Index a new tag at the end of the list, or reindex an existing one"""
+        if tag_id in self._slot_of:
+            self.update(tag_id, tag)
+            return
+        # Index the times of the tags already listed before the new one is
+        self._mtime_index()
+        slot = len(self._slots)
+        self._slots.append(tag_id)
+        self._slot_of[tag_id] = slot
+        self._tree.grow(slot + 1)
+        self._tree.add(slot, 1)
+        self._count += 1
+        if self._sorted_ids is not None:
+            bisect.insort(self._sorted_ids, tag_id)
+        self._set_mtime(tag_id, tag.get("last_modified", ""))
+        self._index_tokens(tag_id, tag)
+
+    def update(self, tag_id: str, tag: dict):
+        """Reindex a tag whose record changed, keeping its position"""
+        self._set_mtime(tag_id, tag.get("last_modified", ""))
+        self._unindex_tokens(tag_id)
+        self._index_tokens(tag_id, tag)
+
+    def remove(self, tag_id: str):
+        """Drop a tag from all indexes"""
+        slot = self._slot_of.pop(tag_id, None)
+        if slot is None:
+            return
+        self._slots[slot] = None
+        self._tree.add(slot, -1)
+        self._count -= 1
+        if self._sorted_ids is not None:
+            i = bisect.bisect_left(self._sorted_ids, tag_id)
+            del self._sorted_ids[i]
+        self._set_mtime(tag_id, None)
+        self._unindex_tokens(tag_id)
+        # Reclaim empty slots once they dominate the array
+        if len(self._slots) > 64 and self._count < len(self._slots) // 2:
+            self._compact()
+
+    def modified_of(self, tag_id: str) -> str:
+        """A tag's last_modified timestamp"""
+        if self._mtime_of is None:
+            return _modified(self._mtime_source, tag_id) if tag_id in self._slot_of else ""
+        return self._mtime_of.get(tag_id, "")
+
+    def find_prefix(self, prefix: str, limit: Optional[int] = None) -> List[str]:
+        """Tag IDs starting with ``prefix``, in ID order"""
+        if self._sorted_ids is None:
+            self._sorted_ids = sorted(self._slot_of)
+        return _prefix_range(self._sorted_ids, prefix, limit)
+
+    def find_content(self, query: str) -> List[str]:
+        """Tag IDs whose content contains every word of ``query`` (the last word may be a prefix)"""
+        words = [w.lower() for w in _TOKEN_RE.findall(query)]
+        if not words:
+            return []
+        if self._unindexed is not None:
+            tags, self._unindexed = self._unindexed, None
+            for tag_id in self._slot_of:
+                self._index_tokens(tag_id, tags[tag_id])
+        matches: Optional[Set[str]] = None
+        for i, word in enumerate(words):
+            if i == len(words) - 1:
+                found = set()
+                for token in self._tokens_with_prefix(word):
+                    found |= self._tokens[token]
+            else:
+                found = self._tokens.get(word, set())
+            matches = found if matches is None else matches & found
+            if not matches:
+                return []
+        return self._in_list_order(matches)
+
+    def find_modified(self, since: str = "", until: Optional[str] = None) -> List[str]:
+        """Tag IDs modified in [since, until), oldest first (ISO timestamps compare as strings)"""
+        by_mtime = self._mtime_index()
+        start = bisect.bisect_left(by_mtime, (since, ""))
+        stop = len(by_mtime) if until is None else bisect.bisect_left(by_mtime, (until, ""))
+        return [tag_id for _, tag_id in by_mtime[start:stop]]
+
+    def _in_list_order(self, tag_ids: Iterable[str]) -> List[str]:
+        return sorted(tag_ids, key=self._slot_of.__getitem__)
+
+    def _mtime_index(self) -> List[Tuple[str, str]]:
+        """(last_modified, tag ID) pairs in order, built on first use"""
+        if self._by_mtime is None:
+            tags, self._mtime_source = self._mtime_source, None
+            self._by_mtime = sorted((_modified(tags, tag_id), tag_id) for tag_id in self._slot_of)
+            self._mtime_of = {tag_id: mtime for mtime, tag_id in self._by_mtime}
+        return self._by_mtime
+
+    def _set_mtime(self, tag_id: str, mtime: Optional[str]):
+        by_mtime = self._mtime_index()
+        old = self._mtime_of.pop(tag_id, None)
+        if old is not None:
+            i = bisect.bisect_left(by_mtime, (old, tag_id))
+            del by_mtime[i]
+        if mtime is not None:
+            self._mtime_of[tag_id] = mtime
+            bisect.insort(by_mtime, (mtime, tag_id))
+
+    def _index_tokens(self, tag_id: str, tag: dict):
+        if self._unindexed is not None:
+            return
+        data = tag.get("data", {})
+        content = data.get("content", "") if isinstance(data, dict) else data
+        tokens = {t.lower() for t in _TOKEN_RE.findall(str(content))}
+        self._tokens_of[tag_id] = tokens
+        for token in tokens:
+            bucket = self._tokens.get(token)
+            if bucket is None:
+                self._tokens[token] = {tag_id}
+                self._sorted_tokens = None
+            else:
+                bucket.add(tag_id)
+
+    def _unindex_tokens(self, tag_id: str):
+        if self._unindexed is not None:
+            return
+        for token in self._tokens_of.pop(tag_id, ()):
+            bucket = self._tokens[token]
+            bucket.discard(tag_id)
+            if not bucket:
+                del self._tokens[token]
+                self._sorted_tokens = None
+
+    def _tokens_with_prefix(self, prefix: str) -> List[str]:
+        if self._sorted_tokens is None:
+            self._sorted_tokens = sorted(self._tokens)
+        return _prefix_range(self._sorted_tokens, prefix)
+
+    def _compact(self):
+        live = [tag_id for tag_id in self._slots if tag_id is not None]
+        self._slots = live
+        self._slot_of = {tag_id: i for i, tag_id in enumerate(live)}
+        self._tree = _Fenwick.full(len(live))
+
+
+def _modified(tags, tag_id: str) -> str:
+    """A tag's last_modified timestamp from a tag mapping"""
+    # LazyTags reports it without parsing the record
+    modified_of = getattr(tags, "modified_of", None)
+    if modified_of is not None:
+        return modified_of(tag_id)
+    return tags[tag_id].get("last_modified", "")
+
+
+def _prefix_range(sorted_items: List[str], prefix: str, limit: Optional[int] = None) -> List[str]:
+    """Items of a sorted list that start with ``prefix``"""
+    result = []
+    i = bisect.bisect_left(sorted_items, prefix)
+    while i < len(sorted_items) and sorted_items[i].startswith(prefix):
+        if limit is not None and len(result) >= limit:
+            break
+        result.append(sorted_items[i])
+        i += 1
+    return result
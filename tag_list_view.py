@@ -0,0 +1,124 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import Callable, Optional
+
+
+class VirtualListbox(ttk.Frame):
+    """A listbox that only renders the rows currently in view.
+
+    Rows are provided by ``row_count()`` and ``row_text(index)``, so the
+    widget holds at most ``height`` items no matter how large the list is.
+    Call ``refresh()`` after inserts or deletes; it re-renders only the
+    visible window.
+    """
+
+    def __init__(self, master, row_count: Callable[[], int], row_text: Callable[[int], str],
+                 on_select: Optional[Callable[[int], None]] = None, height: int = 15, width: int = 30):
+        super().__init__(master)
+        self.row_count = row_count
+        self.row_text = row_text
+        self.on_select = on_select
+        self.height = height
+        self.top = 0
+        self.selected: Optional[int] = None
+        self._rendered = []
+
+        self.listbox = tk.Listbox(self, height=height, width=width, exportselection=False,
+                                  activestyle='none')
+        self.listbox.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient="vertical", command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
+
+        self.listbox.bind('<<ListboxSelect>>', self._on_listbox_select)
+        self.listbox.bind('<MouseWheel>', self._on_mousewheel)
+        self.listbox.bind('<Button-4>', lambda e: self._scroll_by(-3))
+        self.listbox.bind('<Button-5>', lambda e: self._scroll_by(3))
+        self.listbox.bind('<Up>', lambda e: self._move_selection(-1))
+        self.listbox.bind('<Down>', lambda e: self._move_selection(1))
+        self.listbox.bind('<Prior>', lambda e: self._move_selection(-self.height))
+        self.listbox.bind('<Next>', lambda e: self._move_selection(self.height))
+        self.listbox.bind('<Configure>', self._on_resize)
+
+    def refresh(self):
+        """Re-render the visible window"""
+        count = self.row_count()
+        self.top = max(0, min(self.top, count - self.height))
+        if self.selected is not None and self.selected >= count:
+            self.selected = count - 1 if count else None
+
+        stop = min(self.top + self.height, count)
+        rows = [self.row_text(i) for i in range(self.top, stop)]
+        if rows != self._rendered:
+            self.listbox.delete(0, tk.END)
+            if rows:
+                self.listbox.insert(tk.END, *rows)
+            self._rendered = rows
+
+        self.listbox.selection_clear(0, tk.END)
+        if self.selected is not None and self.top <= self.selected < stop:
+            self.listbox.selection_set(self.selected - self.top)
+
+        if count:
+            self.scrollbar.set(self.top / count, stop / count)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def select(self, index: Optional[int], notify: bool = False):
+        """Select a row by absolute index and scroll it into view"""
+        self.selected = index
+        if index is not None:
+            self.see(index)
+        else:
+            self.refresh()
+        if notify and index is not None and self.on_select:
+            self.on_select(index)
+
+    def see(self, index: int):
+        """Scroll so that a row is visible"""
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + self.height:
+            self.top = index - self.height + 1
+        self.refresh()
+
+    def _scroll_by(self, rows: int):
+        self.top += rows
+        self.refresh()
+        return "break"
+
+    def _on_scrollbar(self, *args):
+        count = self.row_count()
+        if args[0] == "moveto":
+            self.top = int(float(args[1]) * count)
+        elif args[0] == "scroll":
+            amount = int(args[1])
+            self.top += amount * (self.height if args[2] == "pages" else 1)
+        self.refresh()
+
+    def _on_mousewheel(self, event):
+        return self._scroll_by(-1 if event.delta > 0 else 1)
+
+    def _on_resize(self, event):
+        # Keep the rendered window in step with the listbox's visible rows
+        line_height = max(self.listbox.bbox(0)[3] if self.listbox.bbox(0) else 16, 1)
+        visible = max(event.height // line_height, 1)
+        if visible != self.height:
+            self.height = visible
+            self.refresh()
+
+    def _move_selection(self, delta: int):
+        count = self.row_count()
+        if count:
+            current = self.selected if self.selected is not None else self.top
+            self.select(max(0, min(count - 1, current + delta)), notify=True)
+        return "break"
+
+    def _on_listbox_select(self, event):
+        selection = self.listbox.curselection()
+        if not selection:
+            return
+        self.selected = self.top + selection[0]
+        if self.on_select:
+            self.on_select(self.selected)
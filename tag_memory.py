@@ -0,0 +1,886 @@
+"""Byte-level emulation of NFC tag memory.
+
+A TagMemory is a view over one tag's memory image in a writable buffer (a
+bytearray, or a slot of a memory-mapped MemoryImageStore), laid out as the
+real chip lays it out:
+
+* NTAG213/215/216 (NFC Forum Type 2): 4-byte pages holding the UID and its
+  check bytes, the static lock bytes and the capability container in pages
+  0-3, user memory from page 4, then the dynamic lock bytes, CFG0, CFG1, PWD
+  and PACK.  The 24-bit NFC counter is kept after the last page, where no
+  page read or write reaches it.
+* MIFARE Classic 1K/4K: 16-byte blocks in sectors of 4 (and, on 4K, 16)
+  blocks, each ending in a trailer holding key A, the access bits and key
+  B.  Cards are formatted for NDEF, with the MAD in sector 0 (and 16 on 4K).
+
+Reads hand out memoryview slices of the buffer rather than copies, except
+where the chip itself hides bytes (PWD/PACK, sector keys) or wraps around.
+Writes follow the chip's rules: UID pages and the manufacturer block are
+read-only, lock bytes and the capability container are one-time
+programmable, and locked pages or blocks refuse writes.  Keys are not
+checked; an operation is allowed if either key could perform it.
+
+NDEF TLVs are found by walking the TLV headers of the data area on demand,
+so nothing is parsed until the message is asked for.
+"""
+import bisect
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from tag_encoders import parse_ndef_text
+
+DEFAULT_MEMORY_FILE = "nfc_tags.mem"
+
+FAMILY_NTAG = "ntag"
+FAMILY_CLASSIC = "mifare_classic"
+FAMILY_FLAT = "flat"
+
+PAGE_SIZE = 4
+BLOCK_SIZE = 16
+
+# TLV tags used in tag memory
+TLV_NULL = 0x00
+TLV_NDEF = 0x03
+TLV_TERMINATOR = 0xFE
+
+CASCADE_TAG = 0x88
+
+# NTAG21x
+NTAG_USER_START = 4
+NTAG_INTERNAL = 0x48
+NTAG_CC_MAGIC = 0xE1
+NTAG_CC_VERSION = 0x10
+NTAG_CC_READ_ONLY = 0x0F
+NTAG_DYN_LOCK_RFUI = 0xBD
+NTAG_CFG0 = bytes([0x04, 0x00, 0x00, 0xFF])  # mirror off, AUTH0 past the last page
+NTAG_NFC_CNT_EN = 0x10  # ACCESS byte (CFG1 byte 0)
+NTAG_CFGLCK = 0x40
+COUNTER_SIZE = 4
+COUNTER_MAX = 0xFFFFFF
+
+# MIFARE Classic
+KEY_DEFAULT = bytes.fromhex("FFFFFFFFFFFF")
+KEY_MAD = bytes.fromhex("A0A1A2A3A4A5")
+KEY_NDEF = bytes.fromhex("D3F7D3F7D3F7")
+ACCESS_TRANSPORT = bytes.fromhex("FF0780")  # data blocks read/write, trailer keys writable
+ACCESS_MAD = bytes.fromhex("787788")  # data blocks read with A or B, written with B
+ACCESS_NDEF = bytes.fromhex("7F0788")  # data blocks read/write
+ACCESS_READ_ONLY = bytes.fromhex("078F0F")  # data blocks read-only, trailer frozen
+GPB_NDEF = 0x40
+GPB_NDEF_READ_ONLY = 0x43
+GPB_MAD_1 = 0xC1
+GPB_MAD_2 = 0xC2
+MAD_AID_NDEF = 0x03E1
+MAD_SECTORS = (0, 16)
+MAD_CRC_PRESET = 0xC7
+MAD_CRC_POLY = 0x1D
+CLASSIC_MANUFACTURER_DATA = b"NFCSIM\0\0"
+
+# Access conditions (C1 C2 C3 as a 3-bit number) allowing each operation with some key
+_DATA_WRITABLE = frozenset((0b000, 0b100, 0b110, 0b011))
+_DATA_INCREMENT = frozenset((0b000, 0b110))
+_DATA_DECREMENT = frozenset((0b000, 0b110, 0b001))
+_TRAILER_KEYS_WRITABLE = frozenset((0b000, 0b100, 0b001, 0b011))
+_TRAILER_ACCESS_WRITABLE = frozenset((0b001, 0b011))
+_TRAILER_KEY_B_READABLE = frozenset((0b000, 0b010, 0b001))
+
+Buffer = Union[bytearray, memoryview, mmap.mmap]
+
+
+class MemoryAccessError(ValueError):
+    """Raised when a write would change read-only or locked tag memory"""
+
+
+class Layout:
+    """Geometry of one tag type's memory: ``units`` pages or blocks of ``unit`` bytes"""
+
+    def __init__(self, name: str, code: int, family: str, unit: int, units: int,
+                 user_pages: int = 0, cc_size: int = 0, pages_per_lock_bit: int = 0,
+                 sectors: Tuple[Tuple[int, int], ...] = ()):
+        self.name = name
+        self.code = code
+        self.family = family
+        self.unit = unit
+        self.units = units
+        self.size = unit * units
+        self.image_size = self.size + (COUNTER_SIZE if family == FAMILY_NTAG else 0)
+        # Blocks as READ and WRITE address them (4 pages each on NTAG)
+        self.blocks = -(-self.size // BLOCK_SIZE)
+        # NTAG21x: the pages after user memory
+        self.user_end = NTAG_USER_START + user_pages
+        self.dyn_lock_page = self.user_end
+        self.cfg0_page = self.user_end + 1
+        self.cfg1_page = self.user_end + 2
+        self.pwd_page = self.user_end + 3
+        self.pack_page = self.user_end + 4
+        self.cc_size = cc_size
+        self.pages_per_lock_bit = pages_per_lock_bit
+        # MIFARE Classic: (first block, blocks) per sector, the last block being the trailer
+        self.sectors = sectors
+        self._sector_starts = [first for first, _ in sectors]
+        if family == FAMILY_NTAG:
+            self.data_spans = [(NTAG_USER_START * PAGE_SIZE, self.user_end * PAGE_SIZE)]
+        elif family == FAMILY_CLASSIC:
+            self.data_spans = [(first * BLOCK_SIZE, (first + count - 1) * BLOCK_SIZE)
+                               for sector, (first, count) in enumerate(sectors) if sector not in MAD_SECTORS]
+        else:
+            self.data_spans = [(0, self.size)]
+
+    def __repr__(self) -> str:
+        return f"Layout({self.name!r})"
+
+    def sector_of(self, block: int) -> Tuple[int, int, int]:
+        """(sector, first block, blocks) of the sector holding ``block``"""
+        sector = bisect.bisect_right(self._sector_starts, block) - 1
+        first, count = self.sectors[sector]
+        return sector, first, count
+
+
+def _ntag(name: str, code: int, user_pages: int, cc_size: int, pages_per_lock_bit: int) -> Layout:
+    # Pages 0-3, user memory, then dynamic lock, CFG0, CFG1, PWD and PACK
+    return Layout(name, code, FAMILY_NTAG, PAGE_SIZE, NTAG_USER_START + user_pages + 5,
+                  user_pages=user_pages, cc_size=cc_size, pages_per_lock_bit=pages_per_lock_bit)
+
+
+def _classic(name: str, code: int, small_sectors: int, large_sectors: int) -> Layout:
+    sectors = tuple((4 * s, 4) for s in range(small_sectors))
+    sectors += tuple((4 * small_sectors + 16 * s, 16) for s in range(large_sectors))
+    return Layout(name, code, FAMILY_CLASSIC, BLOCK_SIZE, 4 * small_sectors + 16 * large_sectors,
+                  sectors=sectors)
+
+
+NTAG213 = _ntag("ntag213", 1, 36, 0x12, 2)
+NTAG215 = _ntag("ntag215", 2, 126, 0x3E, 16)
+NTAG216 = _ntag("ntag216", 3, 222, 0x6D, 16)
+MIFARE_CLASSIC_1K = _classic("mifare_classic_1k", 4, 16, 0)
+MIFARE_CLASSIC_4K = _classic("mifare_classic_4k", 5, 32, 8)
+
+LAYOUTS: Dict[str, Layout] = {layout.name: layout for layout in
+                              (NTAG213, NTAG215, NTAG216, MIFARE_CLASSIC_1K, MIFARE_CLASSIC_4K)}
+_LAYOUT_CODES: Dict[int, Layout] = {layout.code: layout for layout in LAYOUTS.values()}
+
+
+def flat_layout(size: int) -> Layout:
+    """Unstructured memory of ``size`` bytes in 16-byte blocks, all of it data area and writable"""
+    return Layout("flat", 0, FAMILY_FLAT, BLOCK_SIZE, -(-size // BLOCK_SIZE))
+
+
+def get_layout(name: str) -> Layout:
+    """Look up a layout by name, raising ValueError for an unknown one"""
+    try:
+        return LAYOUTS[name]
+    except KeyError:
+        raise ValueError(f"Unknown memory layout: {name}") from None
+
+
+def ndef_tlv(message: bytes) -> bytes:
+    """An NDEF message in an NDEF TLV, followed by a terminator TLV"""
+    if len(message) < 0xFF:
+        tlv = bytes([TLV_NDEF, len(message)])
+    else:
+        tlv = bytes([TLV_NDEF, 0xFF]) + struct.pack(">H", len(message))
+    return tlv + message + bytes([TLV_TERMINATOR])
+
+
+def find_ndef(data) -> Optional[Tuple[int, int]]:
+    """(offset, length) of the NDEF message in a sequence of TLVs, or None if there is no complete one"""
+    size = len(data)
+    offset = 0
+    while offset < size:
+        tlv = data[offset]
+        if tlv == TLV_NULL:
+            offset += 1
+            continue
+        if tlv == TLV_TERMINATOR or offset + 1 >= size:
+            return None
+        length, offset = data[offset + 1], offset + 2
+        if length == 0xFF:
+            if offset + 2 > size:
+                return None
+            length, offset = data[offset] << 8 | data[offset + 1], offset + 2
+        if tlv == TLV_NDEF:
+            if offset + length > size:
+                return None
+            return offset, length
+        offset += length
+    return None
+
+
+def layout_for(uid: bytes, message: bytes = b"") -> Layout:
+    """The smallest layout for a tag with ``uid`` whose memory holds ``message``
+
+    7-byte UIDs get an NTAG21x and 4-byte UIDs a MIFARE Classic card;
+    raises ValueError if none holds the message or the UID fits neither.
+    """
+    if len(uid) == 7:
+        candidates = (NTAG213, NTAG215, NTAG216)
+    elif len(uid) == 4:
+        candidates = (MIFARE_CLASSIC_1K, MIFARE_CLASSIC_4K)
+    else:
+        raise ValueError(f"No memory layout for a {len(uid)}-byte UID")
+    needed = len(ndef_tlv(message)) - 1
+    for layout in candidates:
+        if needed <= sum(end - start for start, end in layout.data_spans):
+            return layout
+    raise ValueError(f"An NDEF message of {len(message)} bytes does not fit in {candidates[-1].name}")
+
+
+def mad_crc(data: bytes) -> int:
+    """CRC-8 protecting a MIFARE Application Directory"""
+    crc = MAD_CRC_PRESET
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ MAD_CRC_POLY if crc & 0x80 else crc << 1) & 0xFF
+    return crc
+
+
+def _access_conditions(bits) -> Optional[Tuple[int, int, int]]:
+    """(C1, C2, C3) nibbles of three access bytes, or None if their inverted copies disagree"""
+    b6, b7, b8 = bits[0], bits[1], bits[2]
+    c1, c2, c3 = b7 >> 4, b8 & 0x0F, b8 >> 4
+    if (c1 ^ b6) & 0x0F != 0x0F or c2 ^ (b6 >> 4) != 0x0F or (c3 ^ b7) & 0x0F != 0x0F:
+        return None
+    return c1, c2, c3
+
+
+class _DataArea:
+    """The parts of a memory image that hold TLVs, addressed as one sequence of bytes"""
+
+    __slots__ = ("buffer", "spans", "starts", "size")
+
+    def __init__(self, buffer: memoryview, spans: List[Tuple[int, int]]):
+        self.buffer = buffer
+        self.spans = spans
+        self.starts = []
+        size = 0
+        for start, end in spans:
+            self.starts.append(size)
+            size += end - start
+        self.size = size
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __getitem__(self, offset: int) -> int:
+        return self.buffer[self.physical(offset)]
+
+    def physical(self, offset: int) -> int:
+        """Offset in the image of byte ``offset`` of the area"""
+        if not 0 <= offset < self.size:
+            raise IndexError(offset)
+        span = bisect.bisect_right(self.starts, offset) - 1
+        return self.spans[span][0] + offset - self.starts[span]
+
+    def segments(self, offset: int, length: int) -> Iterator[Tuple[int, int]]:
+        """(image offset, length) of the pieces of an area range"""
+        while length > 0:
+            start = self.physical(offset)
+            span = bisect.bisect_right(self.starts, offset) - 1
+            piece = min(length, self.spans[span][1] - start)
+            yield start, piece
+            offset += piece
+            length -= piece
+
+    def read(self, offset: int, length: int) -> Union[memoryview, bytes]:
+        pieces = [self.buffer[start:start + piece] for start, piece in self.segments(offset, length)]
+        if len(pieces) == 1:
+            return pieces[0]
+        return b"".join(pieces)
+
+    def write(self, offset: int, data: bytes):
+        done = 0
+        for start, piece in self.segments(offset, len(data)):
+            self.buffer[start:start + piece] = data[done:done + piece]
+            done += piece
+
+
+class TagMemory:
+    """One tag's memory image, laid out as ``layout`` in ``buffer``.
+
+    Indexes passed to ``view``, ``write`` and ``is_writable`` are pages on
+    NTAG and blocks on MIFARE Classic; ``read_block`` and ``write_block``
+    always address 16-byte blocks, as a reader's READ does (four pages
+    from page ``4 * block`` on NTAG).  The buffer is shared, not copied:
+    changes through one TagMemory are seen by every view of the same
+    buffer.
+    """
+
+    __slots__ = ("layout", "buffer", "data")
+
+    def __init__(self, layout: Layout, buffer: Buffer):
+        buffer = memoryview(buffer)
+        if len(buffer) < layout.image_size:
+            raise ValueError(f"{layout.name} needs {layout.image_size} bytes, not {len(buffer)}")
+        self.layout = layout
+        self.buffer = buffer[:layout.image_size]
+        self.data = _DataArea(self.buffer, layout.data_spans)
+
+    @classmethod
+    def create(cls, layout: Layout, uid: bytes = b"", message: Optional[bytes] = None,
+               buffer: Optional[Buffer] = None) -> "TagMemory":
+        """Factory-fresh memory for ``uid``, formatted for NDEF and holding ``message`` if given
+
+        Formats ``buffer`` in place when given, otherwise a new bytearray.
+        NTAG21x need a 7-byte UID and MIFARE Classic a 4-byte one.
+        """
+        memory = cls(layout, buffer if buffer is not None else bytearray(layout.image_size))
+        memory.buffer[:] = bytes(layout.image_size)
+        if layout.family == FAMILY_NTAG:
+            memory._format_ntag(uid)
+        elif layout.family == FAMILY_CLASSIC:
+            memory._format_classic(uid)
+        else:
+            memory.data.write(0, ndef_tlv(b""))
+        if message is not None:
+            memory.set_ndef(message)
+        return memory
+
+    @property
+    def uid(self) -> bytes:
+        buffer = self.buffer
+        if self.layout.family == FAMILY_NTAG:
+            return bytes(buffer[0:3]) + bytes(buffer[4:8])
+        if self.layout.family == FAMILY_CLASSIC:
+            return bytes(buffer[0:4])
+        return b""
+
+    @property
+    def counter(self) -> Optional[int]:
+        """The NTAG NFC counter (None on other tags)"""
+        if self.layout.family != FAMILY_NTAG:
+            return None
+        size = self.layout.size
+        return int.from_bytes(self.buffer[size:size + 3], "little")
+
+    def count_read(self) -> Optional[int]:
+        """Count the first READ after activation, as the NTAG NFC counter does when enabled, and return the counter"""
+        counter = self.counter
+        if counter is not None and self.buffer[self.layout.cfg1_page * PAGE_SIZE] & NTAG_NFC_CNT_EN \
+                and counter < COUNTER_MAX:
+            counter += 1
+            size = self.layout.size
+            self.buffer[size:size + 3] = counter.to_bytes(3, "little")
+        return counter
+
+    def view(self, index: int, count: int = 1) -> memoryview:
+        """Zero-copy view of ``count`` pages (blocks on MIFARE Classic) from ``index``"""
+        self._check_range(index, count)
+        unit = self.layout.unit
+        return self.buffer[index * unit:(index + count) * unit]
+
+    def read_block(self, block: int) -> Union[memoryview, bytes]:
+        """The 16 bytes a reader gets for ``block``, with hidden bytes zeroed
+
+        PWD and PACK read as zeros on NTAG, where a read past the last page
+        wraps around to page 0.  Key A always reads as zeros on MIFARE
+        Classic, and key B does unless the access bits let it be read.
+        """
+        layout = self.layout
+        if not 0 <= block < layout.blocks:
+            raise IndexError(f"Block {block} is out of range")
+        start = block * BLOCK_SIZE
+        if layout.family == FAMILY_NTAG:
+            first = block * 4
+            hidden = (layout.pwd_page, layout.pack_page)
+            if first + 4 <= layout.units and not any(first <= page < first + 4 for page in hidden):
+                return self.buffer[start:start + BLOCK_SIZE]
+            data = bytearray()
+            for page in range(first, first + 4):
+                page %= layout.units
+                data += bytes(PAGE_SIZE) if page in hidden else self.buffer[page * PAGE_SIZE:(page + 1) * PAGE_SIZE]
+            return bytes(data)
+        if layout.family == FAMILY_CLASSIC and self._is_trailer(block):
+            data = bytearray(self.buffer[start:start + BLOCK_SIZE])
+            data[0:6] = bytes(6)
+            if self._condition(block) not in _TRAILER_KEY_B_READABLE:
+                data[10:16] = bytes(6)
+            return bytes(data)
+        return self.buffer[start:start + BLOCK_SIZE]
+
+    def write(self, index: int, data: bytes):
+        """Write whole pages (blocks on MIFARE Classic) from ``index``, as the tag's WRITE command does
+
+        Bits written to lock bytes and the capability container are OR-ed
+        in, and the bytes of page 2 before the lock bytes are ignored.
+        Raises IndexError past the end and MemoryAccessError for read-only
+        or locked memory, writing nothing in either case.
+        """
+        unit = self.layout.unit
+        if not data or len(data) % unit:
+            raise ValueError(f"Writes must be whole {unit}-byte units")
+        count = len(data) // unit
+        self._check_range(index, count)
+        self._write_units([(index + i, data[i * unit:(i + 1) * unit]) for i in range(count)])
+
+    def write_block(self, block: int, data: bytes):
+        """Write 16 bytes at ``block``, as ``read_block`` addresses them
+
+        On NTAG the block's pages are written one by one, leaving out pages
+        whose bytes are unchanged and pages past the end, so a block can be
+        read, changed and written back even when it holds read-only pages.
+        """
+        if len(data) != BLOCK_SIZE:
+            raise ValueError(f"Blocks are {BLOCK_SIZE} bytes")
+        if not 0 <= block < self.layout.blocks:
+            raise IndexError(f"Block {block} is out of range")
+        if self.layout.family != FAMILY_NTAG:
+            self.write(block, data)
+            return
+        first = block * 4
+        units = []
+        for page in range(first, min(first + 4, self.layout.units)):
+            chunk = data[(page - first) * PAGE_SIZE:(page - first + 1) * PAGE_SIZE]
+            if self.buffer[page * PAGE_SIZE:(page + 1) * PAGE_SIZE] != chunk:
+                units.append((page, chunk))
+        self._write_units(units)
+
+    def is_writable(self, index: int) -> bool:
+        """Whether page (block on MIFARE Classic) ``index`` accepts writes"""
+        self._check_range(index, 1)
+        layout = self.layout
+        buffer = self.buffer
+        if layout.family == FAMILY_NTAG:
+            if index < 2:
+                return False
+            if index == 2:
+                return True
+            if index == 3:
+                return not buffer[10] & 0x08
+            if index < 8:
+                return not buffer[10] >> index & 1
+            if index < 16:
+                return not buffer[11] >> (index - 8) & 1
+            if index < layout.user_end:
+                bit = (index - 16) // layout.pages_per_lock_bit
+                return not buffer[layout.dyn_lock_page * PAGE_SIZE + bit // 8] >> (bit % 8) & 1
+            if index in (layout.cfg0_page, layout.cfg1_page):
+                return not buffer[layout.cfg1_page * PAGE_SIZE] & NTAG_CFGLCK
+            return True
+        if layout.family == FAMILY_CLASSIC:
+            if index == 0:
+                return False
+            if self._is_trailer(index):
+                return self._condition(index) in _TRAILER_KEYS_WRITABLE
+            return self._condition(index) in _DATA_WRITABLE
+        return True
+
+    def make_read_only(self):
+        """Lock the tag's data area for good, as an NFC Forum "make read-only" does"""
+        layout = self.layout
+        if layout.family == FAMILY_NTAG:
+            cc = bytearray(self.view(3))
+            cc[3] = NTAG_CC_READ_ONLY
+            self.write(3, bytes(cc))
+            self.write(2, bytes([0, 0, 0xFF, 0xFF]))
+            self.write(layout.dyn_lock_page, bytes([0xFF, 0xFF, 0xFF, 0]))
+        elif layout.family == FAMILY_CLASSIC:
+            for sector, (first, count) in enumerate(layout.sectors):
+                trailer = first + count - 1
+                data = bytearray(self.view(trailer))
+                data[6:9] = ACCESS_READ_ONLY
+                if sector not in MAD_SECTORS:
+                    data[9] = GPB_NDEF_READ_ONLY
+                self.write(trailer, bytes(data))
+        else:
+            raise ValueError(f"{layout.name} memory has no lock bits")
+
+    def ndef_span(self) -> Optional[Tuple[int, int]]:
+        """(offset, length) of the NDEF message within the data area, found by walking the TLVs"""
+        return find_ndef(self.data)
+
+    def ndef_message(self) -> Optional[Union[memoryview, bytes]]:
+        """The NDEF message (a view of the buffer where it is contiguous), or None if there is none"""
+        span = self.ndef_span()
+        return self.data.read(*span) if span else None
+
+    def set_ndef(self, message: bytes):
+        """Store ``message`` in an NDEF TLV at the start of the data area
+
+        Raises ValueError if it does not fit and MemoryAccessError if the
+        tag is read-only or the memory it needs is locked.
+        """
+        tlv = ndef_tlv(message)
+        if len(tlv) == len(self.data) + 1:
+            # A message filling the area exactly needs no terminator
+            tlv = tlv[:-1]
+        if len(tlv) > len(self.data):
+            raise ValueError(f"An NDEF message of {len(message)} bytes does not fit in "
+                             f"{self.layout.name} ({len(self.data)} bytes)")
+        if self.layout.family == FAMILY_NTAG and self.buffer[15] & 0x0F:
+            raise MemoryAccessError("The tag is read-only")
+        unit = self.layout.unit
+        for start, length in self.data.segments(0, len(tlv)):
+            for index in range(start // unit, (start + length - 1) // unit + 1):
+                if not self.is_writable(index):
+                    raise MemoryAccessError(f"{_unit_name(self.layout)} {index} is locked")
+        self.data.write(0, tlv)
+
+    def block_of(self, offset: int) -> int:
+        """The block (as ``read_block`` numbers them) holding byte ``offset`` of the data area"""
+        return self.data.physical(offset) // BLOCK_SIZE
+
+    def read_value(self, block: int) -> int:
+        """The value held by a MIFARE Classic value block"""
+        self._require_classic()
+        data = bytes(self.view(block))
+        value, inverted, copy = struct.unpack_from("<iii", data)
+        address = data[12:16]
+        if inverted != ~value or copy != value or address[0] != address[2] \
+                or address[1] != address[0] ^ 0xFF or address[3] != address[1]:
+            raise ValueError(f"Block {block} is not a value block")
+        return value
+
+    def write_value(self, block: int, value: int, address: Optional[int] = None):
+        """Format a MIFARE Classic block as a value block holding ``value``"""
+        self._require_classic()
+        address = block & 0xFF if address is None else address
+        self.write(block, _value_block(value, address))
+
+    def increment(self, block: int, amount: int = 1) -> int:
+        """Add ``amount`` to a MIFARE Classic value block and return the new value"""
+        return self._change_value(block, amount, _DATA_INCREMENT)
+
+    def decrement(self, block: int, amount: int = 1) -> int:
+        """Subtract ``amount`` from a MIFARE Classic value block and return the new value"""
+        return self._change_value(block, -amount, _DATA_DECREMENT)
+
+    def decode(self) -> dict:
+        """Decoded view of the memory: layout, UID, locks, NDEF message and a dump as a reader reads it"""
+        layout = self.layout
+        name = _unit_name(layout).lower()
+        view = {"layout": layout.name, "uid": self.uid.hex().upper()}
+        if layout.family == FAMILY_NTAG:
+            view["counter"] = self.counter
+            view["read_only"] = bool(self.buffer[15] & 0x0F)
+        view[f"locked_{name}s"] = _ranges(i for i in range(layout.units) if not self.is_writable(i))
+        span = self.ndef_span()
+        if span:
+            message = bytes(self.data.read(*span))
+            view["ndef"] = {"offset": span[0], "length": span[1], "text": parse_ndef_text(message)}
+            view["free_bytes"] = len(self.data) - min(span[0] + span[1] + 1, len(self.data))
+        if layout.family == FAMILY_NTAG:
+            dump = b"".join(bytes(self.read_block(block)) for block in range(layout.blocks))
+            view[f"{name}s"] = [f"{page:3d}: {_hex(dump[page * PAGE_SIZE:(page + 1) * PAGE_SIZE])}"
+                                for page in range(layout.units)]
+        else:
+            view[f"{name}s"] = [f"{block:3d}: {_hex(self.read_block(block))}"
+                                for block in range(layout.blocks)]
+        return view
+
+    def _check_range(self, index: int, count: int):
+        if index < 0 or count < 1 or index + count > self.layout.units:
+            raise IndexError(f"{_unit_name(self.layout)} {index} is out of range")
+
+    def _write_units(self, units: List[Tuple[int, bytes]]):
+        for index, chunk in units:
+            self._check_write(index, chunk)
+        for index, chunk in units:
+            self._store(index, chunk)
+
+    def _check_write(self, index: int, chunk: bytes):
+        layout = self.layout
+        if layout.family == FAMILY_NTAG and index < 2:
+            raise MemoryAccessError(f"Page {index} holds the UID and is read-only")
+        if layout.family == FAMILY_CLASSIC:
+            if index == 0:
+                raise MemoryAccessError("Block 0 holds the UID and manufacturer data and is read-only")
+            if self._is_trailer(index):
+                condition = self._condition(index)
+                if condition not in _TRAILER_KEYS_WRITABLE:
+                    raise MemoryAccessError(f"The trailer of block {index}'s sector is locked")
+                access = bytes(self.buffer[index * BLOCK_SIZE + 6:index * BLOCK_SIZE + 9])
+                if chunk[6:9] != access:
+                    if condition not in _TRAILER_ACCESS_WRITABLE:
+                        raise MemoryAccessError(f"The access bits of block {index}'s sector are locked")
+                    if _access_conditions(chunk[6:9]) is None:
+                        raise MemoryAccessError("Malformed access bits would block the sector for good")
+                return
+        if not self.is_writable(index):
+            raise MemoryAccessError(f"{_unit_name(layout)} {index} is locked")
+
+    def _store(self, index: int, chunk: bytes):
+        layout = self.layout
+        buffer = self.buffer
+        start = index * layout.unit
+        if layout.family == FAMILY_NTAG:
+            if index == 2:
+                # Static lock bytes
+                buffer[10] |= chunk[2]
+                buffer[11] |= chunk[3]
+                return
+            if index in (3, layout.dyn_lock_page):
+                # One-time programmable: bits are set, never cleared (byte 3 of the dynamic lock page is RFUI)
+                for i in range(PAGE_SIZE if index == 3 else 3):
+                    buffer[start + i] |= chunk[i]
+                return
+        buffer[start:start + layout.unit] = chunk
+
+    def _is_trailer(self, block: int) -> bool:
+        _, first, count = self.layout.sector_of(block)
+        return block == first + count - 1
+
+    def _condition(self, block: int) -> Optional[int]:
+        """Access condition (C1 C2 C3 as a 3-bit number) of a MIFARE Classic block, None if the access bits are malformed"""
+        _, first, count = self.layout.sector_of(block)
+        trailer = (first + count - 1) * BLOCK_SIZE
+        conditions = _access_conditions(self.buffer[trailer + 6:trailer + 9])
+        if conditions is None:
+            return None
+        group = 3 if block == first + count - 1 else (block - first) if count == 4 else (block - first) // 5
+        c1, c2, c3 = conditions
+        return (c1 >> group & 1) << 2 | (c2 >> group & 1) << 1 | (c3 >> group & 1)
+
+    def _change_value(self, block: int, amount: int, allowed: frozenset) -> int:
+        self._require_classic()
+        value = self.read_value(block) + amount
+        if self._is_trailer(block) or self._condition(block) not in allowed:
+            raise MemoryAccessError(f"Block {block} does not allow this value operation")
+        if not -0x80000000 <= value <= 0x7FFFFFFF:
+            raise ValueError("Value block overflow")
+        data = _value_block(value, self.buffer[block * BLOCK_SIZE + 12])
+        self.buffer[block * BLOCK_SIZE:(block + 1) * BLOCK_SIZE] = data
+        return value
+
+    def _require_classic(self):
+        if self.layout.family != FAMILY_CLASSIC:
+            raise ValueError(f"{self.layout.name} has no value blocks")
+
+    def _format_ntag(self, uid: bytes):
+        if len(uid) != 7:
+            raise ValueError(f"NTAG21x UIDs are 7 bytes, not {len(uid)}")
+        layout = self.layout
+        buffer = self.buffer
+        buffer[0:3] = uid[:3]
+        buffer[3] = CASCADE_TAG ^ uid[0] ^ uid[1] ^ uid[2]
+        buffer[4:8] = uid[3:]
+        buffer[8] = uid[3] ^ uid[4] ^ uid[5] ^ uid[6]
+        buffer[9] = NTAG_INTERNAL
+        buffer[12:16] = bytes([NTAG_CC_MAGIC, NTAG_CC_VERSION, layout.cc_size, 0x00])
+        buffer[layout.dyn_lock_page * PAGE_SIZE + 3] = NTAG_DYN_LOCK_RFUI
+        buffer[layout.cfg0_page * PAGE_SIZE:layout.cfg1_page * PAGE_SIZE] = NTAG_CFG0
+        # Factory default except that the NFC counter is enabled
+        buffer[layout.cfg1_page * PAGE_SIZE] = NTAG_NFC_CNT_EN
+        buffer[layout.cfg1_page * PAGE_SIZE + 1] = 0x05
+        buffer[layout.pwd_page * PAGE_SIZE:layout.pack_page * PAGE_SIZE] = b"\xFF" * PAGE_SIZE
+        self.data.write(0, ndef_tlv(b""))
+
+    def _format_classic(self, uid: bytes):
+        if len(uid) != 4:
+            raise ValueError(f"MIFARE Classic UIDs here are 4 bytes, not {len(uid)}")
+        layout = self.layout
+        buffer = self.buffer
+        four_k = layout.units > 64
+        buffer[0:4] = uid
+        buffer[4] = uid[0] ^ uid[1] ^ uid[2] ^ uid[3]
+        buffer[5] = 0x18 if four_k else 0x08  # SAK
+        buffer[6:8] = b"\x02\x00" if four_k else b"\x04\x00"  # ATQA
+        buffer[8:16] = CLASSIC_MANUFACTURER_DATA
+        for sector, (first, count) in enumerate(layout.sectors):
+            trailer = (first + count - 1) * BLOCK_SIZE
+            if sector in MAD_SECTORS:
+                gpb = (GPB_MAD_2 if four_k else GPB_MAD_1) if sector == 0 else 0x00
+                buffer[trailer:trailer + BLOCK_SIZE] = KEY_MAD + ACCESS_MAD + bytes([gpb]) + KEY_DEFAULT
+            else:
+                buffer[trailer:trailer + BLOCK_SIZE] = KEY_NDEF + ACCESS_NDEF + bytes([GPB_NDEF]) + KEY_DEFAULT
+        # MAD1 in blocks 1-2 lists sectors 1-15, MAD2 in blocks 64-66 sectors 17-39
+        for mad_sector, listed in ((0, range(1, 16)), (16, range(17, len(layout.sectors)))):
+            if mad_sector >= len(layout.sectors):
+                break
+            mad = bytearray(1 + 2 * len(listed))
+            for i in range(len(listed)):
+                struct.pack_into("<H", mad, 1 + 2 * i, MAD_AID_NDEF)
+            start = (layout.sectors[mad_sector][0] + (1 if mad_sector == 0 else 0)) * BLOCK_SIZE
+            buffer[start:start + 1 + len(mad)] = bytes([mad_crc(mad)]) + mad
+        self.data.write(0, ndef_tlv(b""))
+
+
+def _value_block(value: int, address: int) -> bytes:
+    return struct.pack("<iiiBBBB", value, ~value, value, address, address ^ 0xFF, address, address ^ 0xFF)
+
+
+def _hex(data) -> str:
+    return " ".join(f"{byte:02X}" for byte in bytes(data))
+
+
+def _unit_name(layout: Layout) -> str:
+    return "Page" if layout.family == FAMILY_NTAG else "Block"
+
+
+def _ranges(indexes) -> str:
+    """'0-1, 4, 16-31' for a sorted run of indexes"""
+    runs: List[List[int]] = []
+    for index in indexes:
+        if runs and runs[-1][1] == index - 1:
+            runs[-1][1] = index
+        else:
+            runs.append([index, index])
+    return ", ".join(str(a) if a == b else f"{a}-{b}" for a, b in runs)
+
+
+# Memory image file: a header, then records of a record header, the tag ID
+# (padded to the ID capacity) and the image (padded to 8 bytes)
+_FILE_MAGIC = b"NFCMEM"
+_FILE_VERSION = 1
+_FILE_HEADER = struct.Struct("<6sH8x")
+_RECORD_HEADER = struct.Struct("<HHH2x")  # layout code (0 ends the records), ID capacity, ID length
+_FREE = 0x8000  # set in the layout code of deleted records
+_MIN_ID_CAPACITY = 40  # a UUID, rounded up
+_MIN_FILE_SIZE = 1 << 16
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+class MemoryImageStore:
+    """Tag memory images in one memory-mapped file, keyed by tag ID.
+
+    Each image lives in a fixed slot found by one dictionary lookup, and
+    ``get`` returns a TagMemory over the mapping itself, so reads and
+    writes go straight to the page cache and the OS writes them back.
+    Opening the file reads only the record headers.  Deleted images leave
+    their slot for the next image of the same layout; the file grows by
+    doubling.  A TagMemory from ``get`` or ``create`` must not be used
+    after its tag's image is deleted.
+    """
+
+    def __init__(self, path: str = DEFAULT_MEMORY_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[int, Layout]] = {}  # tag ID -> (record offset, layout)
+        self._free: Dict[int, List[int]] = {}  # layout code -> deleted record offsets
+        # Mappings replaced by a larger one stay open while views of them may be in use
+        self._retired: List[mmap.mmap] = []
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self._file = open(path, "r+b" if exists else "w+b")
+        if not exists:
+            self._file.write(_FILE_HEADER.pack(_FILE_MAGIC, _FILE_VERSION))
+            self._file.truncate(_MIN_FILE_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, version = _FILE_HEADER.unpack_from(self._map)
+        if magic != _FILE_MAGIC or version != _FILE_VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a tag memory file")
+        self._end = self._scan()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, tag_id: object) -> bool:
+        return tag_id in self._index
+
+    def tag_ids(self) -> List[str]:
+        return list(self._index)
+
+    def get(self, tag_id: str) -> Optional[TagMemory]:
+        """The tag's memory image, or None if it has none"""
+        entry = self._index.get(tag_id)
+        if entry is None:
+            return None
+        offset, layout = entry
+        return TagMemory(layout, self._image(offset, layout))
+
+    def create(self, tag_id: str, layout: Layout, uid: bytes, message: Optional[bytes] = None) -> TagMemory:
+        """Give a tag a factory-fresh memory image (see ``TagMemory.create``), replacing any it had"""
+        if layout.family == FAMILY_FLAT:
+            raise ValueError("Flat memory is not stored")
+        encoded_id = tag_id.encode("utf-8")
+        with self._lock:
+            self._delete(tag_id)
+            offset, reused = self._allocate(layout, len(encoded_id))
+            capacity = _RECORD_HEADER.unpack_from(self._map, offset)[1] if reused \
+                else max(_align(len(encoded_id)), _MIN_ID_CAPACITY)
+            start = offset + _RECORD_HEADER.size
+            try:
+                memory = TagMemory.create(layout, uid, message, self._image(offset, layout, capacity))
+            except ValueError:
+                if reused:
+                    self._free[layout.code].append(offset)
+                raise
+            self._map[start:start + capacity] = encoded_id.ljust(capacity, b"\0")
+            # The header goes in last: until then the record is free or past the end
+            _RECORD_HEADER.pack_into(self._map, offset, layout.code, capacity, len(encoded_id))
+            if not reused:
+                self._end = start + capacity + _align(layout.image_size)
+            self._index[tag_id] = (offset, layout)
+        return memory
+
+    def delete(self, tag_id: str) -> bool:
+        """Drop a tag's memory image; False if it had none"""
+        with self._lock:
+            return self._delete(tag_id)
+
+    def flush(self):
+        """Write changed pages back to the file"""
+        self._map.flush()
+
+    def close(self):
+        """Flush and unmap the file"""
+        if self._map is None:
+            return
+        self._map.flush()
+        for mapping in self._retired + [self._map]:
+            try:
+                mapping.close()
+            except BufferError:
+                # Views of it are still alive; it closes when they go
+                pass
+        self._retired = []
+        self._map = None
+        self._file.close()
+
+    def _scan(self) -> int:
+        """Index the records, returning the offset just past the last one"""
+        offset = _FILE_HEADER.size
+        size = len(self._map)
+        while offset + _RECORD_HEADER.size <= size:
+            code, capacity, id_length = _RECORD_HEADER.unpack_from(self._map, offset)
+            if not code:
+                break
+            layout = _LAYOUT_CODES.get(code & ~_FREE)
+            if layout is None:
+                raise ValueError(f"{self.path} holds an unknown memory layout {code & ~_FREE}")
+            start = offset + _RECORD_HEADER.size
+            if code & _FREE:
+                self._free.setdefault(layout.code, []).append(offset)
+            else:
+                self._index[self._map[start:start + id_length].decode("utf-8")] = (offset, layout)
+            offset = start + capacity + _align(layout.image_size)
+        return offset
+
+    def _image(self, offset: int, layout: Layout, capacity: Optional[int] = None) -> memoryview:
+        if capacity is None:
+            capacity = _RECORD_HEADER.unpack_from(self._map, offset)[1]
+        start = offset + _RECORD_HEADER.size + capacity
+        return memoryview(self._map)[start:start + layout.image_size]
+
+    def _allocate(self, layout: Layout, id_length: int) -> Tuple[int, bool]:
+        """(record offset, whether it is a reused slot) for a new image"""
+        free = self._free.get(layout.code, [])
+        for i, offset in enumerate(free):
+            if _RECORD_HEADER.unpack_from(self._map, offset)[1] >= id_length:
+                del free[i]
+                return offset, True
+        needed = self._end + _RECORD_HEADER.size + max(_align(id_length), _MIN_ID_CAPACITY) \
+            + _align(layout.image_size) + _RECORD_HEADER.size
+        if needed > len(self._map):
+            size = len(self._map)
+            while size < needed:
+                size *= 2
+            self._file.truncate(size)
+            self._retired.append(self._map)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        return self._end, False
+
+    def _delete(self, tag_id: str) -> bool:
+        entry = self._index.pop(tag_id, None)
+        if entry is None:
+            return False
+        offset, layout = entry
+        struct.pack_into("<H", self._map, offset, layout.code | _FREE)
+        self._free.setdefault(layout.code, []).append(offset)
+        return True
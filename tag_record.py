@@ -0,0 +1,242 @@
+import sys
+import uuid
+from collections.abc import MutableMapping
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+_DATA_KEYS = ("type", "version", "content")
+_MISSING = object()
+
+
+def _pack_id(tag_id: Any) -> Union[bytes, Any]:
+    """16-byte form of a canonical UUID string, or the value unchanged"""
+    if isinstance(tag_id, str) and len(tag_id) == 36:
+        try:
+            packed = uuid.UUID(tag_id)
+        except ValueError:
+            return tag_id
+        if str(packed) == tag_id:
+            return packed.bytes
+    return tag_id
+
+
+def _unpack_id(packed: Union[bytes, Any]) -> Any:
+    if isinstance(packed, bytes) and len(packed) == 16:
+        return str(uuid.UUID(bytes=packed))
+    return packed
+
+
+def _pack_time(value: Any) -> Any:
+    """Integer microseconds since the epoch for naive ISO timestamps that round-trip exactly"""
+    if isinstance(value, str):
+        try:
+            micros = (datetime.fromisoformat(value) - _EPOCH) // _MICROSECOND
+        except (ValueError, TypeError):
+            return value
+        if _unpack_time(micros) == value:
+            return micros
+    return value
+
+
+def _unpack_time(packed: Any) -> Any:
+    if isinstance(packed, int) and not isinstance(packed, bool):
+        return (_EPOCH + packed * _MICROSECOND).isoformat()
+    return packed
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+class TagRecord(MutableMapping):
+    """Compact, dict-compatible tag record.
+
+    Stores the tag ID as 16 raw UUID bytes, timestamps as integer epoch
+    microseconds and the type/version strings interned, instead of a nested
+    dict of strings.  Values that do not fit these forms (non-UUID IDs,
+    timezone-aware timestamps, extra keys) are kept as they are, so
+    ``to_dict()`` always reproduces the original record.
+
+    ``record["data"]`` returns a fresh dict; assign a whole new ``data``
+    dict to change it.
+    """
+
+    __slots__ = ("_id", "_created", "_modified", "_type", "_version", "_content",
+                 "_data_extra", "_extra")
+
+    def __init__(self):
+        self._id = _MISSING
+        self._created = _MISSING
+        self._modified = _MISSING
+        self._type = _MISSING
+        self._version = _MISSING
+        self._content = _MISSING
+        self._data_extra: Optional[Dict[str, Any]] = None
+        self._extra: Optional[Dict[str, Any]] = None
+
+    @classmethod
+    def from_dict(cls, tag_data: Dict[str, Any]) -> "TagRecord":
+        """Build a record from a plain tag dict"""
+        record = cls()
+        for key, value in tag_data.items():
+            record[key] = value
+        return record
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain nested dict, as stored in nfc_tags.json"""
+        return {key: self[key] for key in self}
+
+    @property
+    def uid_bytes(self) -> Optional[bytes]:
+        """The raw 16-byte UUID of the tag ID, if it is one"""
+        return self._id if isinstance(self._id, bytes) and len(self._id) == 16 else None
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "id":
+            value = _unpack_id(self._id)
+        elif key == "created_at":
+            value = _unpack_time(self._created)
+        elif key == "last_modified":
+            value = _unpack_time(self._modified)
+        elif key == "data":
+            value = self._get_data()
+        else:
+            value = self._extra.get(key, _MISSING) if self._extra else _MISSING
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any):
+        if key == "id":
+            self._id = _pack_id(value)
+        elif key == "created_at":
+            self._created = _pack_time(value)
+        elif key == "last_modified":
+            self._modified = _pack_time(value)
+        elif key == "data":
+            self._set_data(value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        self[key]  # Raises KeyError if absent
+        if key == "id":
+            self._id = _MISSING
+        elif key == "created_at":
+            self._created = _MISSING
+        elif key == "last_modified":
+            self._modified = _MISSING
+        elif key == "data":
+            self._set_data(_MISSING)
+        else:
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+
+    def __iter__(self) -> Iterator[str]:
+        if self._id is not _MISSING:
+            yield "id"
+        if self._created is not _MISSING:
+            yield "created_at"
+        if self._modified is not _MISSING:
+            yield "last_modified"
+        if self._content is not _MISSING or self._type is not _MISSING or self._data_extra is not None:
+            yield "data"
+        if self._extra:
+            yield from list(self._extra)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return f"TagRecord({self.to_dict()!r})"
+
+    def _get_data(self) -> Any:
+        if self._type is _MISSING and self._version is _MISSING and self._data_extra is None:
+            # Non-dict data (or absent) is kept as-is in _content
+            return self._content
+        data = {}
+        if self._type is not _MISSING:
+            data["type"] = self._type
+        if self._version is not _MISSING:
+            data["version"] = self._version
+        if self._content is not _MISSING:
+            data["content"] = self._content
+        if self._data_extra:
+            data.update(self._data_extra)
+        return data
+
+    def _set_data(self, data: Any):
+        self._type = self._version = _MISSING
+        self._data_extra = None
+        if not isinstance(data, dict) or not data or "type" not in data:
+            # Keep anything outside the usual layout untouched
+            self._content = data
+            return
+        self._type = _intern(data["type"])
+        self._version = _intern(data.get("version", _MISSING))
+        self._content = data.get("content", _MISSING)
+        extra = {key: value for key, value in data.items() if key not in _DATA_KEYS}
+        self._data_extra = extra or None
+
+
+def as_dict(tag: Any) -> Dict[str, Any]:
+    """Plain dict for a tag that may be a TagRecord"""
+    return tag.to_dict() if isinstance(tag, TagRecord) else tag
+
+
+def compact(tag: Any) -> Any:
+    """TagRecord for a plain tag dict (records and other values pass through)"""
+    return TagRecord.from_dict(tag) if type(tag) is dict else tag
+
+
+def diff_tags(old: Dict[str, Any], new: Dict[str, Any],
+              path: Tuple[str, ...] = ()) -> Tuple[List[Tuple[Tuple[str, ...], Any]], List[Tuple[str, ...]]]:
+    """Field-level difference between two tag dicts.
+
+    Returns ``(changed, removed)``: ``(path, value)`` pairs for keys that were
+    added or changed and the paths of keys that were removed, where a path is
+    the tuple of keys leading to the field.  Nested dicts are compared key by
+    key rather than replaced whole.
+    """
+    changed: List[Tuple[Tuple[str, ...], Any]] = []
+    removed: List[Tuple[str, ...]] = []
+    for key, value in new.items():
+        if key not in old:
+            changed.append((path + (key,), value))
+            continue
+        current = old[key]
+        if isinstance(value, dict) and isinstance(current, dict):
+            sub_changed, sub_removed = diff_tags(current, value, path + (key,))
+            changed.extend(sub_changed)
+            removed.extend(sub_removed)
+        elif type(value) is not type(current) or value != current:
+            changed.append((path + (key,), value))
+    removed.extend(path + (key,) for key in old if key not in new)
+    return changed, removed
+
+
+def apply_tag_diff(tag: Any, changed: Iterable[Tuple[Sequence[str], Any]],
+                   removed: Iterable[Sequence[str]]) -> Dict[str, Any]:
+    """New tag dict with the changes from ``diff_tags`` applied (the original is not modified)"""
+    result = dict(as_dict(tag))
+    for path, value in changed:
+        _diff_parent(result, path)[path[-1]] = value
+    for path in removed:
+        _diff_parent(result, path).pop(path[-1], None)
+    return result
+
+
+def _diff_parent(result: Dict[str, Any], path: Sequence[str]) -> Dict[str, Any]:
+    """The dict holding the last key of ``path``, copying each nested dict on the way"""
+    node = result
+    for key in path[:-1]:
+        child = node.get(key)
+        child = dict(child) if isinstance(child, dict) else {}
+        node[key] = child
+        node = child
+    return node
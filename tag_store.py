@@ -0,0 +1,551 @@
+import json
+import mmap
+import os
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import metrics
+from tag_record import apply_tag_diff, as_dict, compact
+
+DEFAULT_TAGS_FILE = "nfc_tags.json"
+
+# First line of a snapshot written by TagStore; each following line holds one tag
+_SNAPSHOT_HEADER = b'{"tags": {'
+
+# (tag ID, body offset, body length, last_modified) for each tag in a snapshot
+TagRef = Tuple[str, int, int, Any]
+
+
+def _encode_body(tag_data: dict) -> bytes:
+    return json.dumps(as_dict(tag_data), separators=(",", ":")).encode("utf-8")
+
+
+def _log_line(entry: dict) -> str:
+    return json.dumps(entry, separators=(",", ":")) + "\n"
+
+
+class LazyTags(MutableMapping):
+    """Tag mapping that parses records from a memory-mapped snapshot on demand.
+
+    Tags unchanged since the last compaction are held as ``(offset, length,
+    last_modified)`` references into the snapshot, and reading one parses
+    just that tag's line.  The most recently read records are kept in a small
+    LRU cache.  Tags that are put are held as records until the next
+    compaction turns them back into references.  Tags staged by a bulk import
+    reference a separate staging buffer as ``(offset, length, last_modified,
+    buffer)`` until that compaction.
+
+    Reads take no lock.  The entries, the mapping they point into and the
+    cache are published together as one view, so a reader never resolves a
+    reference against another snapshot's mapping.  Writers (``TagStore``)
+    are expected to be serialized by the caller.
+    """
+
+    def __init__(self, cache_size: int = 256):
+        self.cache_size = cache_size
+        # (entries, mapped snapshot, LRU cache), replaced as a whole on remap
+        self._view: Tuple[Dict[str, Any], Any, "OrderedDict[str, dict]"] = ({}, None, OrderedDict())
+        self._remap = threading.Condition()
+        self._remapping = False
+
+    def map(self, path: str, refs: Optional[Iterable[TagRef]] = None):
+        """Map a snapshot, replacing all entries with ``refs`` into it (or keeping them if None)"""
+        buffer = None
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size:
+                # The mapping keeps its own handle, so the file can be closed
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if refs is None:
+            entries = self._view[0]
+        else:
+            entries = {tag_id: (offset, length, modified) for tag_id, offset, length, modified in refs}
+        with self._remap:
+            self._view = (entries, buffer, OrderedDict())
+            self._remapping = False
+            self._remap.notify_all()
+
+    def unmap(self, remapping: bool = False):
+        """Close the mapped snapshot; with ``remapping``, readers wait for the next ``map``
+
+        The mapping is otherwise released when the last reader using it is
+        done, so only platforms that cannot replace a mapped file need this.
+        """
+        with self._remap:
+            self._remapping = remapping
+            buffer = self._view[1]
+            if buffer is not None:
+                buffer.close()
+
+    def stage(self, refs: Iterable[TagRef], buffer):
+        """Add or replace entries with references into another buffer (kept until the next map)"""
+        entries, _, cache = self._view
+        for tag_id, offset, length, modified in refs:
+            entries[tag_id] = (offset, length, modified, buffer)
+            cache.pop(tag_id, None)
+
+    def raw(self, tag_id: str) -> bytes:
+        """A tag's compact JSON body, copied from the snapshot when unchanged"""
+        entry, body, _ = self._read(tag_id)
+        return _encode_body(entry) if body is None else body
+
+    def modified_of(self, tag_id: str) -> Any:
+        """A tag's last_modified timestamp, without parsing its body"""
+        entry = self._view[0][tag_id]
+        if type(entry) is tuple:
+            return entry[2]
+        return entry.get("last_modified", "")
+
+    def __getitem__(self, tag_id: str) -> dict:
+        view = self._view
+        entry = view[0][tag_id]
+        if type(entry) is not tuple:
+            return entry
+        cache = view[2]
+        record = cache.get(tag_id)
+        if record is not None:
+            try:
+                cache.move_to_end(tag_id)
+            except KeyError:
+                # Evicted by another reader thread in the meantime
+                pass
+            return record
+        entry, body, view = self._read(tag_id)
+        if body is None:
+            return entry
+        record = compact(json.loads(body))
+        cache = view[2]
+        cache[tag_id] = record
+        if len(cache) > self.cache_size:
+            try:
+                cache.popitem(last=False)
+            except KeyError:
+                pass
+        return record
+
+    def _read(self, tag_id: str) -> Tuple[Any, Optional[bytes], tuple]:
+        """A tag's entry, its body if the entry is a reference, and the view both came from"""
+        while True:
+            view = self._view
+            entry = view[0][tag_id]
+            if type(entry) is not tuple:
+                return entry, None, view
+            buffer = entry[3] if len(entry) > 3 else view[1]
+            try:
+                return entry, buffer[entry[0]:entry[0] + entry[1]], view
+            except (ValueError, TypeError):
+                # The mapping was closed by a compaction; retry with the new view
+                with self._remap:
+                    while self._view is view and self._remapping:
+                        self._remap.wait()
+                    if self._view is view:
+                        raise
+
+    def __setitem__(self, tag_id: str, tag_data: dict):
+        entries, _, cache = self._view
+        entries[tag_id] = tag_data
+        cache.pop(tag_id, None)
+
+    def __delitem__(self, tag_id: str):
+        entries, _, cache = self._view
+        del entries[tag_id]
+        cache.pop(tag_id, None)
+
+    def __contains__(self, tag_id: object) -> bool:
+        return tag_id in self._view[0]
+
+    def __iter__(self) -> Iterator[str]:
+        # Iterate over a copy of the IDs so writers can add and delete meanwhile
+        return iter(list(self._view[0]))
+
+    def __len__(self) -> int:
+        return len(self._view[0])
+
+    def clear(self):
+        self._view = ({}, self._view[1], OrderedDict())
+
+
+class TagStore:
+    """Tag storage backed by a JSON snapshot plus an append-only change log.
+
+    The snapshot keeps the original ``nfc_tags.json`` layout (``{"tags": {...}}``),
+    so existing files load unchanged.  Every create/update/delete is appended as a
+    single JSON line to ``<snapshot>.log`` (edits made with ``patch`` log only
+    the changed fields) and the log is folded back into the
+    snapshot once it grows past ``compact_threshold`` entries.
+
+    Tags are held in memory as compact ``TagRecord`` objects, which behave
+    like the original dicts.
+
+    With ``lazy=True`` the snapshot is memory-mapped instead and ``tags`` is a
+    ``LazyTags`` mapping that parses each tag when it is first read.  The tag
+    IDs, modification times and body offsets come from a sidecar index
+    (``<snapshot>.idx``) written at each compaction, so loading does not parse
+    any tag bodies.  A missing or stale index is rebuilt from the snapshot.
+
+    The store is safe to share between threads.  Writers are serialized by
+    one lock; readers of ``tags`` take none.  Records are never changed in
+    place: a write stores a new record, so a reader sees either the old
+    version or the new one.  Writers that arrive while another is waiting
+    for ``fsync`` share the next one, so concurrent writes cost one disk
+    flush per batch instead of one each.
+    """
+
+    def __init__(self, path: str = DEFAULT_TAGS_FILE, compact_threshold: int = 1000,
+                 fsync: bool = True, lazy: bool = False):
+        self.path = path
+        self.log_path = path + ".log"
+        self.index_path = path + ".idx"
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.lazy = lazy
+        self.tags: Dict[str, dict] = LazyTags() if lazy else {}
+        self._log_file = None
+        self._log_entries = 0
+        self._lock = threading.RLock()
+        # Log entries written, and written entries known to be on disk
+        self._written = 0
+        self._synced = 0
+        self._sync_lock = threading.Lock()
+
+    def load_tags(self) -> Dict[str, dict]:
+        """Load the snapshot and replay the change log on top of it"""
+        with self._lock:
+            return self._load_tags()
+
+    def _load_tags(self) -> Dict[str, dict]:
+        self._close_log()
+        rewrite = False
+        if self.lazy:
+            tags = self.tags
+            rewrite = self._map_snapshot()
+        else:
+            tags = self._read_snapshot()
+
+        entries = 0
+        if os.path.exists(self.log_path):
+            valid_end = 0
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A torn final line from a crash mid-append; everything
+                        # before it is intact, so stop replaying here.
+                        break
+                    self._apply(tags, entry)
+                    entries += 1
+                    valid_end += len(line)
+            if valid_end != os.path.getsize(self.log_path):
+                # Drop the torn tail so new appends start on a clean line
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(valid_end)
+
+        if tags is not self.tags:
+            # Keep the same dict object so callers holding a reference stay in sync
+            self.tags.clear()
+            self.tags.update(tags)
+        self._log_entries = entries
+        if rewrite or entries >= self.compact_threshold:
+            self.compact()
+        return self.tags
+
+    def put(self, tag_id: str, tag_data: dict):
+        """Create or replace a tag"""
+        record = compact(tag_data)
+        line = _log_line({"op": "put", "id": tag_id, "tag": as_dict(tag_data)})
+        with self._lock:
+            self.tags[tag_id] = record
+            written = self._append(line)
+        self._sync(written)
+
+    def patch(self, tag_id: str, changed: List[Tuple[Tuple[str, ...], Any]],
+              removed: List[Tuple[str, ...]]) -> dict:
+        """Apply a field-level change (see ``tag_record.diff_tags``), logging only the changed fields"""
+        line = _log_line({"op": "patch", "id": tag_id,
+                          "set": [[list(path), value] for path, value in changed],
+                          "unset": [list(path) for path in removed]})
+        with self._lock:
+            tag = compact(apply_tag_diff(self.tags[tag_id], changed, removed))
+            self.tags[tag_id] = tag
+            written = self._append(line)
+        self._sync(written)
+        return tag
+
+    def delete(self, tag_id: str):
+        """Delete a tag"""
+        line = _log_line({"op": "del", "id": tag_id})
+        with self._lock:
+            self.tags.pop(tag_id, None)
+            written = self._append(line)
+        self._sync(written)
+
+    def compact(self):
+        """Fold the change log into a fresh snapshot"""
+        with self._lock:
+            started = time.perf_counter() if metrics.ENABLED else 0.0
+            tmp_path = self.path + ".tmp"
+            refs = self._write_tags(tmp_path, self.tags)
+            if self.lazy and os.name == "nt":
+                # Windows cannot replace a file that is still mapped; readers
+                # of unchanged tags wait until the new snapshot is mapped
+                self.tags.unmap(remapping=True)
+            replaced = False
+            try:
+                os.replace(tmp_path, self.path)
+                replaced = True
+            finally:
+                if self.lazy and (replaced or os.path.exists(self.path)):
+                    self.tags.map(self.path, refs if replaced else None)
+            if self.lazy:
+                self._write_index(refs)
+            # Replaying put/del is idempotent, so a crash between the snapshot
+            # rename and this truncation only costs a redundant replay.  The
+            # log stays open so a writer still waiting to fsync it is unaffected.
+            if self._log_file is not None:
+                self._log_file.seek(0)
+                self._log_file.truncate()
+            else:
+                with open(self.log_path, "w"):
+                    pass
+            self._log_entries = 0
+            # Everything written so far is now in the synced snapshot
+            self._synced = self._written
+            if metrics.ENABLED:
+                metrics.STORE_WRITE_SECONDS.observe(time.perf_counter() - started, "compact")
+
+    def put_many(self, items: Iterable[Tuple[str, dict]]) -> int:
+        """Create or replace many tags with a single snapshot write, returning how many were put
+
+        Nothing is logged per tag and nothing changes until ``items`` is
+        exhausted, so an error while producing them leaves the store as it
+        was.  In lazy mode the encoded records are streamed to a staging file
+        (``<snapshot>.import``) and only their references are kept in memory.
+        """
+        if not self.lazy:
+            staged = {tag_id: compact(tag_data) for tag_id, tag_data in items}
+            with self._lock:
+                self.tags.update(staged)
+                self.compact()
+            return len(staged)
+
+        staging_path = self.path + ".import"
+        refs = []
+        try:
+            with open(staging_path, "w+b") as f:
+                offset = 0
+                for tag_id, tag_data in items:
+                    body = _encode_body(tag_data)
+                    f.write(body)
+                    refs.append((tag_id, offset, len(body), tag_data.get("last_modified", "")))
+                    offset += len(body)
+                f.flush()
+                if refs:
+                    buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    try:
+                        with self._lock:
+                            self.tags.stage(refs, buffer)
+                            try:
+                                # Compaction copies the staged bodies into the new
+                                # snapshot and points every entry there
+                                self.compact()
+                            except BaseException:
+                                # Drop references into the staging buffer; the
+                                # files on disk still hold a consistent store
+                                self._load_tags()
+                                raise
+                    finally:
+                        buffer.close()
+        finally:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+        return len(refs)
+
+    def import_json(self, path: str):
+        """Import tags from a file in the ``nfc_tags.json`` format"""
+        with open(path, "r") as f:
+            imported = json.load(f).get("tags", {})
+        with self._lock:
+            for tag_id, tag_data in imported.items():
+                self.tags[tag_id] = compact(tag_data)
+            self.compact()
+
+    def export_json(self, path: str):
+        """Export all tags to a file in the ``nfc_tags.json`` format"""
+        tmp_path = path + ".tmp"
+        with self._lock:
+            self._write_tags(tmp_path, self.tags)
+        os.replace(tmp_path, path)
+
+    def close(self):
+        """Compact pending changes and release the log and snapshot files"""
+        with self._lock:
+            if self._log_entries:
+                self.compact()
+            self._close_log()
+            if self.lazy:
+                self.tags.unmap()
+
+    def _read_snapshot(self) -> Dict[str, dict]:
+        tags = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                tags = json.load(f).get("tags", {})
+            for tag_id, tag_data in tags.items():
+                tags[tag_id] = compact(tag_data)
+        return tags
+
+    def _map_snapshot(self) -> bool:
+        """Reference the snapshot's tags lazily, returning True if it must be rewritten first"""
+        self.tags.unmap()
+        self.tags.clear()
+        if not os.path.exists(self.path):
+            return False
+        refs = self._read_index()
+        if refs is None:
+            refs = self._scan_snapshot()
+            if refs is None:
+                # Not in the one-tag-per-line layout (e.g. written by an older
+                # version), so load it fully once and let compaction rewrite it
+                self.tags.update(self._read_snapshot())
+                return True
+            self._write_index(refs)
+        self.tags.map(self.path, refs)
+        return False
+
+    def _read_index(self) -> Optional[List[TagRef]]:
+        """Tag references from the sidecar index, or None if it is missing or stale"""
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            stat = os.stat(self.path)
+            if (index["snapshot_size"], index["snapshot_mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                return None
+            return list(zip(index["ids"], index["offsets"], index["lengths"], index["modified"]))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_index(self, refs: List[TagRef]):
+        stat = os.stat(self.path)
+        index = {
+            "snapshot_size": stat.st_size,
+            "snapshot_mtime_ns": stat.st_mtime_ns,
+            "ids": [ref[0] for ref in refs],
+            "offsets": [ref[1] for ref in refs],
+            "lengths": [ref[2] for ref in refs],
+            "modified": [ref[3] for ref in refs],
+        }
+        # The index can always be rebuilt from the snapshot, so it is not fsynced
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp_path, self.index_path)
+
+    def _scan_snapshot(self) -> Optional[List[TagRef]]:
+        """Tag references for a snapshot in the one-tag-per-line layout, or None"""
+        decoder = json.JSONDecoder()
+        refs = []
+        with open(self.path, "rb") as f:
+            header = f.readline()
+            if header.rstrip(b"\r\n") != _SNAPSHOT_HEADER:
+                return None
+            offset = len(header)
+            for line in f:
+                if line.startswith(b"}"):
+                    break
+                body_end = len(line.rstrip(b"\r\n,"))
+                try:
+                    text = line.decode("utf-8")
+                    tag_id, key_end = decoder.raw_decode(text)
+                    body_start = len(text[:key_end].encode("utf-8")) + 2
+                    if line[body_start - 2:body_start] != b": ":
+                        return None
+                    modified = json.loads(line[body_start:body_end]).get("last_modified", "")
+                except (ValueError, AttributeError):
+                    return None
+                refs.append((tag_id, offset + body_start, body_end - body_start, modified))
+                offset += len(line)
+        return refs
+
+    @staticmethod
+    def _apply(tags: Dict[str, dict], entry: dict):
+        if entry.get("op") == "put":
+            tags[entry["id"]] = compact(entry["tag"])
+        elif entry.get("op") == "patch":
+            if entry["id"] in tags:
+                tags[entry["id"]] = compact(apply_tag_diff(tags[entry["id"]], entry["set"], entry["unset"]))
+        elif entry.get("op") == "del":
+            tags.pop(entry["id"], None)
+
+    def _append(self, line: str) -> int:
+        """Write a log line (with the lock held) and return its sequence number for ``_sync``"""
+        started = time.perf_counter() if metrics.ENABLED else 0.0
+        if self._log_file is None:
+            self._log_file = open(self.log_path, "a")
+        self._log_file.write(line)
+        self._log_file.flush()
+        self._log_entries += 1
+        self._written += 1
+        if metrics.ENABLED:
+            metrics.STORE_WRITE_SECONDS.observe(time.perf_counter() - started, "append")
+        if self._log_entries >= self.compact_threshold:
+            self.compact()
+        return self._written
+
+    def _sync(self, written: int):
+        """Wait until log entries up to ``written`` are on disk (called without the lock)"""
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced >= written:
+                # Covered by another writer's fsync or by a compaction
+                return
+            started = time.perf_counter() if metrics.ENABLED else 0.0
+            # Every entry written before this point is flushed to the OS, so
+            # this fsync covers all of them
+            target = self._written
+            log_file = self._log_file
+            try:
+                os.fsync(log_file.fileno())
+            except (AttributeError, ValueError, OSError):
+                # The log was closed meanwhile, which is only safe if a
+                # compaction already put these entries in the synced snapshot
+                if self._synced < written:
+                    raise
+            self._synced = max(self._synced, target)
+            if metrics.ENABLED:
+                metrics.STORE_WRITE_SECONDS.observe(time.perf_counter() - started, "fsync")
+
+    def _close_log(self):
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+
+    def _write_tags(self, path: str, tags: Dict[str, dict]) -> List[TagRef]:
+        """Write tags in the snapshot layout, returning where each body landed"""
+        if isinstance(tags, LazyTags):
+            # Unchanged tags are copied straight from the mapped snapshot
+            items = ((tag_id, tags.raw(tag_id), tags.modified_of(tag_id)) for tag_id in tags)
+        else:
+            items = ((tag_id, _encode_body(tag), tag.get("last_modified", "")) for tag_id, tag in tags.items())
+        refs = []
+        with open(path, "wb") as f:
+            # Stream one tag per line rather than building the whole document
+            # in memory; the result is still a single {"tags": {...}} object
+            f.write(_SNAPSHOT_HEADER)
+            offset = len(_SNAPSHOT_HEADER)
+            separator = b"\n"
+            for tag_id, body, modified in items:
+                prefix = separator + json.dumps(tag_id).encode("utf-8") + b": "
+                f.write(prefix)
+                f.write(body)
+                refs.append((tag_id, offset + len(prefix), len(body), modified))
+                offset += len(prefix) + len(body)
+                separator = b",\n"
+            f.write(b"\n}}\n")
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        return refs
@@ -3,20 +3,71 @@ import serial.tools.list_ports
 import threading
 import queue
 import time
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Union
+
+import metrics
+
+# Write coalescing defaults: how long a frame may wait for others to join its
+# write, and how many bytes are written at most before senders write themselves
+DEFAULT_MAX_LATENCY = 0.002
+DEFAULT_MAX_BATCH = 16 * 1024
+# How often a coalesced write polls CTS while the host holds it off
+CTS_POLL_INTERVAL = 0.001
 
 class VirtualCOMPort:
-    def __init__(self, port: str = None, baudrate: int = 115200):
+    """A serial port that sends tag payloads as lines and frames received data into lines.
+
+    By default every ``send_data`` call is one write followed by a drain.
+    With ``coalesce`` frames are appended to a buffer instead and a writer
+    thread sends everything queued in one write, at most ``max_latency``
+    seconds after the first frame was queued.  A sender that finds
+    ``max_batch`` bytes queued writes the batch itself, so a slow port holds
+    back its senders rather than buffering without bound.  ``flush`` writes
+    the queued frames and waits until they have left.
+
+    ``rtscts`` enables hardware flow control; coalesced writes then wait for
+    CTS (up to the write timeout) and keep collecting frames meanwhile.
+    """
+
+    def __init__(self, port: str = None, baudrate: int = 115200, coalesce: bool = False,
+                 max_latency: float = DEFAULT_MAX_LATENCY, max_batch: int = DEFAULT_MAX_BATCH,
+                 rtscts: bool = False):
         self.port = port
         self.baudrate = baudrate
+        self.coalesce = coalesce
+        self.max_latency = max_latency
+        self.max_batch = max_batch
+        self.rtscts = rtscts
         self.serial_connection = None
         self.running = False
         self.data_queue = queue.Queue()
         self.read_thread = None
+        self.write_thread = None
         self.callback = None
+        self._rx_buffer = bytearray()
+        self._tx_buffer = bytearray()
+        self._tx_frames = 0
+        self._tx_since = 0.0
+        self._tx_ready = threading.Condition()
+        # Held while a batch is taken from the buffer and written, so batches go out in order
+        self._tx_write_lock = threading.Lock()
+        
+        # Traffic counters
+        self.bytes_sent = 0
+        self.lines_sent = 0
+        self.writes = 0
+        self.bytes_received = 0
+        self.lines_received = 0
+        self.send_failures = 0
         
-    def start(self, port: str = None) -> bool:
-        """Start the virtual COM port"""
+    def start(self, port: str = None, start_reader: bool = True) -> bool:
+        """Start the virtual COM port
+        
+        Args:
+            port: Serial device to open (defaults to the one given at construction)
+            start_reader: Start a dedicated read thread. Pass False when an
+                external I/O loop (e.g. PortManager) feeds process_incoming().
+        """
         if port:
             self.port = port
             
@@ -24,71 +75,225 @@ class VirtualCOMPort:
             return False
             
         try:
-            self.serial_connection = serial.Serial(
+            connection = serial.Serial(
                 port=self.port,
                 baudrate=self.baudrate,
                 bytesize=serial.EIGHTBITS,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
                 timeout=1,
-                write_timeout=1
+                write_timeout=1,
+                rtscts=self.rtscts
             )
-            self.running = True
-            self.read_thread = threading.Thread(target=self._read_loop, daemon=True)
-            self.read_thread.start()
-            return True
         except Exception as e:
             print(f"Failed to open serial port {self.port}: {e}")
             return False
+        self.start_with(connection, start_reader)
+        return True
+    
+    def start_with(self, connection, start_reader: bool = True):
+        """Start on an already open connection with the serial.Serial interface (e.g. a pty_readers.PtyMaster)"""
+        self.serial_connection = connection
+        self.running = True
+        self._rx_buffer = bytearray()
+        self._tx_buffer = bytearray()
+        self._tx_frames = 0
+        if self.coalesce:
+            self.write_thread = threading.Thread(target=self._write_loop, daemon=True)
+            self.write_thread.start()
+        if start_reader:
+            self.read_thread = threading.Thread(target=self._read_loop, daemon=True)
+            self.read_thread.start()
     
     def stop(self):
-        """Stop the virtual COM port"""
+        """Stop the virtual COM port, sending any coalesced frames still queued"""
+        if self.write_thread and self.write_thread.is_alive():
+            with self._tx_ready:
+                self.running = False
+                self._tx_ready.notify()
+            # The writer sends what is left before it exits
+            self.write_thread.join(timeout=2.0)
         self.running = False
+        if self.serial_connection and self.serial_connection.is_open:
+            try:
+                # Wake the reader out of its blocking read
+                self.serial_connection.cancel_read()
+            except Exception:
+                pass
         if self.read_thread and self.read_thread.is_alive():
             self.read_thread.join(timeout=1.0)
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
     
-    def send_data(self, data: str) -> bool:
-        """Send data through the COM port"""
+    def send_data(self, data: Union[str, bytes]) -> bool:
+        """Send data through the COM port
+        
+        Text is sent as a newline-terminated line; bytes (binary frames) are
+        written verbatim.  When coalescing, True means the frame was queued;
+        a batch that later fails to write counts its frames as send failures.
+        """
         if not self.serial_connection or not self.serial_connection.is_open:
             return False
             
+        started = time.perf_counter() if metrics.ENABLED else 0.0
+        if self.coalesce:
+            sent = self._enqueue(data)
+        else:
+            if isinstance(data, str):
+                payload = data.encode('utf-8')
+                # Add newline to make it easier to read on the receiving end
+                if not payload.endswith(b'\n'):
+                    payload += b'\n'
+            else:
+                payload = data
+            sent = self._write(payload, 1, drain=True)
+        if sent and metrics.ENABLED:
+            metrics.SEND_SECONDS.observe(time.perf_counter() - started, self.port)
+        return sent
+    
+    def flush(self) -> bool:
+        """Write every queued frame now and wait until the OS has sent it"""
+        if not self.serial_connection or not self.serial_connection.is_open:
+            return False
+        return self._write_pending(drain=True)
+    
+    @property
+    def pending(self) -> int:
+        """Bytes queued for the next coalesced write"""
+        return len(self._tx_buffer)
+    
+    def _enqueue(self, data: Union[str, bytes]) -> bool:
+        with self._tx_ready:
+            if not self.running:
+                # The writer has stopped, so a queued frame would never be sent
+                return False
+            buffer = self._tx_buffer
+            if not buffer:
+                self._tx_since = time.perf_counter()
+                self._tx_ready.notify()
+            if isinstance(data, str):
+                buffer += data.encode('utf-8')
+                if buffer[-1:] != b'\n':
+                    buffer.append(10)
+            else:
+                buffer += data
+            self._tx_frames += 1
+            full = len(buffer) >= self.max_batch
+        # Write a full batch on the sender's thread rather than let the buffer grow
+        return self._write_pending() if full else True
+    
+    def _write_loop(self):
+        """Background thread writing coalesced frames"""
+        while True:
+            with self._tx_ready:
+                while not self._tx_buffer and self.running:
+                    self._tx_ready.wait()
+                if not self._tx_buffer:
+                    return
+                # Let more frames join until the oldest has waited max_latency
+                deadline = self._tx_since + self.max_latency
+                while self.running and len(self._tx_buffer) < self.max_batch:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._tx_ready.wait(remaining)
+            self._write_pending()
+    
+    def _write_pending(self, drain: bool = False) -> bool:
+        """Take the queued frames and write them as one batch"""
+        with self._tx_write_lock:
+            with self._tx_ready:
+                batch, frames = self._tx_buffer, self._tx_frames
+                if batch:
+                    self._tx_buffer = bytearray()
+                    self._tx_frames = 0
+            if frames and metrics.ENABLED:
+                metrics.SERIAL_BATCH_FRAMES.observe(frames, self.port)
+            return self._write(batch, frames, drain)
+    
+    def _write(self, payload: Union[bytes, bytearray], frames: int, drain: bool) -> bool:
         try:
-            # Add newline to make it easier to read on the receiving end
-            if not data.endswith('\n'):
-                data += '\n'
-                
-            self.serial_connection.write(data.encode('utf-8'))
-            self.serial_connection.flush()
+            if payload:
+                if self.rtscts and self.coalesce:
+                    self._wait_for_cts()
+                self.serial_connection.write(payload)
+            if drain:
+                self.serial_connection.flush()
+            self.bytes_sent += len(payload)
+            self.lines_sent += frames
+            if payload:
+                self.writes += 1
+            if metrics.ENABLED:
+                metrics.BYTES_WRITTEN.inc(len(payload), self.port)
             return True
         except Exception as e:
+            self.send_failures += frames
+            if metrics.ENABLED:
+                metrics.SEND_FAILURES.inc(frames, self.port)
             print(f"Failed to send data: {e}")
             return False
     
+    def _wait_for_cts(self):
+        # Frames keep queueing while the host holds CTS low, so they go out in one write once it clears
+        deadline = time.perf_counter() + self.serial_connection.write_timeout
+        while not self.serial_connection.cts:
+            if time.perf_counter() >= deadline:
+                raise serial.SerialTimeoutException("CTS not asserted")
+            time.sleep(CTS_POLL_INTERVAL)
+    
     def set_callback(self, callback):
         """Set a callback function to be called when data is received"""
         self.callback = callback
     
+    def fileno(self) -> int:
+        """File descriptor of the open serial device (POSIX only)"""
+        return self.serial_connection.fileno()
+    
+    def read_available(self) -> int:
+        """Read whatever is waiting without blocking and process it; returns bytes read"""
+        waiting = self.serial_connection.in_waiting
+        if not waiting:
+            return 0
+        data = self.serial_connection.read(waiting)
+        self.process_incoming(data)
+        return len(data)
+    
+    def process_incoming(self, data: bytes):
+        """Append received bytes to the framing buffer and dispatch complete lines"""
+        self.bytes_received += len(data)
+        buffer = self._rx_buffer
+        buffer += data
+        
+        # Process all complete lines in one pass
+        end = buffer.rfind(b'\n')
+        if end < 0:
+            return
+        lines = bytes(buffer[:end]).split(b'\n')
+        del buffer[:end + 1]
+        self.lines_received += len(lines)
+        if metrics.ENABLED:
+            metrics.LINES_READ.inc(len(lines), self.port)
+        if self.callback:
+            for line in lines:
+                self.callback(line.decode('utf-8', errors='ignore').strip())
+    
     def _read_loop(self):
         """Background thread for reading data from the serial port"""
-        buffer = ""
         while self.running and self.serial_connection and self.serial_connection.is_open:
             try:
-                # Read available data
-                if self.serial_connection.in_waiting > 0:
-                    data = self.serial_connection.read(self.serial_connection.in_waiting).decode('utf-8', errors='ignore')
-                    buffer += data
-                    
-                    # Process complete lines
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        if self.callback:
-                            self.callback(line.strip())
-                            
-                time.sleep(0.01)  # Small delay to prevent high CPU usage
+                # Block until at least one byte arrives (or the read timeout
+                # expires), then take whatever else is already waiting
+                data = self.serial_connection.read(1)
+                if not data:
+                    continue
+                waiting = self.serial_connection.in_waiting
+                if waiting:
+                    data += self.serial_connection.read(waiting)
+                self.process_incoming(data)
                 
             except Exception as e:
+                if not self.running:
+                    break
                 print(f"Error in read loop: {e}")
                 time.sleep(1)  # Wait before retrying
     
@@ -106,19 +311,24 @@ class VirtualCOMPort:
 # Global instance
 virtual_port = VirtualCOMPort()
 
-def start_virtual_port(port: str = None, baudrate: int = 115200) -> bool:
+def start_virtual_port(port: str = None, baudrate: int = 115200, coalesce: bool = False) -> bool:
     """Start the virtual COM port"""
     virtual_port.baudrate = baudrate
+    virtual_port.coalesce = coalesce
     return virtual_port.start(port)
 
 def stop_virtual_port():
     """Stop the virtual COM port"""
     virtual_port.stop()
 
-def send_serial_data(data: str) -> bool:
+def send_serial_data(data: Union[str, bytes]) -> bool:
     """Send data through the virtual COM port"""
     return virtual_port.send_data(data)
 
+def flush_serial_data() -> bool:
+    """Write any coalesced data still queued on the virtual COM port"""
+    return virtual_port.flush()
+
 def set_serial_callback(callback):
     """Set a callback function for received data"""
     virtual_port.set_callback(callback)
@@ -9,6 +9,7 @@ class VirtualInputDevice:
         self.is_active = False
         self._stop_event = threading.Event()
         self._current_window = None
+        self.wedge = None  # Optional KeyboardWedge used instead of the clipboard
         
         # Configure pyautogui
         pyautogui.FAILSAFE = False
@@ -40,6 +41,15 @@ class VirtualInputDevice:
         if not self.is_active:
             return
             
+        if self.wedge is not None:
+            # Direct keystroke injection, no clipboard round-trip
+            try:
+                return self.wedge.send_scan(data)
+            except (OSError, ValueError) as e:
+                # A character the wedge cannot type, or a full uinput queue
+                print(f"Failed to send data: {e}")
+                return False
+            
         try:
             # Convert data to string
             data_str = str(data)
@@ -84,6 +94,10 @@ def stop_virtual_input():
     """Stop the virtual input device"""
     virtual_input.stop()
 
+def set_keyboard_wedge(wedge):
+    """Type scans through a KeyboardWedge instead of the clipboard (None to restore)"""
+    virtual_input.wedge = wedge
+
 def send_nfc_data(data):
     """
     Send NFC data through the virtual input device